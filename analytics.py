@@ -0,0 +1,394 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from rollups import ADHERENCE_TOLERANCE
+from tracking_store import TABLES
+from utils import DATA_DIR
+
+MANIFEST_VERSION = 2
+CSV_NAME = re.compile(r"^(weight|calories|notes)_(.+)\.csv$")
+
+WEIGHT_COLUMNS = [
+    "weight_entries", "weight_first_date", "weight_last_date", "start_weight",
+    "latest_weight", "weight_change_kg", "weight_slope_kg_per_week",
+]
+CALORIE_COLUMNS = [
+    "calorie_entries", "calorie_days", "calorie_last_date", "mean_target_cal",
+    "mean_actual_cal", "adherence_rate", "longest_streak_days", "last_streak_days",
+    "current_streak_days", "on_target_streak_days",
+]
+NOTE_COLUMNS = ["note_entries", "note_days", "mean_note_chars"]
+USER_COLUMNS = ["username", *WEIGHT_COLUMNS, *CALORIE_COLUMNS, *NOTE_COLUMNS]
+COUNT_COLUMNS = [
+    "weight_entries", "calorie_entries", "calorie_days", "longest_streak_days",
+    "last_streak_days", "current_streak_days", "on_target_streak_days", "note_entries", "note_days",
+]
+
+
+# ------------- PER-USER METRICS -------------
+
+def _days(dates: pd.Series) -> np.ndarray:
+    """Day numbers (days since 1970-01-01) for ISO dates; unparseable dates are NaT."""
+    return pd.to_datetime(dates, errors="coerce", format="ISO8601").to_numpy("datetime64[D]")
+
+
+def _iso(day) -> str:
+    return str(np.datetime64(int(day), "D"))
+
+
+def _runs(days: np.ndarray) -> tuple:
+    """(longest, last) run of consecutive values in sorted unique day numbers."""
+    if len(days) == 0:
+        return 0, 0
+    breaks = np.flatnonzero(np.diff(days) != 1) + 1
+    lengths = np.diff(np.concatenate([[0], breaks, [len(days)]]))
+    return int(lengths.max()), int(lengths[-1])
+
+
+def weight_metrics(df: pd.DataFrame) -> dict:
+    """Entry count, first/latest weight and the least-squares trend in kg per week."""
+    days = _days(df["date"])
+    weight = pd.to_numeric(df["weight"], errors="coerce").to_numpy(dtype=np.float64)
+    ok = ~np.isnat(days) & np.isfinite(weight)
+    days, weight = days[ok].astype(np.int64), weight[ok]
+    if len(days) == 0:
+        return {"weight_entries": 0}
+    order = np.argsort(days, kind="stable")
+    days, weight = days[order], weight[order]
+
+    slope = float("nan")
+    x = days - days.mean()
+    if x.any():
+        slope = float((x * (weight - weight.mean())).sum() / (x * x).sum()) * 7
+    return {
+        "weight_entries": int(len(days)),
+        "weight_first_date": _iso(days[0]),
+        "weight_last_date": _iso(days[-1]),
+        "start_weight": float(weight[0]),
+        "latest_weight": float(weight[-1]),
+        "weight_change_kg": round(float(weight[-1] - weight[0]), 3),
+        "weight_slope_kg_per_week": round(slope, 4),
+    }
+
+
+def calorie_metrics(df: pd.DataFrame) -> dict:
+    """Adherence and logging streaks.
+
+    An entry is on target when actual is within ADHERENCE_TOLERANCE of
+    target (as in the rollups); a day is on target when all its entries are.
+    Streaks count consecutive calendar days with at least one entry;
+    last_streak_days is the one ending on calorie_last_date, however long
+    ago that was (user_report decides whether it is still current).
+    """
+    days = _days(df["date"])
+    target = pd.to_numeric(df["target_cal"], errors="coerce").to_numpy(dtype=np.float64)
+    actual = pd.to_numeric(df["actual_cal"], errors="coerce").to_numpy(dtype=np.float64)
+    ok = ~np.isnat(days) & np.isfinite(target) & np.isfinite(actual)
+    days, target, actual = days[ok].astype(np.int64), target[ok], actual[ok]
+    if len(days) == 0:
+        return {"calorie_entries": 0}
+
+    on = (target > 0) & (np.abs(actual - target) <= ADHERENCE_TOLERANCE * target)
+    logged, inverse = np.unique(days, return_inverse=True)
+    day_on = np.bincount(inverse, weights=~on, minlength=len(logged)) == 0
+    longest, last = _runs(logged)
+    return {
+        "calorie_entries": int(len(days)),
+        "calorie_days": int(len(logged)),
+        "calorie_last_date": _iso(logged[-1]),
+        "mean_target_cal": round(float(target.mean()), 1),
+        "mean_actual_cal": round(float(actual.mean()), 1),
+        "adherence_rate": round(float(on.mean()), 4),
+        "longest_streak_days": longest,
+        "last_streak_days": last,
+        "on_target_streak_days": _runs(logged[day_on])[0],
+    }
+
+
+def note_metrics(df: pd.DataFrame) -> dict:
+    notes = df["note"].astype("string").fillna("")
+    return {
+        "note_entries": int(len(notes)),
+        "note_days": int(df["date"].nunique()),
+        "mean_note_chars": round(float(notes.str.len().mean()), 1) if len(notes) else float("nan"),
+    }
+
+
+METRICS = {"weight": weight_metrics, "calories": calorie_metrics, "notes": note_metrics}
+
+
+# ------------- SOURCES -------------
+
+def _connect_ro(db_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def discover(data_dir: str = DATA_DIR) -> dict:
+    """Every (kind, user) history in data_dir, keyed by source.
+
+    Users in tracking.db are read from there; a {kind}_{user}.csv file is
+    only used when tracking.db has no rows for it and has not imported it.
+    Each source has a cheap change signature: row count and last row id for
+    tracking.db, mtime and size for CSV files.
+    """
+    sources = {}
+    migrated = set()
+    db_path = os.path.join(data_dir, "tracking.db")
+    if os.path.exists(db_path):
+        conn = _connect_ro(db_path)
+        try:
+            migrated = set(conn.execute("SELECT kind, username FROM migrated_csv"))
+            for kind in TABLES:
+                rows = conn.execute(
+                    f"SELECT username, COUNT(*), MAX(id) FROM {kind} GROUP BY username"
+                )
+                for username, n, last_id in rows:
+                    sources[f"db:{kind}:{username}"] = {
+                        "type": "db", "kind": kind, "username": username,
+                        "path": db_path, "signature": [n, last_id],
+                    }
+        finally:
+            conn.close()
+
+    if os.path.isdir(data_dir):
+        for fname in sorted(os.listdir(data_dir)):
+            match = CSV_NAME.match(fname)
+            if not match:
+                continue
+            kind, username = match.groups()
+            if (kind, username) in migrated or f"db:{kind}:{username}" in sources:
+                continue
+            path = os.path.join(data_dir, fname)
+            st = os.stat(path)
+            sources[f"csv:{fname}"] = {
+                "type": "csv", "kind": kind, "username": username,
+                "path": path, "signature": [st.st_mtime_ns, st.st_size],
+            }
+    return sources
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# One read-only connection per worker process and database
+_DB = {}
+
+
+def _read_source(source: dict) -> pd.DataFrame:
+    kind, cols = source["kind"], TABLES[source["kind"]]
+    if source["type"] == "csv":
+        return pd.read_csv(source["path"]).reindex(columns=cols)
+    conn = _DB.get(source["path"])
+    if conn is None:
+        conn = _DB[source["path"]] = _connect_ro(source["path"])
+    cur = conn.execute(
+        f"SELECT {', '.join(cols)} FROM {kind} WHERE username = ? ORDER BY id",
+        (source["username"],),
+    )
+    return pd.DataFrame(cur.fetchall(), columns=cols)
+
+
+def _compute(source: dict) -> dict:
+    """Worker task: metrics for one source.
+
+    CSV files whose content hash matches the manifest (touched but not
+    changed) come back with metrics None and are not parsed.
+    """
+    if source["type"] == "csv":
+        digest = _file_hash(source["path"])
+        if digest == source.get("hash"):
+            return {**source, "metrics": None}
+        source = {**source, "hash": digest}
+    return {**source, "metrics": METRICS[source["kind"]](_read_source(source))}
+
+
+def _map(fn, tasks: list, jobs: int) -> list:
+    if jobs <= 1 or len(tasks) <= 1:
+        return [fn(task) for task in tasks]
+    # A few chunks per worker keeps them all busy without one IPC round trip per file
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(fn, tasks, chunksize=chunksize))
+
+
+# ------------- REPORT -------------
+
+def user_report(entries, as_of: date = None) -> pd.DataFrame:
+    """One row per user with USER_COLUMNS, from per-source manifest entries.
+
+    current_streak_days is the last streak if it reaches as_of (default
+    today) or the day before, so today's entry may still be to come; 0 otherwise.
+    """
+    users = {}
+    for entry in entries:
+        users.setdefault(entry["username"], {"username": entry["username"]}).update(entry["metrics"])
+    df = pd.DataFrame(list(users.values())).reindex(columns=USER_COLUMNS)
+    df[COUNT_COLUMNS] = df[COUNT_COLUMNS].fillna(0).astype(np.int64)
+    last_day = _days(df["calorie_last_date"])
+    recent = ~np.isnat(last_day) & (last_day >= np.datetime64(as_of or date.today(), "D") - 1)
+    df["current_streak_days"] = np.where(recent, df["last_streak_days"], 0)
+    return df.sort_values("username", ignore_index=True)
+
+
+def cohort_metrics(users: pd.DataFrame) -> dict:
+    """Cross-user summary of a user_report frame."""
+    slope = users["weight_slope_kg_per_week"].astype(np.float64)
+    adherence = users["adherence_rate"].astype(np.float64)
+    tracking_calories = users["calorie_entries"] > 0
+
+    def stat(value):
+        return None if pd.isna(value) else round(float(value), 4)
+
+    return {
+        "users": int(len(users)),
+        "users_with_weight": int((users["weight_entries"] > 0).sum()),
+        "users_with_calories": int(tracking_calories.sum()),
+        "users_with_notes": int((users["note_entries"] > 0).sum()),
+        "median_weight_slope_kg_per_week": stat(slope.median()),
+        "mean_weight_change_kg": stat(users["weight_change_kg"].astype(np.float64).mean()),
+        "share_losing_weight": stat((slope[slope.notna()] < 0).mean()),
+        "share_gaining_weight": stat((slope[slope.notna()] > 0).mean()),
+        "mean_adherence_rate": stat(adherence.mean()),
+        "median_adherence_rate": stat(adherence.median()),
+        "median_longest_streak_days": stat(users.loc[tracking_calories, "longest_streak_days"].median()),
+        "users_with_7_day_streak": int((users["current_streak_days"] >= 7).sum()),
+    }
+
+
+def _temp_file(path: str) -> tuple:
+    """(fd, name) of a new temp file beside path; unique, so concurrent runs never share one."""
+    return tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+
+
+def write_report(df: pd.DataFrame, path: str):
+    """Save a report column by column: Parquet for *.parquet paths, else .npz arrays."""
+    fd, tmp = _temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if path.endswith(".parquet"):
+                df.to_parquet(f, index=False)
+            else:
+                columns = {
+                    col: df[col].to_numpy() if pd.api.types.is_numeric_dtype(df[col])
+                    else df[col].fillna("").astype(str).to_numpy(dtype=str)
+                    for col in df.columns
+                }
+                np.savez(f, **columns)
+    except BaseException:
+        # e.g. parquet without pyarrow: leave no temp file behind
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+
+
+def read_report(path: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    with np.load(path) as data:
+        return pd.DataFrame({col: data[col] for col in data.files})
+
+
+def _load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["sources"]
+
+
+def _write_json(path: str, data: dict):
+    fd, tmp = _temp_file(path)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+# ------------- JOB -------------
+
+def run(data_dir: str = DATA_DIR, out_dir: str = None, jobs: int = None,
+        full: bool = False, report_format: str = "npz", as_of: date = None) -> dict:
+    """Compute per-user and cohort metrics for every history in data_dir.
+
+    Writes users.{npz,parquet} (one row per user), cohort.json and
+    manifest.json to out_dir (default data_dir/analytics). Sources whose
+    signature matches the manifest reuse their stored metrics, so reruns
+    only read what changed; full=True ignores the manifest. jobs worker
+    processes (default: all cores) compute the changed sources. Current
+    streaks are as of the report date as_of (default today). Returns run
+    counts.
+    """
+    start = time.perf_counter()
+    out_dir = out_dir or os.path.join(data_dir, "analytics")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    previous = {} if full else _load_manifest(manifest_path)
+
+    entries, tasks = {}, []
+    for key, source in discover(data_dir).items():
+        prev = previous.get(key)
+        if prev and prev["signature"] == source["signature"]:
+            entries[key] = prev
+        else:
+            tasks.append({**source, "key": key, "hash": prev.get("hash") if prev else None})
+
+    computed = 0
+    for result in _map(_compute, tasks, jobs or os.cpu_count() or 1):
+        key = result.pop("key")
+        if result["metrics"] is None:
+            result["metrics"] = previous[key]["metrics"]
+        else:
+            computed += 1
+        entries[key] = result
+
+    users = user_report(entries.values(), as_of)
+    write_report(users, os.path.join(out_dir, f"users.{report_format}"))
+    _write_json(os.path.join(out_dir, "cohort.json"), cohort_metrics(users))
+    # Written last, so an interrupted run is simply redone next time
+    _write_json(manifest_path, {"version": MANIFEST_VERSION, "sources": entries})
+    return {
+        "sources": len(entries),
+        "computed": computed,
+        "reused": len(entries) - computed,
+        "users": len(users),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort analytics over all users' tracking data")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="directory with tracking.db and CSV files")
+    parser.add_argument("-o", "--out", help="report directory (default: DATA_DIR/analytics)")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and recompute everything")
+    parser.add_argument("--format", choices=["npz", "parquet"], default="npz",
+                        help="user report format; parquet needs pyarrow")
+    parser.add_argument("--as-of", type=date.fromisoformat,
+                        help="report date YYYY-MM-DD for current streaks (default: today)")
+    args = parser.parse_args()
+
+    stats = run(args.data_dir, args.out, args.jobs, args.full, args.format, args.as_of)
+    print(stats)
+    with open(os.path.join(args.out or os.path.join(args.data_dir, "analytics"), "cohort.json")) as f:
+        print(json.dumps(json.load(f), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,24 @@
+import functools
 import random
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-
-from utils import (
-    calculate_bmr,
-    activity_multiplier,
-    calorie_target,
-    macro_targets,
-    bmi_and_category,
-    today_str,
-)
-from foods import build_full_day_plan
+
+import metrics
+from utils import daily_targets, today_str
+from charts import render as render_chart
+from rollups import calorie_rollup, weight_chart_data
+from foods import CATALOG, regenerate_meal
+from plan_cache import cached_full_day_plan
+from optimizer import within_tolerance
 from profiles import get_usernames, get_user, create_user
 from tracking import (
     save_weight,
-    load_weight,
     save_calories,
-    load_calories,
     save_note,
-    load_notes,
+    search_notes,
+    load_last,
+    count_entries,
 )
+from tracking_store import SEARCH_LIMIT
 from export_pdf import build_pdf
 
 
@@ -40,8 +38,51 @@ def apply_theme():
         )
 
 
+# ------------- CHARTS -------------
+
+def show_chart(kind, data, **params):
+    with metrics.span(f"chart.{kind}"):
+        fmt, out = render_chart(kind, data, **params)
+        if fmt == "vega":
+            st.vega_lite_chart(out, use_container_width=True)
+        else:
+            st.image(out)
+
+
+# ------------- SHOPPING LIST -------------
+
+def show_shopping_list(plans, file_name: str):
+    from shopping import shopping_list
+
+    items = shopping_list(*plans)
+    with st.expander("Shopping List"):
+        st.dataframe(items[["food", "amount"]], use_container_width=True, hide_index=True)
+        st.download_button(
+            "Download Shopping List as CSV",
+            data=items.to_csv(index=False),
+            file_name=file_name,
+            mime="text/csv",
+            key=f"shopping_{file_name}",
+        )
+
+
+def _no_plan(plan_df) -> bool:
+    return plan_df is None or plan_df.empty
+
+
+# ------------- FOOD SWAPS -------------
+
+@st.cache_resource(show_spinner="Preparing food swaps...")
+def swap_table():
+    """Swap tables for the catalog, loaded or built once per server process."""
+    from substitutes import substitution_table
+    return substitution_table()
+
+
 # ------------- SESSION INIT -------------
 
+metrics.begin_rerun()
+
 if "theme" not in st.session_state:
     st.session_state["theme"] = "Light"
 
@@ -53,14 +94,29 @@ if "meal_seeds" not in st.session_state:
         "dinner": random.randint(0, 1_000_000),
     }
 
+# History rows shown per tab; "Show older" buttons grow these by HISTORY_PAGE
+HISTORY_PAGE = 90
+for key in ["weight_rows", "calorie_rows"]:
+    if key not in st.session_state:
+        st.session_state[key] = HISTORY_PAGE
+
+# Page of the notes search results; reset to 0 whenever the search changes
+NOTES_PAGE = 20
+if "notes_page" not in st.session_state:
+    st.session_state["notes_page"] = 0
+
+# None until the first plan is built, so a cold start never needs pandas
 if "current_plan" not in st.session_state:
-    st.session_state["current_plan"] = pd.DataFrame()
+    st.session_state["current_plan"] = None
 
 apply_theme()
 
 st.set_page_config(page_title="Smart Diet Planner", page_icon="🥗", layout="wide")
 st.title("Smart Diet Planner")
 
+# At startup, so swapping a food in the plan is only a lookup
+swap_table()
+
 
 # ------------- SIDEBAR: LOGIN -------------
 
@@ -151,6 +207,7 @@ activity_level = st.sidebar.selectbox(
 
 goal = st.sidebar.radio("Goal", ["Lose weight", "Maintain weight", "Gain weight"])
 veg_only = st.sidebar.checkbox("Veg-Only Mode", value=bool(profile.get("veg_default", True)))
+optimize_macros = st.sidebar.checkbox("Match Macro Targets", value=False)
 
 # Weight tracking save button
 if st.sidebar.button("Save Today's Weight"):
@@ -162,19 +219,21 @@ if st.sidebar.button("Save Today's Weight"):
 
 col1, col2, col3, col4 = st.columns(4)
 
-bmi, bmi_cat = bmi_and_category(weight_kg, height_cm)
+targets = daily_targets(gender, weight_kg, height_cm, age, activity_level, goal)
+
+bmi, bmi_cat = targets["bmi"], targets["bmi_category"]
 with col1:
     st.metric("BMI", f"{bmi}", bmi_cat)
 
-bmr = calculate_bmr(gender, weight_kg, height_cm, age)
+bmr = targets["bmr"]
 with col2:
     st.metric("BMR", f"{bmr:.0f} kcal")
 
-tdee = bmr * activity_multiplier(activity_level)
+tdee = targets["tdee"]
 with col3:
     st.metric("TDEE", f"{tdee:.0f} kcal")
 
-target_cal = calorie_target(tdee, goal)
+target_cal = targets["target_cal"]
 with col4:
     st.metric("Target Calories", f"{target_cal:.0f} kcal", goal)
 
@@ -183,7 +242,7 @@ with col4:
 
 st.markdown("### Generate / Edit Your Meal Plan")
 
-macro = macro_targets(weight_kg, target_cal)
+macro = targets["macros"]
 
 top_c1, top_c2, top_c3 = st.columns(3)
 with top_c1:
@@ -205,23 +264,42 @@ with regen_cols[2]:
 with regen_cols[3]:
     regen_dinner = st.button("Regenerate Dinner")
 
+plan_mode = "optimize" if optimize_macros else "greedy"
+regen_meals = [
+    meal for meal, clicked in [
+        ("breakfast", regen_breakfast),
+        ("lunch", regen_lunch),
+        ("snack", regen_snack),
+        ("dinner", regen_dinner),
+    ] if clicked
+]
+
 # Update seeds on regenerate
-if regen_breakfast:
-    st.session_state["meal_seeds"]["breakfast"] = random.randint(0, 1_000_000)
-if regen_lunch:
-    st.session_state["meal_seeds"]["lunch"] = random.randint(0, 1_000_000)
-if regen_snack:
-    st.session_state["meal_seeds"]["snack"] = random.randint(0, 1_000_000)
-if regen_dinner:
-    st.session_state["meal_seeds"]["dinner"] = random.randint(0, 1_000_000)
-
-if btn_generate or regen_breakfast or regen_lunch or regen_snack or regen_dinner:
-    plan_df = build_full_day_plan(target_cal, veg_only, st.session_state["meal_seeds"])
-    st.session_state["current_plan"] = plan_df.copy()
+for meal in regen_meals:
+    st.session_state["meal_seeds"][meal] = random.randint(0, 1_000_000)
+
+if btn_generate or (regen_meals and _no_plan(st.session_state["current_plan"])):
+    plan_df = cached_full_day_plan(
+        target_cal, veg_only, st.session_state["meal_seeds"],
+        mode=plan_mode, macros=macro,
+    )
+    st.session_state["current_plan"] = plan_df
+    # Edits already live in current_plan; drop the editor's pending deltas
+    st.session_state.pop("meal_editor", None)
+elif regen_meals:
+    # Only the clicked meal is rebuilt; edits to the other meals are kept
+    plan_df = st.session_state["current_plan"]
+    for meal in regen_meals:
+        plan_df, _ = regenerate_meal(
+            plan_df, meal, target_cal, veg_only, st.session_state["meal_seeds"][meal],
+            mode=plan_mode, macros=macro,
+        )
+    st.session_state["current_plan"] = plan_df
+    st.session_state.pop("meal_editor", None)
 
 plan_df = st.session_state["current_plan"]
 
-if plan_df.empty:
+if _no_plan(plan_df):
     st.info("Click **Generate Full Day Plan** to create a meal plan.")
 else:
     st.markdown("### Editable Meal Plan")
@@ -231,7 +309,39 @@ else:
         use_container_width=True,
         key="meal_editor",
     )
+    # Typed foods are matched to the catalog and their numbers recomputed
+    from search import apply_food_edits, food_index
+    resolved_df, unmatched = apply_food_edits(edited_df, plan_df)
+    if not resolved_df.equals(edited_df):
+        st.session_state["current_plan"] = resolved_df
+        st.session_state.pop("meal_editor", None)
+        st.rerun()
     st.session_state["current_plan"] = edited_df
+    for name in unmatched:
+        close = [CATALOG.names[i] for i, _ in food_index().search(name, limit=3)]
+        hint = f" Did you mean: {', '.join(close)}?" if close else ""
+        st.warning(f"No food matches '{name}'; its calories and macros were left as entered.{hint}")
+
+    # Swaps come from the tables swap_table() prepared, so the rest of the plan is kept
+    from substitutes import swap_food, swap_options
+    with st.expander("Swap a food"):
+        labels = [f"{r.meal_type}: {r.food} × {r.servings}" for r in edited_df.itertuples()]
+        swap_row = st.selectbox("Food to replace", range(len(labels)), format_func=labels.__getitem__)
+        options = swap_options(edited_df, swap_row, veg_only) if labels else None
+        if options is None or options.empty:
+            st.caption("No calorie- and macro-matched swaps for this food.")
+        else:
+            pick = st.radio(
+                "Replace with", range(len(options)),
+                format_func=lambda i: (
+                    f"{options.food[i]} × {options.servings[i]} ({options.calories[i]:.0f} kcal, "
+                    f"P {options.protein_g[i]:.0f} g / C {options.carbs_g[i]:.0f} g / F {options.fat_g[i]:.0f} g)"
+                ),
+            )
+            if st.button("Swap"):
+                st.session_state["current_plan"] = swap_food(edited_df, swap_row, options.iloc[pick])
+                st.session_state.pop("meal_editor", None)
+                st.rerun()
 
     totals = edited_df[["calories", "protein_g", "carbs_g", "fat_g"]].sum()
     st.markdown("#### Daily Nutrition Summary")
@@ -244,33 +354,28 @@ else:
 
     diff = totals["calories"] - target_cal
     st.info(f"Difference from target: {diff:+.0f} kcal")
+    if optimize_macros and not within_tolerance(totals.to_dict(), target_cal, macro):
+        st.warning("Could not match every macro target with the available foods.")
 
     # Pie charts
     chart_col1, chart_col2 = st.columns(2)
     with chart_col1:
         st.subheader("Macro Distribution")
-        fig, ax = plt.subplots()
-        labels = ["Protein", "Carbs", "Fats"]
-        values = [max(totals["protein_g"], 0.1), max(totals["carbs_g"], 0.1), max(totals["fat_g"], 0.1)]
-        ax.pie(values, labels=labels, autopct="%1.1f%%")
-        ax.axis("equal")
-        st.pyplot(fig)
+        show_chart("macro_pie", totals)
 
     with chart_col2:
         st.subheader("Calories by Meal")
         meal_cal = edited_df.groupby("meal_type")["calories"].sum()
-        fig2, ax2 = plt.subplots()
-        ax2.pie(meal_cal.values, labels=meal_cal.index, autopct="%1.1f%%")
-        ax2.axis("equal")
-        st.pyplot(fig2)
+        show_chart("meal_calories_pie", meal_cal)
 
     # Save calories
     if st.button("Save Today's Calories Summary"):
         save_calories(username, target_cal, float(totals["calories"]))
         st.success("Calorie summary saved for today.")
 
-    # PDF export
-    pdf_bytes = build_pdf(
+    # PDF export; only rendered when the user clicks download
+    pdf_bytes = functools.partial(
+        build_pdf,
         edited_df,
         {
             "Target Calories": f"{target_cal:.0f}",
@@ -288,6 +393,41 @@ else:
         file_name=f"diet_plan_{today_str()}.pdf",
         mime="application/pdf",
     )
+    show_shopping_list([edited_df], f"shopping_list_{today_str()}.csv")
+
+# ------------- MULTI-DAY PLAN -------------
+
+st.markdown("### Multi-Day Plan")
+md_c1, md_c2 = st.columns(2)
+with md_c1:
+    n_days = st.number_input("Days", min_value=1, max_value=28, value=7)
+with md_c2:
+    no_repeat_days = st.number_input(
+        "Days before a food can repeat", min_value=0, max_value=6, value=2
+    )
+
+if st.button("Generate Multi-Day Plan"):
+    from multiday import build_multi_day_plan
+    st.session_state["multi_day_plan"] = build_multi_day_plan(
+        int(n_days), target_cal, veg_only, seed=random.randint(0, 1_000_000),
+        no_repeat_days=int(no_repeat_days), mode=plan_mode, macros=macro,
+    )
+
+multi_day_df = st.session_state.get("multi_day_plan")
+if multi_day_df is not None:
+    day_totals = multi_day_df.groupby("day")[["calories", "protein_g", "carbs_g", "fat_g"]].sum()
+    st.dataframe(day_totals.round(1), use_container_width=True)
+    with st.expander("All meals"):
+        st.dataframe(multi_day_df, use_container_width=True, hide_index=True)
+    st.download_button(
+        "Download Multi-Day Plan as CSV",
+        data=multi_day_df.to_csv(index=False),
+        file_name=f"diet_plan_{today_str()}_{multi_day_df['day'].max()}d.csv",
+        mime="text/csv",
+    )
+    show_shopping_list(
+        [multi_day_df], f"shopping_list_{today_str()}_{multi_day_df['day'].max()}d.csv"
+    )
 
 # ------------- TABS: WEIGHT, CALORIES, NOTES -------------
 
@@ -296,41 +436,42 @@ tab1, tab2, tab3 = st.tabs(["📉 Weight Tracking", "🔥 Calorie History", "
 
 with tab1:
     st.subheader("Weight Progress")
-    df_w = load_weight(username)
-    if df_w.empty:
+    total_w = count_entries("weight", username)
+    if total_w == 0:
         st.info("No weight data yet. Save from the sidebar.")
     else:
-        df_w = df_w.sort_values("date")
+        df_w = load_last("weight", username, st.session_state["weight_rows"])
+        st.caption(f"Showing the latest {len(df_w)} of {total_w} entries")
         st.dataframe(df_w, use_container_width=True)
-        fig, ax = plt.subplots()
-        ax.plot(df_w["date"], df_w["weight"], marker="o")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Weight (kg)")
-        ax.set_title("Weight Over Time")
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        if len(df_w) < total_w and st.button("Show older weight entries"):
+            st.session_state["weight_rows"] += HISTORY_PAGE
+            st.rerun()
+        # Chart the visible range from rollups at a resolution that fits it
+        chart_w, period = weight_chart_data(username, df_w["date"].min(), df_w["date"].max())
+        show_chart("weight_line", chart_w, period=period)
 
 with tab2:
     st.subheader("Calorie History")
-    df_c = load_calories(username)
-    if df_c.empty:
+    total_c = count_entries("calories", username)
+    if total_c == 0:
         st.info("No calorie data yet. Save from the main section.")
     else:
-        df_c = df_c.sort_values("date")
+        df_c = load_last("calories", username, st.session_state["calorie_rows"])
+        st.caption(f"Showing the latest {len(df_c)} of {total_c} entries")
         st.dataframe(df_c, use_container_width=True)
+        if len(df_c) < total_c and st.button("Show older calorie entries"):
+            st.session_state["calorie_rows"] += HISTORY_PAGE
+            st.rerun()
+
+        adherence = calorie_rollup(username, "day", df_c["date"].min(), df_c["date"].max())
+        if adherence["count"].sum() > 0:
+            on_target = adherence["on_target"].sum() / adherence["count"].sum()
+            st.metric("Entries within 10% of target", f"{on_target:.0%}")
 
         # Last 7 days bar chart
         last7 = df_c.tail(7)
         st.markdown("**Last 7 entries (Actual vs Target)**")
-        fig3, ax3 = plt.subplots()
-        x = range(len(last7))
-        ax3.bar(x, last7["target_cal"], label="Target")
-        ax3.bar(x, last7["actual_cal"], bottom=0, alpha=0.6, label="Actual")
-        ax3.set_xticks(x)
-        ax3.set_xticklabels(last7["date"], rotation=45)
-        ax3.set_ylabel("Calories")
-        ax3.legend()
-        st.pyplot(fig3)
+        show_chart("calorie_bars", last7)
 
 with tab3:
     st.subheader("Daily Notes / Journal")
@@ -338,10 +479,43 @@ with tab3:
     if st.button("Save Note"):
         save_note(username, note)
         st.success("Note saved.")
-    df_n = load_notes(username)
-    if df_n.empty:
-        st.info("No notes yet.")
-    else:
-        df_n = df_n.sort_values("date", ascending=False)
-        st.dataframe(df_n, use_container_width=True)
 
+    def _reset_notes_page():
+        st.session_state["notes_page"] = 0
+
+    search_c1, search_c2, search_c3 = st.columns([2, 1, 1])
+    query = search_c1.text_input("Search notes", placeholder='words, "exact phrase", prefix*',
+                                 on_change=_reset_notes_page)
+    date_from = search_c2.date_input("From", value=None, on_change=_reset_notes_page)
+    date_to = search_c3.date_input("To", value=None, on_change=_reset_notes_page)
+
+    page = st.session_state["notes_page"]
+    df_n, total_n = search_notes(
+        username, query,
+        start=date_from.isoformat() if date_from else None,
+        end=date_to.isoformat() if date_to else None,
+        page=page, page_size=NOTES_PAGE,
+    )
+    if total_n == 0:
+        st.info("No matching notes." if query or date_from or date_to else "No notes yet.")
+    else:
+        first = page * NOTES_PAGE
+        more = "+" if total_n >= SEARCH_LIMIT else ""
+        st.caption(f"Showing {first + 1}–{first + len(df_n)} of {total_n}{more} notes")
+        shown = df_n[["date", "snippet" if query else "note"]].rename(columns={"snippet": "note"})
+        st.dataframe(shown, use_container_width=True, hide_index=True)
+        prev_col, next_col = st.columns(2)
+        if page > 0 and prev_col.button("Previous notes"):
+            st.session_state["notes_page"] -= 1
+            st.rerun()
+        if first + len(df_n) < total_n and next_col.button("Next notes"):
+            st.session_state["notes_page"] += 1
+            st.rerun()
+
+# ------------- TIMINGS -------------
+
+# Only with SMART_DIET_METRICS set; spans also go to data/trace.json and data/metrics.txt
+if metrics.ENABLED:
+    timings = metrics.end_rerun()
+    with st.sidebar.expander("Rerun timings"):
+        st.dataframe(timings, use_container_width=True, hide_index=True)
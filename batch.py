@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from foods import CATALOG, MEAL_RATIOS, PLAN_COLUMNS, SHUFFLE_LIMIT
+from rounding import round_like_python
+
+MAX_ITEMS_PER_MEAL = 5
+
+# Sort keys computed at once when ordering a whole pool (users x foods)
+BLOCK_KEYS = 4_000_000
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: turns (seed, food) pairs into well-spread sort keys
+    x = x.astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _meal_seeds(seeds, n_users: int) -> np.ndarray:
+    """Normalize seeds to one column per meal, in MEAL_RATIOS order."""
+    seeds = np.asarray(seeds, dtype=np.int64).astype(np.uint64)
+    if seeds.ndim == 1:
+        meal_no = np.arange(len(MEAL_RATIOS), dtype=np.uint64)
+        seeds = _mix(seeds[:, None] * _GOLDEN + meal_no[None, :])
+    if seeds.shape != (n_users, len(MEAL_RATIOS)):
+        raise ValueError("seeds must have shape (n_users,) or (n_users, 4)")
+    return seeds
+
+
+def _top_keys(cand: np.ndarray, seeds: np.ndarray, slots: int) -> np.ndarray:
+    """Positions in cand of each user's `slots` lowest (seed, food) keys.
+
+    Users go in chunks so the key matrix stays under BLOCK_KEYS entries.
+    """
+    top = np.empty((len(seeds), slots), dtype=np.intp)
+    step = max(1, BLOCK_KEYS // len(cand))
+    for lo in range(0, len(seeds), step):
+        keys = _mix(seeds[lo:lo + step, None] * _GOLDEN + cand[None, :].astype(np.uint64))
+        if slots < len(cand):
+            part = np.argpartition(keys, slots - 1, axis=1)[:, :slots]
+            order = np.argsort(np.take_along_axis(keys, part, axis=1), axis=1)
+            top[lo:lo + step] = np.take_along_axis(part, order, axis=1)
+        else:
+            top[lo:lo + step] = np.argsort(keys, axis=1)
+    return top
+
+
+def _sample_positions(n: int, seeds: np.ndarray, slots: int) -> np.ndarray:
+    """`slots` distinct seeded positions in range(n) per user, for large pools.
+
+    Like foods.meal_candidates, pools over SHUFFLE_LIMIT are sampled instead
+    of ordered whole. Twice as many draws as needed are hashed and the first
+    distinct ones kept; the rare user left short is ordered in full.
+    """
+    draws = 2 * slots
+    pos = (_mix(seeds[:, None] * _GOLDEN + np.arange(draws, dtype=np.uint64)[None, :])
+           % np.uint64(n)).astype(np.intp)
+    dup = np.zeros(pos.shape, dtype=bool)
+    for j in range(1, draws):
+        dup[:, j] = (pos[:, :j] == pos[:, j:j + 1]).any(axis=1)
+    first = np.argsort(dup, axis=1, kind="stable")[:, :slots]
+    top = np.take_along_axis(pos, first, axis=1)
+    short = np.flatnonzero((~dup).sum(axis=1) < slots)
+    if len(short):
+        top[short] = _top_keys(np.arange(n), seeds[short], slots)
+    return top
+
+
+def _fill_meal(cand: np.ndarray, meal_cals: np.ndarray, seeds: np.ndarray):
+    """Greedy fill for one meal across many users at once.
+
+    Each user's candidates are ordered by a hash of (seed, food id), or drawn
+    by seeded sampling when the pool is over SHUFFLE_LIMIT, the first
+    MAX_ITEMS_PER_MEAL are tried in that order, and servings follow the same
+    rules as foods.generate_meal. Returns (food ids, servings, taken mask),
+    each shaped (n_users, slots).
+    """
+    n_users = len(meal_cals)
+    slots = min(MAX_ITEMS_PER_MEAL, len(cand))
+    if len(cand) > SHUFFLE_LIMIT:
+        top = _sample_positions(len(cand), seeds, slots)
+    else:
+        top = _top_keys(cand, seeds, slots)
+    ids = cand[top]
+
+    servings = np.zeros((n_users, slots))
+    taken = np.zeros((n_users, slots), dtype=bool)
+    remaining = meal_cals.astype(np.float64)
+    for k in range(slots):
+        cal = CATALOG.cal[ids[:, k]]
+        max_serv = remaining / cal
+        take = (remaining > 0) & (max_serv >= 0.4)
+        # Python's round, as fill_meal_ids uses, so ties go the same way
+        serv = round_like_python(np.minimum(2.0, max_serv), 1)
+        servings[:, k] = np.where(take, serv, 0.0)
+        taken[:, k] = take
+        remaining = remaining - servings[:, k] * cal
+    return ids, servings, taken
+
+
+def build_plans_batch(total_calories, veg_only, seeds, user_ids=None) -> pd.DataFrame:
+    """Build full-day plans for many users in one vectorized pass.
+
+    total_calories, veg_only and seeds are arrays with one entry per user
+    (seeds may also be shaped (n_users, 4) for per-meal seeds). Returns a
+    long-format DataFrame with a leading "user" column followed by the usual
+    plan columns, ordered by user, then meal, then item.
+
+    Plans follow the same greedy rules as build_full_day_plan but use a
+    hash-based shuffle, so a given seed does not reproduce the exact
+    single-user plan.
+    """
+    total_calories = np.asarray(total_calories, dtype=np.float64)
+    n_users = len(total_calories)
+    veg_only = np.broadcast_to(np.asarray(veg_only, dtype=bool), (n_users,))
+    seeds = _meal_seeds(seeds, n_users)
+    if user_ids is None:
+        user_ids = np.arange(n_users)
+    user_ids = np.asarray(user_ids)
+
+    n_meals = len(MEAL_RATIOS)
+    ids = np.zeros((n_users, n_meals, MAX_ITEMS_PER_MEAL), dtype=np.intp)
+    servings = np.zeros((n_users, n_meals, MAX_ITEMS_PER_MEAL))
+    taken = np.zeros((n_users, n_meals, MAX_ITEMS_PER_MEAL), dtype=bool)
+
+    for m, (meal, ratio) in enumerate(MEAL_RATIOS.items()):
+        for veg in (False, True):
+            rows = np.flatnonzero(veg_only == veg)
+            cand = CATALOG.indices(meal, veg)
+            if len(rows) == 0 or len(cand) == 0:
+                continue
+            meal_ids, meal_serv, meal_taken = _fill_meal(
+                cand, total_calories[rows] * ratio, seeds[rows, m]
+            )
+            slots = meal_ids.shape[1]
+            ids[rows, m, :slots] = meal_ids
+            servings[rows, m, :slots] = meal_serv
+            taken[rows, m, :slots] = meal_taken
+
+    user_idx, meal_idx, _ = np.nonzero(taken)
+    food = ids[taken]
+    serv = servings[taken]
+    meal_titles = np.array([meal.title() for meal in MEAL_RATIOS], dtype=object)
+    names = np.array(list(CATALOG.names), dtype=object)
+    serving_text = np.array(list(CATALOG.servings), dtype=object)
+
+    return pd.DataFrame({
+        "user": user_ids[user_idx],
+        "meal_type": meal_titles[meal_idx],
+        "food": names[food],
+        "serving": serving_text[food],
+        "servings": serv,
+        "calories": round_like_python(serv * CATALOG.cal[food], 0),
+        "protein_g": round_like_python(serv * CATALOG.protein[food], 1),
+        "carbs_g": round_like_python(serv * CATALOG.carbs[food], 1),
+        "fat_g": round_like_python(serv * CATALOG.fat[food], 1),
+    }, columns=["user"] + PLAN_COLUMNS)
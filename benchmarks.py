@@ -0,0 +1,934 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import analytics
+import cache
+import charts
+import export_pdf
+import foods
+import ingest
+import nutrition
+import profile_store
+import profiles
+import tracking
+import tracking_store
+import utils
+from catalog import MEAL_TYPES, FoodCatalog, catalog_columns, open_catalog
+from search import FoodIndex
+from substitutes import SubstitutionTable, load_tables, swap_options, write_tables
+from batch import build_plans_batch
+from export_pdf import build_pdf_batch
+from multiday import MAX_DAYS, build_multi_day_plan
+from loadtest import plan_bodies, run_load
+from service import WORKERS, PlanService, start as start_service
+
+# Size multipliers for the synthetic catalogs, users and histories
+SCALES = [1, 100, 10_000]
+
+# Nightly job requirement for batch planning on a single core
+BATCH_PLANS_PER_MINUTE = 100_000
+
+
+def bench_batch_plans(n_users: int = 100_000, large_foods: int = 10_000, seed: int = 0) -> dict:
+    """Batch plans on the bundled catalog and on a large_foods synthetic one."""
+    rng = np.random.default_rng(seed)
+    calories = rng.uniform(1400, 3200, n_users)
+    veg = rng.random(n_users) < 0.5
+    seeds = rng.integers(0, 1_000_000, n_users)
+
+    def run():
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            df = build_plans_batch(calories, veg, seeds)
+            elapsed = time.perf_counter() - start
+        return len(df), round(n_users / elapsed * 60), round(rss.peak_mb - rss.start_mb, 1)
+
+    rows, plans_per_minute, rss_delta = run()
+    catalog = synthetic_catalog(-(-large_foods // len(foods.FOODS)), seed)
+    with _using_catalog(catalog):
+        _, large_per_minute, large_rss_delta = run()
+    return {
+        "name": "batch_plans",
+        "n_users": n_users,
+        "rows": rows,
+        "plans_per_minute": plans_per_minute,
+        "peak_rss_delta_mb": rss_delta,
+        "large_catalog_foods": len(catalog),
+        "large_plans_per_minute": large_per_minute,
+        "large_peak_rss_delta_mb": large_rss_delta,
+        "passed": min(plans_per_minute, large_per_minute) >= BATCH_PLANS_PER_MINUTE,
+    }
+
+
+def bench_pdf_batch(n_plans: int = 1000, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    plans_df = build_plans_batch(
+        rng.uniform(1400, 3200, n_plans), rng.random(n_plans) < 0.5,
+        rng.integers(0, 1_000_000, n_plans),
+    )
+    plans = [
+        (plan.drop(columns="user"), {"Target Calories": "2000"}, f"user{user}", "2024-01-01")
+        for user, plan in plans_df.groupby("user", sort=False)
+    ]
+
+    start = time.perf_counter()
+    with open(os.devnull, "wb") as sink:
+        build_pdf_batch(plans, sink=sink)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "name": "pdf_batch",
+        "n_plans": n_plans,
+        "seconds": round(elapsed, 4),
+        "ms_per_page": round(elapsed / n_plans * 1000, 3),
+    }
+
+
+def bench_nutrition(n_rows: int = 1_000_000, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    gender = rng.integers(0, len(nutrition.GENDERS), n_rows)
+    activity = rng.integers(0, len(nutrition.ACTIVITY_LEVELS), n_rows)
+    goal = rng.integers(0, len(nutrition.GOALS), n_rows)
+    weight = np.round(rng.uniform(40, 150, n_rows), 1)
+    height = rng.integers(140, 210, n_rows).astype(float)
+    age = rng.integers(15, 90, n_rows)
+
+    start = time.perf_counter()
+    bmr = nutrition.calculate_bmr(gender, weight, height, age)
+    target = nutrition.calorie_target(bmr * nutrition.activity_multiplier(activity), goal)
+    nutrition.macro_targets(weight, target)
+    nutrition.bmi_and_category(weight, height)
+    vector_s = time.perf_counter() - start
+
+    genders = [nutrition.GENDERS[c] for c in gender]
+    levels = [nutrition.ACTIVITY_LEVELS[c] for c in activity]
+    goals = [nutrition.GOALS[c] for c in goal]
+    weights, heights, ages = weight.tolist(), height.tolist(), age.tolist()
+    start = time.perf_counter()
+    for i in range(n_rows):
+        bmr_i = utils.calculate_bmr(genders[i], weights[i], heights[i], ages[i])
+        target_i = utils.calorie_target(bmr_i * utils.activity_multiplier(levels[i]), goals[i])
+        utils.macro_targets(weights[i], target_i)
+        utils.bmi_and_category(weights[i], heights[i])
+    scalar_s = time.perf_counter() - start
+
+    return {
+        "name": "nutrition",
+        "n_rows": n_rows,
+        "vector_seconds": round(vector_s, 4),
+        "scalar_seconds": round(scalar_s, 4),
+        "speedup": round(scalar_s / vector_s, 1),
+    }
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        # Peak rather than current RSS; ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def bench_chart_memory(n_reruns: int = 10_000, reruns_per_input: int = 100, seed: int = 0) -> dict:
+    """Simulate app reruns drawing all four charts; inputs change every few reruns."""
+    dates = pd.date_range("2024-01-01", periods=60).strftime("%Y-%m-%d")
+    rss = []
+    start = time.perf_counter()
+    for i in range(n_reruns):
+        rng_i = np.random.default_rng(seed + i // reruns_per_input)
+        totals = pd.Series(rng_i.uniform(20, 300, 3), index=["protein_g", "carbs_g", "fat_g"])
+        meal_cal = pd.Series(rng_i.uniform(100, 800, 4), index=["Breakfast", "Lunch", "Snack", "Dinner"])
+        weights = pd.DataFrame({"date": dates, "weight": 80 + rng_i.normal(0, 1, len(dates)).cumsum()})
+        calories = pd.DataFrame({
+            "date": dates[-7:], "target_cal": 2000.0, "actual_cal": rng_i.uniform(1500, 2500, 7),
+        })
+        charts.render("macro_pie", totals, backend="matplotlib")
+        charts.render("meal_calories_pie", meal_cal, backend="matplotlib")
+        charts.render("weight_line", weights, backend="matplotlib")
+        charts.render("calorie_bars", calories, backend="matplotlib")
+        if i % 1000 == 999:
+            rss.append(_rss_mb())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "name": "chart_memory",
+        "n_reruns": n_reruns,
+        "seconds": round(elapsed, 2),
+        "rss_mb_first": round(rss[0], 1) if rss else None,
+        "rss_mb_last": round(rss[-1], 1) if rss else None,
+        "rss_growth_mb": round(rss[-1] - rss[0], 1) if rss else None,
+        "cache": charts.RENDERED.stats(),
+    }
+
+
+# Longest multi-day plan must build well under a second
+MULTI_DAY_BUDGET_S = 0.25
+
+
+def bench_multi_day(n_days: int = MAX_DAYS, repeat: int = 5, seed: int = 0) -> dict:
+    macros = {"protein_g": 120.0, "carbs_g": 220.0, "fat_g": 60.0}
+    worst = {}
+    for mode in ("greedy", "optimize"):
+        runs = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            build_multi_day_plan(n_days, 2000.0, i % 2 == 0, seed=seed + i, mode=mode, macros=macros)
+            runs.append(time.perf_counter() - start)
+        worst[mode] = round(max(runs), 4)
+
+    return {
+        "name": "multi_day",
+        "n_days": n_days,
+        "worst_seconds": worst,
+        "passed": max(worst.values()) < MULTI_DAY_BUDGET_S,
+    }
+
+
+# An imported catalog must open (memory-map plus index build) this fast
+CATALOG_OPEN_BUDGET_MS = 50.0
+
+
+def bench_catalog(n_rows: int = 200_000, seed: int = 0) -> dict:
+    """Ingest a synthetic USDA-style CSV, then time opening the catalog."""
+    rng = np.random.default_rng(seed)
+    protein, carbs, fat = rng.uniform(0, 30, n_rows), rng.uniform(0, 60, n_rows), rng.uniform(0, 30, n_rows)
+    source = pd.DataFrame({
+        "Description": [f"Food {i % (n_rows * 9 // 10)}" for i in range(n_rows)],
+        "Energy (kcal)": np.where(rng.random(n_rows) < 0.02, -1.0, 4 * protein + 4 * carbs + 9 * fat),
+        "Protein": protein, "Carbohydrate, by difference": carbs, "Total lipid (fat)": fat,
+        "gram_weight": rng.choice([50.0, 100.0, 150.0], n_rows),
+    }).round(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "foods.csv")
+        source.to_csv(csv_path, index=False)
+        start = time.perf_counter()
+        stats = ingest.ingest([csv_path], os.path.join(tmp, "catalog"), per_100g=True, swaps=False)
+        ingest_s = time.perf_counter() - start
+
+        open_ms = []
+        for _ in range(5):
+            start = time.perf_counter()
+            catalog = open_catalog(os.path.join(tmp, "catalog"))
+            open_ms.append((time.perf_counter() - start) * 1000)
+            del catalog
+
+    return {
+        "name": "catalog",
+        "n_rows": n_rows,
+        **stats,
+        "ingest_rows_per_s": round(n_rows / ingest_s),
+        "open_ms": round(min(open_ms), 2),
+        "passed": min(open_ms) < CATALOG_OPEN_BUDGET_MS,
+    }
+
+
+SEARCH_BUDGET_MS = 5.0
+
+SEARCH_WORDS = [
+    "chicken", "paneer", "rice", "dal", "masala", "curry", "roti", "egg", "fish", "salad",
+    "oats", "banana", "apple", "spicy", "grilled", "fried", "boiled", "tikka", "butter",
+    "palak", "aloo", "gobi", "chana", "rajma", "soup",
+]
+
+
+def _typo(rng, text: str) -> str:
+    i = int(rng.integers(0, len(text)))
+    return text[:i] + text[i + 1:]
+
+
+def bench_search(n_items: int = 100_000, n_queries: int = 500, seed: int = 0) -> dict:
+    """Fuzzy lookups against n_items generated names, half of them with a typo."""
+    rng = np.random.default_rng(seed)
+    names = [" ".join(rng.choice(SEARCH_WORDS, rng.integers(2, 5))) + f" {i}" for i in range(n_items)]
+    start = time.perf_counter()
+    index = FoodIndex(names)
+    build_s = time.perf_counter() - start
+
+    queries = [names[i] for i in rng.integers(0, n_items, n_queries)]
+    queries = [_typo(rng, q) if k % 2 else q.rsplit(" ", 1)[0] for k, q in enumerate(queries)]
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q, limit=5)
+        times.append((time.perf_counter() - start) * 1000)
+    p95 = float(np.percentile(times, 95))
+
+    return {
+        "name": "search",
+        "n_items": n_items,
+        "build_seconds": round(build_s, 2),
+        "mean_ms": round(float(np.mean(times)), 3),
+        "p95_ms": round(p95, 3),
+        "passed": p95 < SEARCH_BUDGET_MS,
+    }
+
+
+# Cold-import budgets in ms (cumulative, from python -X importtime) for the
+# modules app.py pulls in besides streamlit; about 2x the measured times
+IMPORT_BUDGET_MS = {
+    "utils": 50,
+    "foods": 250,
+    "optimizer": 300,
+    "plan_cache": 300,
+    "tracking": 100,
+    "rollups": 100,
+    "profiles": 100,
+    "charts": 50,
+    "export_pdf": 50,
+}
+
+# Libraries that must load on first use, never at app start
+LAZY_MODULES = ["pandas", "matplotlib", "reportlab"]
+
+
+def _import_ms(module: str) -> tuple:
+    """Cold-import time of module in ms and the LAZY_MODULES it loaded."""
+    code = f"import sys, {module}; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    cumulative_us = 0
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_us = int(parts[1])
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return cumulative_us / 1000, loaded
+
+
+def bench_import_time(repeat: int = 3) -> dict:
+    """Best-of-repeat cold-import time per module against IMPORT_BUDGET_MS."""
+    times, over, eager = {}, [], {}
+    for module, budget in IMPORT_BUDGET_MS.items():
+        runs = [_import_ms(module) for _ in range(repeat)]
+        times[module] = round(min(ms for ms, _ in runs), 1)
+        if times[module] > budget:
+            over.append(module)
+        if runs[0][1]:
+            eager[module] = runs[0][1]
+
+    return {
+        "name": "import_time",
+        "ms": times,
+        "over_budget": over,
+        "eager_heavy_imports": eager,
+        "passed": not over and not eager,
+    }
+
+
+# ------------- SYNTHETIC DATA -------------
+
+def synthetic_catalog(scale: int = 1, seed: int = 0) -> FoodCatalog:
+    """len(FOODS) * scale foods: the bundled list, then renamed copies with jittered nutrients."""
+    rng = np.random.default_rng(seed)
+    base = FoodCatalog(foods.FOODS)
+    n_base = len(base)
+    src = np.arange(n_base * scale) % n_base
+    jitter = np.ones(len(src))
+    jitter[n_base:] = rng.uniform(0.8, 1.2, len(src) - n_base)
+    return FoodCatalog.from_columns(
+        names=[base.names[i] if k < n_base else f"{base.names[i]} #{k // n_base}"
+               for k, i in enumerate(src)],
+        servings=[base.servings[i] for i in src],
+        units=[base.units[i] for i in src],
+        cal=np.round(base.cal[src] * jitter, 1),
+        protein=np.round(base.protein[src] * jitter, 1),
+        carbs=np.round(base.carbs[src] * jitter, 1),
+        fat=np.round(base.fat[src] * jitter, 1),
+        qty=base.qty[src],
+        flags=base.flags[src],
+    )
+
+
+class _using_catalog:
+    """Temporarily plan from another catalog (foods, optimizer and batch bind CATALOG at import)."""
+
+    def __init__(self, catalog: FoodCatalog):
+        import batch
+        import optimizer
+        self._modules = [foods, optimizer, batch]
+        self._catalog = catalog
+
+    def __enter__(self):
+        self._saved = [m.CATALOG for m in self._modules]
+        for m in self._modules:
+            m.CATALOG = self._catalog
+
+    def __exit__(self, *exc):
+        for m, saved in zip(self._modules, self._saved):
+            m.CATALOG = saved
+
+
+def seed_history(username: str, n_days: int, seed: int = 0):
+    """Write n_days of weight and calorie entries straight into tracking.db."""
+    rng = np.random.default_rng(seed)
+    first = date.today() - timedelta(days=n_days)
+    dates = [(first + timedelta(days=i)).isoformat() for i in range(n_days)]
+    weights = 80 + rng.normal(0, 0.3, n_days).cumsum()
+    actual = rng.uniform(1500, 2500, n_days)
+    conn = tracking_store.connect()
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO weight (username, date, weight) VALUES (?, ?, ?)",
+        [(username, d, float(w)) for d, w in zip(dates, weights)],
+    )
+    conn.executemany(
+        "INSERT INTO calories (username, date, target_cal, actual_cal) VALUES (?, ?, ?, ?)",
+        [(username, d, 2000.0, float(a)) for d, a in zip(dates, actual)],
+    )
+    conn.execute("COMMIT")
+
+
+def seed_users(n_users: int, prefix: str = "user"):
+    """Insert n_users profiles straight into profiles.db."""
+    conn = profile_store.connect()
+    now = datetime.now().isoformat()
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)",
+        [(f"{prefix}{i}", json.dumps({
+            "username": f"{prefix}{i}", "name": f"User {i}", "age": 20 + i % 50,
+            "gender": "Male" if i % 2 else "Female", "height_cm": 150.0 + i % 40,
+            "veg_default": bool(i % 3), "created_at": now,
+        })) for i in range(n_users)],
+    )
+    conn.execute("COMMIT")
+
+
+def _per_call(fn, n: int) -> float:
+    """Mean seconds per call of fn over n calls."""
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n
+
+
+# ------------- HOT PATHS -------------
+
+def bench_planner(scale: int = 1, n_calls: int = 500, seed: int = 0) -> dict:
+    """generate_meal and full-day plans on a catalog of len(FOODS) * scale foods."""
+    catalog = synthetic_catalog(scale, seed)
+    macros = {"protein_g": 120.0, "carbs_g": 220.0, "fat_g": 60.0}
+    seeds = lambda i: {meal: seed + i + k for k, meal in enumerate(foods.MEAL_RATIOS)}
+    with _using_catalog(catalog):
+        meal_s = _per_call(lambda i: foods.generate_meal("lunch", 600.0, i % 2 == 0, seed=i), n_calls)
+        greedy_s = _per_call(lambda i: foods.build_full_day_plan(2000.0, i % 2 == 0, seeds(i)), n_calls // 5)
+        optimize_s = _per_call(lambda i: foods.build_full_day_plan(
+            2000.0, i % 2 == 0, seeds(i), mode="optimize", macros=macros), n_calls // 10)
+
+    return {
+        "name": "planner",
+        "scale": scale,
+        "n_foods": len(catalog),
+        "generate_meal_us": round(meal_s * 1e6, 1),
+        "day_plan_greedy_ms": round(greedy_s * 1000, 3),
+        "day_plan_optimize_ms": round(optimize_s * 1000, 3),
+    }
+
+
+def bench_storage(scale: int = 1, n_calls: int = 200, seed: int = 0) -> dict:
+    """tracking.save_* and history reads for a user with 30 * scale days of history."""
+    username = f"bench{scale}"
+    seed_history(username, 30 * scale, seed)
+    # The first save backfills the rollups from full history; keep it out of the timings
+    start = time.perf_counter()
+    tracking.save_weight(username, 80.0)
+    tracking.save_calories(username, 2000.0, 1900.0)
+    first_save_s = time.perf_counter() - start
+
+    def load_last(i):
+        cache.invalidate("load_last", "weight", username)
+        tracking.load_last("weight", username, 90)
+
+    def load_full(i):
+        cache.invalidate("load_weight", username)
+        tracking.load_weight(username)
+
+    return {
+        "name": "storage",
+        "scale": scale,
+        "history_days": 30 * scale,
+        "first_save_seconds": round(first_save_s, 4),
+        "save_weight_ms": round(_per_call(lambda i: tracking.save_weight(username, 80.0 + i % 5), n_calls) * 1000, 3),
+        "save_calories_ms": round(_per_call(lambda i: tracking.save_calories(username, 2000.0, 1800.0 + i), n_calls) * 1000, 3),
+        "save_note_ms": round(_per_call(lambda i: tracking.save_note(username, f"note {i}"), n_calls) * 1000, 3),
+        "load_last_90_ms": round(_per_call(load_last, n_calls) * 1000, 3),
+        "load_full_ms": round(_per_call(load_full, 5) * 1000, 3),
+    }
+
+
+def bench_profiles(scale: int = 1, n_calls: int = 200, seed: int = 0) -> dict:
+    """Profile reads and writes with 10 * scale stored users."""
+    rng = np.random.default_rng(seed)
+    n_users = 10 * scale
+    prefix = f"bench{scale}_"
+    seed_users(n_users, prefix)
+    names = [f"{prefix}{i}" for i in rng.integers(0, n_users, n_calls)]
+
+    def get_user(i):
+        cache.invalidate("get_user", names[i])
+        profiles.get_user(names[i])
+
+    def create_user(i):
+        profiles.create_user(f"{prefix}new{i}", "New", 30, "Male", 170.0, True)
+
+    return {
+        "name": "profiles",
+        "scale": scale,
+        "n_users": n_users,
+        "get_user_ms": round(_per_call(get_user, n_calls) * 1000, 3),
+        "create_user_ms": round(_per_call(create_user, n_calls) * 1000, 3),
+        "load_users_ms": round(_per_call(lambda i: profiles.load_users(), 3) * 1000, 3),
+    }
+
+
+def bench_build_pdf(n_calls: int = 50, seed: int = 0) -> dict:
+    """Single-plan PDF rendering, cold and from the rendered-PDF cache."""
+    plan = foods.build_full_day_plan(2000.0, False, {meal: seed for meal in foods.MEAL_RATIOS})
+    summary = {"Target Calories": "2000"}
+
+    def cold(i):
+        export_pdf.RENDERED.clear()
+        export_pdf.build_pdf(plan, summary, "Bench", "2024-01-01")
+
+    cold_s = _per_call(cold, n_calls)
+    warm_s = _per_call(lambda i: export_pdf.build_pdf(plan, summary, "Bench", "2024-01-01"), n_calls)
+    # Caching by inputs is only sound if the same inputs render the same bytes
+    first = export_pdf.build_pdf(plan, summary, "Bench", "2024-01-01")
+    export_pdf.RENDERED.clear()
+    time.sleep(1.1)
+    deterministic = export_pdf.build_pdf(plan, summary, "Bench", "2024-01-01") == first
+    return {
+        "name": "build_pdf",
+        "cold_ms": round(cold_s * 1000, 3),
+        "cached_ms": round(warm_s * 1000, 3),
+        "deterministic": deterministic,
+        "passed": deterministic,
+    }
+
+
+def bench_analytics(n_users: int = 1000, n_days: int = 365, seed: int = 0) -> dict:
+    """Cohort analytics over per-user CSV files: serial, all cores, then an unchanged rerun."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=n_days).strftime("%Y-%m-%d")
+    jobs = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        for u in range(n_users):
+            pd.DataFrame({
+                "date": dates, "weight": 80 + rng.normal(0, 0.3, n_days).cumsum(),
+            }).to_csv(os.path.join(tmp, f"weight_u{u}.csv"), index=False)
+            pd.DataFrame({
+                "date": dates, "target_cal": 2000.0, "actual_cal": rng.uniform(1500, 2500, n_days),
+            }).to_csv(os.path.join(tmp, f"calories_u{u}.csv"), index=False)
+
+        serial = analytics.run(tmp, jobs=1, full=True)
+        parallel = analytics.run(tmp, jobs=jobs, full=True)
+        rerun = analytics.run(tmp, jobs=jobs)
+
+    return {
+        "name": "analytics",
+        "n_users": n_users,
+        "jobs": jobs,
+        "serial_seconds": serial["seconds"],
+        "parallel_seconds": parallel["seconds"],
+        "speedup": round(serial["seconds"] / parallel["seconds"], 2),
+        "rerun_seconds": rerun["seconds"],
+        "rerun_reused": rerun["reused"],
+    }
+
+
+def bench_service(n_requests: int = 2000, concurrency: int = 32, n_unique: int = 200) -> dict:
+    """Load-test /plan on an in-process service with one worker per core."""
+    async def run():
+        service = PlanService()
+        server = await start_service(service, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            result = await run_load("127.0.0.1", port, "/plan", plan_bodies(n_unique),
+                                    n_requests, concurrency)
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+        return {**result, "coalesced": service.stats["coalesced"], "rejected": service.stats["rejected"]}
+
+    return {"name": "service", "workers": WORKERS, **asyncio.run(run())}
+
+
+def bench_compact_plan(n_plans: int = 5000, seed: int = 0) -> dict:
+    """Day plans as item dicts + DataFrame (the old path) vs CompactPlan arrays."""
+    import tracemalloc
+
+    rng = np.random.default_rng(seed)
+    targets = rng.uniform(1400, 3000, n_plans).tolist()
+    veg = (rng.random(n_plans) < 0.5).tolist()
+    seeds = [{meal: seed + i * 4 + k for k, meal in enumerate(foods.MEAL_RATIOS)} for i in range(n_plans)]
+
+    def dict_items(i):
+        return [item for meal, ratio in foods.MEAL_RATIOS.items()
+                for item in foods.generate_meal(meal, targets[i] * ratio, veg[i], seeds[i][meal])]
+
+    def compact(i):
+        return foods.build_compact_day_plan(targets[i], veg[i], seeds[i])
+
+    def per_s(fn):
+        start = time.perf_counter()
+        for i in range(n_plans):
+            fn(i)
+        return round(n_plans / (time.perf_counter() - start))
+
+    def bytes_per_plan(fn):
+        tracemalloc.start()
+        kept = [fn(i) for i in range(n_plans)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return round(size / n_plans)
+
+    return {
+        "name": "compact_plan",
+        "n_plans": n_plans,
+        "dicts_per_s": per_s(dict_items),
+        "dicts_to_frame_per_s": per_s(lambda i: pd.DataFrame(dict_items(i))),
+        "compact_per_s": per_s(compact),
+        "compact_to_records_per_s": per_s(lambda i: compact(i).to_records()),
+        "compact_to_frame_per_s": per_s(lambda i: compact(i).to_frame()),
+        "dicts_bytes_per_plan": bytes_per_plan(dict_items),
+        "frame_bytes_per_plan": bytes_per_plan(lambda i: pd.DataFrame(dict_items(i))),
+        "compact_bytes_per_plan": bytes_per_plan(compact),
+    }
+
+
+def varied_catalog(n_foods: int, seed: int = 0) -> FoodCatalog:
+    """n_foods copies of the bundled foods with each macro jittered on its own.
+
+    Unlike synthetic_catalog, copies differ in macro balance, not just size,
+    so they spread out in the space substitutes searches.
+    """
+    rng = np.random.default_rng(seed)
+    base = FoodCatalog(foods.FOODS)
+    src = np.arange(n_foods) % len(base)
+    macros = {m: np.round(getattr(base, m)[src] * rng.uniform(0.7, 1.3, n_foods), 1)
+              for m in ("protein", "carbs", "fat")}
+    return FoodCatalog.from_columns(
+        names=[f"{base.names[i]} #{k}" for k, i in enumerate(src)],
+        servings=[base.servings[i] for i in src],
+        units=[base.units[i] for i in src],
+        cal=np.round(4 * macros["protein"] + 4 * macros["carbs"] + 9 * macros["fat"], 1),
+        qty=base.qty[src],
+        flags=base.flags[src],
+        **macros,
+    )
+
+
+def bench_substitutes(scale: int = 1, n_lookups: int = 2000, seed: int = 0) -> dict:
+    """Swap tables for len(FOODS) * scale foods: build, extend by 1%, save, load, look up."""
+    rng = np.random.default_rng(seed)
+    n_foods = len(foods.FOODS) * scale
+    grown = varied_catalog(n_foods + max(1, n_foods // 100), seed)
+    catalog = FoodCatalog.from_columns(**{
+        name: column[:n_foods] for name, column in catalog_columns(grown).items()
+    })
+
+    start = time.perf_counter()
+    table = SubstitutionTable(catalog)
+    table.precompute()
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updated = SubstitutionTable(grown, previous=table)
+    updated.precompute()
+    extend_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        write_tables(updated, tmp)
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = load_tables(grown, tmp)
+        load_s = time.perf_counter() - start
+
+    meals = rng.choice(MEAL_TYPES, n_lookups).tolist()
+    ids = [int(rng.choice(updated.catalog.indices(meal, False))) for meal in meals]
+    lookup_s = _per_call(lambda i: loaded.substitutes(ids[i], meals[i], False, 300.0), n_lookups)
+
+    plan = foods.build_full_day_plan(2000.0, False, {meal: seed for meal in foods.MEAL_RATIOS})
+    options_s = _per_call(lambda i: swap_options(plan, i % len(plan), False), 200)
+
+    return {
+        "name": "substitutes",
+        "scale": scale,
+        "n_foods": n_foods,
+        "build_seconds": round(build_s, 3),
+        "extend_1pct_seconds": round(extend_s, 3),
+        "pools_extended": updated.extended,
+        "pools_rebuilt": updated.rebuilt,
+        "pools_reused": updated.reused,
+        "save_seconds": round(save_s, 3),
+        "load_seconds": round(load_s, 3),
+        "lookup_us": round(lookup_s * 1e6, 2),
+        "swap_options_ms": round(options_s * 1000, 3),
+    }
+
+
+NOTE_WORDS = (
+    "slept well felt tired energetic hungry craving sugar skipped breakfast late dinner "
+    "gym run walk yoga rest day headache bloated great mood stressed work travel party "
+    "protein shake oats salad rice chicken paneer lentils coffee water cheat meal weekend"
+).split()
+
+
+def note_vocabulary(n_words: int = 5000, seed: int = 0) -> tuple:
+    """NOTE_WORDS among n_words made-up words, with Zipf-like word frequencies."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = ["".join(rng.choice(letters, int(rng.integers(3, 10)))) for _ in range(n_words - len(NOTE_WORDS))]
+    # Journal words land among the common ones, the way real notes repeat themselves
+    for word, rank in zip(NOTE_WORDS, rng.choice(500, len(NOTE_WORDS), replace=False)):
+        words.insert(int(rank), word)
+    weights = 1.0 / np.arange(1, len(words) + 1)
+    return np.array(words), weights / weights.sum()
+
+
+def bench_notes_search(n_notes: int = 100_000, n_queries: int = 200, seed: int = 0) -> dict:
+    """Full-text notes search over n_notes journal entries of one user."""
+    rng = np.random.default_rng(seed)
+    username = "bench_notes"
+    words, p = note_vocabulary(seed=seed)
+    lengths = rng.integers(5, 30, n_notes)
+    tokens = rng.choice(words, int(lengths.sum()), p=p)
+    bounds = np.concatenate([[0], lengths.cumsum()])
+    first = date.today() - timedelta(days=n_notes)
+    conn = tracking_store.connect()
+    start = time.perf_counter()
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO notes (username, date, note) VALUES (?, ?, ?)",
+        [(username, (first + timedelta(days=i)).isoformat(), " ".join(tokens[bounds[i]:bounds[i + 1]]))
+         for i in range(n_notes)],
+    )
+    conn.execute("COMMIT")
+    seed_s = time.perf_counter() - start
+
+    mid = (first + timedelta(days=n_notes // 2)).isoformat()
+    queries = {
+        "keyword": lambda i: tracking.search_notes(username, str(rng.choice(NOTE_WORDS))),
+        "two_words": lambda i: tracking.search_notes(username, " ".join(rng.choice(NOTE_WORDS, 2))),
+        "phrase": lambda i: tracking.search_notes(username, '"%s %s"' % tuple(rng.choice(NOTE_WORDS, 2)), page=i % 5),
+        "prefix": lambda i: tracking.search_notes(username, "crav*"),
+        "date_filtered": lambda i: tracking.search_notes(username, str(rng.choice(NOTE_WORDS)), start=mid),
+        "browse": lambda i: tracking.search_notes(username, page=i % 5),
+    }
+    result = {"name": "notes_search", "n_notes": n_notes, "seed_seconds": round(seed_s, 3)}
+    for kind, fn in queries.items():
+        times = []
+        for i in range(n_queries):
+            t = time.perf_counter()
+            fn(i)
+            times.append(time.perf_counter() - t)
+        result[f"{kind}_p50_ms"] = round(float(np.percentile(times, 50)) * 1000, 3)
+        result[f"{kind}_p95_ms"] = round(float(np.percentile(times, 95)) * 1000, 3)
+    result["save_note_ms"] = round(_per_call(lambda i: tracking.save_note(username, f"note {i}"), 200) * 1000, 3)
+    return result
+
+
+BENCHMARKS = {
+    "batch": bench_batch_plans,
+    "pdf": bench_pdf_batch,
+    "nutrition": bench_nutrition,
+    "charts": bench_chart_memory,
+    "imports": bench_import_time,
+    "multi_day": bench_multi_day,
+    "catalog": bench_catalog,
+    "search": bench_search,
+    "planner": bench_planner,
+    "storage": bench_storage,
+    "profiles": bench_profiles,
+    "build_pdf": bench_build_pdf,
+    "analytics": bench_analytics,
+    "service": bench_service,
+    "compact_plan": bench_compact_plan,
+    "notes_search": bench_notes_search,
+    "substitutes": bench_substitutes,
+}
+
+# Benchmarks that write tracking/profile data; run inside a scratch data dir
+USES_DATA_DIR = {"storage", "profiles", "notes_search"}
+
+
+# ------------- RUNNER -------------
+
+class PeakRSS:
+    """Sample RSS on a background thread while the block runs."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start_mb = self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, _rss_mb())
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = _rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _rss_mb())
+
+
+def run_benchmark(name: str, scale: int = 1) -> dict:
+    """Run one benchmark, passing scale where it takes one, and add its peak RSS."""
+    fn = BENCHMARKS[name]
+    kwargs = {"scale": scale} if "scale" in inspect.signature(fn).parameters else {}
+    with PeakRSS() as rss:
+        result = fn(**kwargs)
+    result["peak_rss_mb"] = round(rss.peak_mb, 1)
+    result["peak_rss_delta_mb"] = round(rss.peak_mb - rss.start_mb, 1)
+    return result
+
+
+def run_suite(names: list, scale: int = 1) -> dict:
+    """Run benchmarks by name; those in USES_DATA_DIR write to a temporary data dir."""
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            if name in USES_DATA_DIR:
+                # DATA_DIR is relative, so a scratch working dir keeps data/ untouched
+                os.chdir(tmp)
+            try:
+                results[name] = run_benchmark(name, scale)
+            finally:
+                os.chdir(cwd)
+            print(json.dumps(results[name]), flush=True)
+    return {
+        "meta": {
+            "scale": scale,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+# ------------- BASELINE COMPARISON -------------
+
+LOWER_IS_BETTER = ("_seconds", "_ms", "_us", "_mb")
+HIGHER_IS_BETTER = ("per_minute", "per_s", "speedup")
+
+
+def _direction(key: str) -> int:
+    """+1 if larger is better, -1 if smaller is better, 0 if not a performance metric."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith(HIGHER_IS_BETTER):
+        return 1
+    if leaf in ("ms", "seconds") or leaf.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def _flatten(d: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in d.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25) -> list:
+    """Metrics that got worse than baseline by more than threshold (a fraction).
+
+    Both arguments are run_suite outputs. Returns (metric, baseline, current,
+    change) tuples; metrics missing from either side are skipped.
+    """
+    if current["meta"]["scale"] != baseline["meta"]["scale"]:
+        raise ValueError(
+            f"Baseline was run at scale {baseline['meta']['scale']}, not {current['meta']['scale']}"
+        )
+    old = _flatten(baseline["results"])
+    regressions = []
+    for key, value in _flatten(current["results"]).items():
+        direction = _direction(key)
+        if not direction or key not in old or not old[key]:
+            continue
+        change = (value - old[key]) / abs(old[key])
+        if -direction * change > threshold:
+            regressions.append((key, old[key], value, round(change, 3)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Diet Planner benchmarks")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--scale", type=int, choices=SCALES, default=1,
+                        help="size multiplier for synthetic catalogs, users and histories")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown vs baseline, as a fraction")
+    parser.add_argument("--list", action="store_true", help="list benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, fn in BENCHMARKS.items():
+            doc = inspect.getdoc(fn) or ""
+            print(f"{name:<10} {doc.splitlines()[0] if doc else ''}")
+        return
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    report = run_suite(args.names, args.scale)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [name for name, r in report["results"].items() if not r.get("passed", True)]
+    for name in failed:
+        print(f"FAILED budget: {name}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.threshold)
+        except ValueError as e:
+            parser.error(str(e))
+        for key, old, new, change in regressions:
+            print(f"REGRESSION {key}: {old} -> {new} ({change:+.0%})")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%} vs {args.baseline}")
+    raise SystemExit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded, thread-safe mapping that evicts the least recently used entry.
+
+    Keys are tuples whose first element is a namespace (usually the cached
+    function's name), so a namespace or a single call can be invalidated.
+    """
+
+    def __init__(self, maxsize: int = 256, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                _, old = self._data.popitem(last=False)
+                self.evictions += 1
+                self._drop(old)
+
+    def invalidate(self, namespace: str, *args):
+        """Drop every cached call in namespace whose leading args equal args."""
+        prefix = (namespace, *args)
+        with self._lock:
+            keys = [k for k in self._data if k[:len(prefix)] == prefix]
+            for key in keys:
+                self._drop(self._data.pop(key))
+
+    def clear(self):
+        with self._lock:
+            for value in self._data.values():
+                self._drop(value)
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _drop(self, value):
+        if self.on_evict is not None:
+            self.on_evict(value)
+
+
+CACHE = LRUCache(int(os.environ.get("SMART_DIET_CACHE_SIZE", 256)))
+
+
+def cached(namespace: str):
+    """Memoize a function on its args in CACHE.
+
+    Pass the args used for invalidation (e.g. username) positionally, since
+    invalidate() matches on leading positional args.
+
+    Results with a .copy() method (DataFrames, dicts) are copied on the way
+    out so callers can't change what is stored.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (namespace, *args, *sorted(kwargs.items()))
+            value = CACHE.get(key, _MISSING)
+            if value is _MISSING:
+                metrics.count(f"cache.{namespace}.miss")
+                value = fn(*args, **kwargs)
+                CACHE.put(key, value)
+            else:
+                metrics.count(f"cache.{namespace}.hit")
+            return value.copy() if hasattr(value, "copy") else value
+        return wrapper
+    return decorator
+
+
+def invalidate(namespace: str, *args):
+    CACHE.invalidate(namespace, *args)
+
+
+def frame_key(*frames) -> str:
+    """Content hash of DataFrames/Series, for keying rendered output on its input data."""
+    import pandas as pd
+
+    h = hashlib.blake2b(digest_size=16)
+    for frame in frames:
+        labels = frame.columns if hasattr(frame, "columns") else [frame.name]
+        h.update(repr(list(labels)).encode())
+        h.update(pd.util.hash_pandas_object(frame, index=True, categorize=False).values.tobytes())
+    return h.hexdigest()
+
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+MEAL_TYPES = ["breakfast", "lunch", "snack", "dinner"]
+
+# Bit per meal type, plus one bit for veg items
+MEAL_BITS = {meal: 1 << i for i, meal in enumerate(MEAL_TYPES)}
+VEG_BIT = 1 << len(MEAL_TYPES)
+
+FORMAT_VERSION = 1
+NUMERIC_COLUMNS = {
+    "cal": np.float64, "protein": np.float64, "carbs": np.float64,
+    "fat": np.float64, "qty": np.float64, "flags": np.uint8,
+}
+STRING_COLUMNS = ["names", "servings", "units"]
+
+
+class StringColumn:
+    """Read-only list of strings stored as one UTF-8 blob plus offsets.
+
+    On-disk catalogs memory-map both, so opening costs nothing and only the
+    strings that are read get decoded.
+    """
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        data = bytes(self._blob)
+        offsets = self._offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+
+class FoodCatalog:
+    """Columnar view over a list of food records.
+
+    Nutrition values live in float arrays, meal types and veg in a single
+    bitmask column, and the candidate indices for every (meal_type, veg_only)
+    pair are computed once up front so meal generation never scans the list.
+    The bundled FOODS list and catalogs opened with open_catalog share this
+    interface.
+    """
+
+    def __init__(self, records: list):
+        flags = np.zeros(len(records), dtype=np.uint8)
+        for i, f in enumerate(records):
+            for meal in f["meal_types"]:
+                flags[i] |= MEAL_BITS.get(meal, 0)
+            if f["veg"]:
+                flags[i] |= VEG_BIT
+
+        self._set_columns(
+            names=[f["name"] for f in records],
+            servings=[f["serving"] for f in records],
+            # Shopping quantity of one serving; records without one count whole servings
+            units=[f.get("unit", "servings") for f in records],
+            cal=np.array([f["cal"] for f in records], dtype=np.float64),
+            protein=np.array([f["protein"] for f in records], dtype=np.float64),
+            carbs=np.array([f["carbs"] for f in records], dtype=np.float64),
+            fat=np.array([f["fat"] for f in records], dtype=np.float64),
+            qty=np.array([f.get("qty", 1) for f in records], dtype=np.float64),
+            flags=flags,
+        )
+        self.records = records
+
+    @classmethod
+    def from_columns(cls, **columns) -> "FoodCatalog":
+        catalog = cls.__new__(cls)
+        catalog._set_columns(**columns)
+        catalog.records = None
+        return catalog
+
+    def _set_columns(self, names, servings, units, cal, protein, carbs, fat, qty, flags):
+        self.names = names
+        self.servings = servings
+        self.units = units
+        self.cal = cal
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
+        self.qty = qty
+        self.flags = flags
+        self._index = self._build_index()
+        self._name_index = None
+        self._fingerprint = None
+
+    def _build_index(self) -> dict:
+        index = {}
+        is_veg = (self.flags & VEG_BIT) != 0
+        for meal, bit in MEAL_BITS.items():
+            in_meal = (self.flags & bit) != 0
+            index[(meal, False)] = np.flatnonzero(in_meal)
+            index[(meal, True)] = np.flatnonzero(in_meal & is_veg)
+        return index
+
+    def __len__(self):
+        return len(self.cal)
+
+    def indices(self, meal_type: str, veg_only: bool) -> np.ndarray:
+        """Catalog row ids for a meal type, in catalog order."""
+        idx = self._index.get((meal_type, bool(veg_only)))
+        if idx is None:
+            return np.empty(0, dtype=np.intp)
+        return idx
+
+    def record(self, food_id: int) -> dict:
+        """One food in the FOODS dict format."""
+        if self.records is not None:
+            return self.records[food_id]
+        flags = int(self.flags[food_id])
+        return {
+            "name": self.names[food_id],
+            "serving": self.servings[food_id],
+            "qty": float(self.qty[food_id]),
+            "unit": self.units[food_id],
+            "veg": bool(flags & VEG_BIT),
+            "meal_types": [meal for meal, bit in MEAL_BITS.items() if flags & bit],
+            "cal": float(self.cal[food_id]),
+            "protein": float(self.protein[food_id]),
+            "carbs": float(self.carbs[food_id]),
+            "fat": float(self.fat[food_id]),
+        }
+
+    def fingerprint(self) -> str:
+        """Hash of every column, computed once; equal catalogs hash the same
+        whether built from records or opened from disk."""
+        if self._fingerprint is None:
+            h = hashlib.blake2b(digest_size=12)
+            for col, dtype in NUMERIC_COLUMNS.items():
+                h.update(np.ascontiguousarray(getattr(self, col), dtype=dtype).tobytes())
+            for col in STRING_COLUMNS:
+                h.update("\0".join(getattr(self, col)).encode("utf-8"))
+                h.update(b"\1")
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def lookup(self, names) -> np.ndarray:
+        """Catalog ids for food names, -1 where a name is not in the catalog."""
+        if self._name_index is None:
+            import pandas as pd
+            self._name_index = pd.Index(list(self.names))
+        return self._name_index.get_indexer(names)
+
+
+# ------------- ON-DISK FORMAT -------------
+
+class CatalogWriter:
+    """Append chunks of catalog columns to a catalog directory.
+
+    Every column is a flat binary file, so chunks are written as they arrive
+    and memory stays flat however large the source is. Files go to a
+    temporary directory that replaces path on close().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+        self.rows = 0
+        self._files = {col: open(os.path.join(self._tmp, f"{col}.bin"), "wb")
+                       for col in [*NUMERIC_COLUMNS, *STRING_COLUMNS]}
+        self._offsets = {col: open(os.path.join(self._tmp, f"{col}.off"), "wb")
+                         for col in STRING_COLUMNS}
+        self._ends = {col: 0 for col in STRING_COLUMNS}
+        for col in STRING_COLUMNS:
+            np.zeros(1, dtype=np.int64).tofile(self._offsets[col])
+
+    def append(self, **columns):
+        """Write one chunk; every column in NUMERIC_COLUMNS and STRING_COLUMNS is required."""
+        n = len(columns["cal"])
+        for col, dtype in NUMERIC_COLUMNS.items():
+            np.asarray(columns[col], dtype=dtype).tofile(self._files[col])
+        for col in STRING_COLUMNS:
+            encoded = [s.encode("utf-8") for s in columns[col]]
+            self._files[col].write(b"".join(encoded))
+            ends = self._ends[col] + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+            ends.tofile(self._offsets[col])
+            if n:
+                self._ends[col] = int(ends[-1])
+        self.rows += n
+
+    def close(self):
+        for f in [*self._files.values(), *self._offsets.values()]:
+            f.close()
+        meta = {
+            "version": FORMAT_VERSION,
+            "rows": self.rows,
+            "columns": {col: np.dtype(dtype).str for col, dtype in NUMERIC_COLUMNS.items()},
+        }
+        with open(os.path.join(self._tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        for f in [*self._files.values(), *self._offsets.values()]:
+            f.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def catalog_columns(catalog: FoodCatalog) -> dict:
+    """A catalog's columns in the form CatalogWriter.append takes."""
+    return {
+        **{col: getattr(catalog, col) for col in NUMERIC_COLUMNS},
+        **{col: list(getattr(catalog, col)) for col in STRING_COLUMNS},
+    }
+
+
+def write_catalog(path: str, catalog: FoodCatalog):
+    """Save an in-memory catalog (e.g. the bundled FOODS) in the on-disk format."""
+    writer = CatalogWriter(path)
+    writer.append(**catalog_columns(catalog))
+    writer.close()
+
+
+def open_catalog(path: str) -> FoodCatalog:
+    """Memory-map a catalog directory written by CatalogWriter."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported catalog format in {path}")
+    rows = meta["rows"]
+
+    def column(name, dtype, count):
+        if count == 0 or os.path.getsize(os.path.join(path, name)) == 0:
+            return np.zeros(count, dtype=dtype)
+        return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(count,))
+
+    numeric = {col: column(f"{col}.bin", np.dtype(dtype), rows)
+               for col, dtype in meta["columns"].items()}
+    strings = {}
+    for col in STRING_COLUMNS:
+        offsets = column(f"{col}.off", np.int64, rows + 1)
+        blob = column(f"{col}.bin", np.uint8, int(offsets[-1]))
+        strings[col] = StringColumn(blob, offsets)
+    return FoodCatalog.from_columns(**numeric, **strings)
@@ -0,0 +1,159 @@
+import io
+import os
+
+from cache import LRUCache, frame_key
+
+# "matplotlib" renders PNGs; "vega" returns Vega-Lite specs and never imports matplotlib
+BACKEND = os.environ.get("SMART_DIET_CHART_BACKEND", "matplotlib")
+
+# Rendered PNG bytes (or specs) keyed by chart kind and a hash of its inputs
+RENDERED = LRUCache(int(os.environ.get("SMART_DIET_CHART_CACHE_SIZE", 64)))
+
+
+def _new_figure():
+    # Figures made without pyplot are never registered globally, so they are
+    # freed as soon as the PNG is written
+    from matplotlib.figure import Figure
+    fig = Figure()
+    return fig, fig.add_subplot()
+
+
+def _png(fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    fig.clear()
+    return buffer.getvalue()
+
+
+# ------------- MATPLOTLIB BUILDERS -------------
+
+def _macro_pie(totals):
+    fig, ax = _new_figure()
+    labels = ["Protein", "Carbs", "Fats"]
+    values = [max(totals["protein_g"], 0.1), max(totals["carbs_g"], 0.1), max(totals["fat_g"], 0.1)]
+    ax.pie(values, labels=labels, autopct="%1.1f%%")
+    ax.axis("equal")
+    return fig
+
+
+def _meal_calories_pie(meal_cal):
+    fig, ax = _new_figure()
+    ax.pie(meal_cal.values, labels=meal_cal.index, autopct="%1.1f%%")
+    ax.axis("equal")
+    return fig
+
+
+def _weight_line(df_w, period="day"):
+    import pandas as pd
+
+    fig, ax = _new_figure()
+    # Real dates let matplotlib pick a few ticks instead of labelling every point
+    dates = pd.to_datetime(df_w["date"]).to_numpy()
+    ax.plot(dates, df_w["weight"], marker="o")
+    if period != "day":
+        ax.fill_between(dates, df_w["weight_min"], df_w["weight_max"], alpha=0.2)
+    ax.set_xlabel("Date" if period == "day" else f"{period.title()} starting")
+    ax.set_ylabel("Weight (kg)")
+    ax.set_title("Weight Over Time")
+    ax.tick_params(axis="x", labelrotation=45)
+    return fig
+
+
+def _calorie_bars(last7):
+    fig, ax = _new_figure()
+    x = range(len(last7))
+    ax.bar(x, last7["target_cal"], label="Target")
+    ax.bar(x, last7["actual_cal"], bottom=0, alpha=0.6, label="Actual")
+    ax.set_xticks(x)
+    ax.set_xticklabels(last7["date"], rotation=45)
+    ax.set_ylabel("Calories")
+    ax.legend()
+    return fig
+
+
+# ------------- VEGA-LITE SPECS -------------
+
+def _pie_spec(labels, values) -> dict:
+    return {
+        "data": {"values": [{"label": str(k), "value": float(v)} for k, v in zip(labels, values)]},
+        "mark": {"type": "arc", "tooltip": True},
+        "encoding": {
+            "theta": {"field": "value", "type": "quantitative", "stack": "normalize"},
+            "color": {"field": "label", "type": "nominal"},
+        },
+    }
+
+
+def _macro_pie_spec(totals):
+    values = [max(totals["protein_g"], 0.1), max(totals["carbs_g"], 0.1), max(totals["fat_g"], 0.1)]
+    return _pie_spec(["Protein", "Carbs", "Fats"], values)
+
+
+def _meal_calories_pie_spec(meal_cal):
+    return _pie_spec(meal_cal.index, meal_cal.values)
+
+
+def _weight_line_spec(df_w, period="day"):
+    cols = ["date", "weight"] + (["weight_min", "weight_max"] if period != "day" else [])
+    line = {
+        "mark": {"type": "line", "point": True},
+        "encoding": {
+            "x": {"field": "date", "type": "temporal", "title": "Date"},
+            "y": {"field": "weight", "type": "quantitative", "title": "Weight (kg)",
+                  "scale": {"zero": False}},
+        },
+    }
+    layers = [line]
+    if period != "day":
+        layers.insert(0, {
+            "mark": {"type": "area", "opacity": 0.2},
+            "encoding": {
+                "x": {"field": "date", "type": "temporal"},
+                "y": {"field": "weight_min", "type": "quantitative"},
+                "y2": {"field": "weight_max"},
+            },
+        })
+    return {"data": {"values": df_w[cols].to_dict("records")}, "title": "Weight Over Time", "layer": layers}
+
+
+def _calorie_bars_spec(last7):
+    data = last7[["date", "target_cal", "actual_cal"]].rename(
+        columns={"target_cal": "Target", "actual_cal": "Actual"}
+    ).melt("date", var_name="series", value_name="calories")
+    return {
+        "data": {"values": data.to_dict("records")},
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "date", "type": "nominal"},
+            "xOffset": {"field": "series"},
+            "y": {"field": "calories", "type": "quantitative", "title": "Calories"},
+            "color": {"field": "series", "type": "nominal"},
+        },
+    }
+
+
+CHARTS = {
+    "macro_pie": (_macro_pie, _macro_pie_spec),
+    "meal_calories_pie": (_meal_calories_pie, _meal_calories_pie_spec),
+    "weight_line": (_weight_line, _weight_line_spec),
+    "calorie_bars": (_calorie_bars, _calorie_bars_spec),
+}
+
+
+def render(kind: str, data, backend: str = None, **params):
+    """Render a chart, reusing the cached output when data and params are unchanged.
+
+    data is the chart's Series/DataFrame input. Returns ("png", bytes) for the
+    matplotlib backend or ("vega", spec) for the Vega-Lite backend.
+    """
+    backend = backend or BACKEND
+    key = (kind, backend, frame_key(data), tuple(sorted(params.items())))
+    out = RENDERED.get(key)
+    if out is None:
+        build, spec = CHARTS[kind]
+        if backend == "vega":
+            out = ("vega", spec(data, **params))
+        else:
+            out = ("png", _png(build(data, **params)))
+        RENDERED.put(key, out)
+    return out
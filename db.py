@@ -0,0 +1,26 @@
+import sqlite3
+import threading
+
+from utils import ensure_data_dir
+
+_local = threading.local()
+
+
+def connect(path: str, schema: str) -> sqlite3.Connection:
+    """Per-thread SQLite connection in WAL mode, so readers never block the writer.
+
+    The schema script runs once per thread and path, so it should only use
+    CREATE ... IF NOT EXISTS statements.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        ensure_data_dir()
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(schema)
+        conns[path] = conn
+    return conn
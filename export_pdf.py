@@ -1,10 +1,28 @@
 import io
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+import os
 
-def build_pdf(plan_df, summary_dict, user_name: str, date_str: str) -> bytes:
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+from cache import LRUCache, frame_key
+from metrics import timed
+
+PLAN_LINE_COLUMNS = ["meal_type", "food", "serving", "servings", "calories"]
+
+# reportlab's A4 in points; reportlab itself is imported only when drawing
+A4 = (595.2755905511812, 841.8897637795277)
+
+# Finished PDFs keyed by a hash of their inputs, so repeat downloads are free
+RENDERED = LRUCache(int(os.environ.get("SMART_DIET_PDF_CACHE_SIZE", 64)))
+
+
+def _plan_lines(plan_df) -> list:
+    cols = [plan_df[c].tolist() for c in PLAN_LINE_COLUMNS]
+    return [
+        f"{meal}: {food} ({serving}) x{servings} -> {cals} kcal"[:110]
+        for meal, food, serving, servings, cals in zip(*cols)
+    ]
+
+
+def _draw_plan(c, plan_df, summary_dict, user_name: str, date_str: str):
+    """Draw one plan starting on a fresh page; ends with the page shown."""
     width, height = A4
 
     y = height - 50
@@ -30,10 +48,8 @@ def build_pdf(plan_df, summary_dict, user_name: str, date_str: str) -> bytes:
     y -= 18
     c.setFont("Helvetica", 10)
 
-    cols = ["meal_type", "food", "serving", "servings", "calories"]
-    for _, row in plan_df[cols].iterrows():
-        line = f"{row['meal_type']}: {row['food']} ({row['serving']}) x{row['servings']} -> {row['calories']} kcal"
-        c.drawString(45, y, line[:110])
+    for line in _plan_lines(plan_df):
+        c.drawString(45, y, line)
         y -= 12
         if y < 50:
             c.showPage()
@@ -41,8 +57,67 @@ def build_pdf(plan_df, summary_dict, user_name: str, date_str: str) -> bytes:
             c.setFont("Helvetica", 10)
 
     c.showPage()
+
+
+@timed
+def write_pdf(plan_df, summary_dict, user_name: str, date_str: str, sink):
+    """Render one plan into sink, a path or a binary file-like object."""
+    from reportlab.pdfgen import canvas
+
+    # invariant: no creation time or random document ID, so the same inputs
+    # always give the same bytes (RENDERED relies on this)
+    c = canvas.Canvas(sink, pagesize=A4, invariant=True)
+    _draw_plan(c, plan_df, summary_dict, user_name, date_str)
     c.save()
-    pdf = buffer.getvalue()
-    buffer.close()
+
+
+@timed
+def build_pdf(plan_df, summary_dict, user_name: str, date_str: str) -> bytes:
+    key = (
+        "pdf", frame_key(plan_df[PLAN_LINE_COLUMNS]),
+        tuple(summary_dict.items()), user_name, date_str,
+    )
+    pdf = RENDERED.get(key)
+    if pdf is None:
+        buffer = io.BytesIO()
+        write_pdf(plan_df, summary_dict, user_name, date_str, buffer)
+        pdf = buffer.getvalue()
+        buffer.close()
+        RENDERED.put(key, pdf)
     return pdf
 
+
+@timed
+def build_pdf_batch(plans, sink=None, out_dir: str = None, file_name=None) -> int:
+    """Render many plans; plans yields (plan_df, summary_dict, user_name, date_str).
+
+    With sink (a path or binary file-like), every plan goes into one
+    multi-page PDF. This is not streaming: reportlab holds every page in
+    memory and writes nothing to sink until the end, so memory grows with
+    the number of plans. With out_dir each plan is written to its own file
+    as soon as it is drawn and memory stays flat; use it for large runs.
+    file_name(i, user_name) picks the file names in out_dir. Returns the
+    number of plans.
+    """
+    if (sink is None) == (out_dir is None):
+        raise ValueError("Pass exactly one of sink or out_dir")
+
+    count = 0
+    if sink is not None:
+        from reportlab.pdfgen import canvas
+
+        # Same bytes for the same plans, as in write_pdf
+        c = canvas.Canvas(sink, pagesize=A4, invariant=True)
+        for plan_df, summary_dict, user_name, date_str in plans:
+            _draw_plan(c, plan_df, summary_dict, user_name, date_str)
+            count += 1
+        c.save()
+        return count
+
+    os.makedirs(out_dir, exist_ok=True)
+    file_name = file_name or (lambda i, user_name: f"diet_plan_{i:06d}.pdf")
+    for plan_df, summary_dict, user_name, date_str in plans:
+        write_pdf(plan_df, summary_dict, user_name, date_str,
+                  os.path.join(out_dir, file_name(count, user_name)))
+        count += 1
+    return count
@@ -1,105 +1,309 @@
+from __future__ import annotations
+
+import os
 import random
-import pandas as pd
+from array import array
+from typing import TYPE_CHECKING
+from catalog import FoodCatalog, open_catalog
+from metrics import timed
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Big-ish food database (veg + non-veg, Indian-focused)
+# qty/unit give one serving as a shopping quantity: grams ("g") or pieces ("pc")
 FOODS = [
     # Veg breakfast
-    {"name": "Poha", "serving": "1 plate", "veg": True, "meal_types": ["breakfast"], "cal": 180, "protein": 3, "carbs": 32, "fat": 4},
-    {"name": "Upma", "serving": "1 plate", "veg": True, "meal_types": ["breakfast"], "cal": 200, "protein": 4, "carbs": 35, "fat": 5},
-    {"name": "Oats Porridge", "serving": "1 bowl", "veg": True, "meal_types": ["breakfast"], "cal": 150, "protein": 5, "carbs": 25, "fat": 3},
-    {"name": "Idli Sambar", "serving": "2 idli + sambar", "veg": True, "meal_types": ["breakfast"], "cal": 220, "protein": 7, "carbs": 40, "fat": 4},
-    {"name": "Dosa (plain)", "serving": "1 dosa", "veg": True, "meal_types": ["breakfast"], "cal": 180, "protein": 4, "carbs": 30, "fat": 5},
+    {"name": "Poha", "serving": "1 plate", "qty": 150, "unit": "g", "veg": True, "meal_types": ["breakfast"], "cal": 180, "protein": 3, "carbs": 32, "fat": 4},
+    {"name": "Upma", "serving": "1 plate", "qty": 180, "unit": "g", "veg": True, "meal_types": ["breakfast"], "cal": 200, "protein": 4, "carbs": 35, "fat": 5},
+    {"name": "Oats Porridge", "serving": "1 bowl", "qty": 200, "unit": "g", "veg": True, "meal_types": ["breakfast"], "cal": 150, "protein": 5, "carbs": 25, "fat": 3},
+    {"name": "Idli Sambar", "serving": "2 idli + sambar", "qty": 2, "unit": "pc", "veg": True, "meal_types": ["breakfast"], "cal": 220, "protein": 7, "carbs": 40, "fat": 4},
+    {"name": "Dosa (plain)", "serving": "1 dosa", "qty": 1, "unit": "pc", "veg": True, "meal_types": ["breakfast"], "cal": 180, "protein": 4, "carbs": 30, "fat": 5},
 
     # Veg staples
-    {"name": "Roti (wheat)", "serving": "1 medium (40g)", "veg": True, "meal_types": ["lunch","dinner"], "cal": 120, "protein": 3, "carbs": 18, "fat": 3},
-    {"name": "Boiled Rice", "serving": "1 bowl (100g)", "veg": True, "meal_types": ["lunch","dinner"], "cal": 130, "protein": 2.5, "carbs": 28, "fat": 0.3},
-    {"name": "Brown Rice", "serving": "1 bowl (100g)", "veg": True, "meal_types": ["lunch","dinner"], "cal": 120, "protein": 2.6, "carbs": 25, "fat": 1},
-    {"name": "Dal Tadka", "serving": "1 bowl", "veg": True, "meal_types": ["lunch","dinner"], "cal": 150, "protein": 9, "carbs": 18, "fat": 5},
-    {"name": "Rajma Curry", "serving": "1 bowl", "veg": True, "meal_types": ["lunch","dinner"], "cal": 180, "protein": 9, "carbs": 30, "fat": 4},
-    {"name": "Chole (chickpea curry)", "serving": "1 bowl", "veg": True, "meal_types": ["lunch","dinner"], "cal": 190, "protein": 10, "carbs": 30, "fat": 5},
-    {"name": "Paneer Bhurji", "serving": "50g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 150, "protein": 9, "carbs": 4, "fat": 11},
-    {"name": "Mixed Veg Sabzi", "serving": "1 bowl", "veg": True, "meal_types": ["lunch","dinner"], "cal": 100, "protein": 3, "carbs": 12, "fat": 5},
-    {"name": "Salad", "serving": "1 plate", "veg": True, "meal_types": ["lunch","dinner"], "cal": 40, "protein": 2, "carbs": 8, "fat": 1},
-    {"name": "Curd (Dahi)", "serving": "1 bowl", "veg": True, "meal_types": ["lunch","dinner","snack"], "cal": 70, "protein": 3.5, "carbs": 5, "fat": 3},
+    {"name": "Roti (wheat)", "serving": "1 medium (40g)", "qty": 40, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 120, "protein": 3, "carbs": 18, "fat": 3},
+    {"name": "Boiled Rice", "serving": "1 bowl (100g)", "qty": 100, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 130, "protein": 2.5, "carbs": 28, "fat": 0.3},
+    {"name": "Brown Rice", "serving": "1 bowl (100g)", "qty": 100, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 120, "protein": 2.6, "carbs": 25, "fat": 1},
+    {"name": "Dal Tadka", "serving": "1 bowl", "qty": 150, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 150, "protein": 9, "carbs": 18, "fat": 5},
+    {"name": "Rajma Curry", "serving": "1 bowl", "qty": 150, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 180, "protein": 9, "carbs": 30, "fat": 4},
+    {"name": "Chole (chickpea curry)", "serving": "1 bowl", "qty": 150, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 190, "protein": 10, "carbs": 30, "fat": 5},
+    {"name": "Paneer Bhurji", "serving": "50g", "qty": 50, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 150, "protein": 9, "carbs": 4, "fat": 11},
+    {"name": "Mixed Veg Sabzi", "serving": "1 bowl", "qty": 150, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 100, "protein": 3, "carbs": 12, "fat": 5},
+    {"name": "Salad", "serving": "1 plate", "qty": 100, "unit": "g", "veg": True, "meal_types": ["lunch","dinner"], "cal": 40, "protein": 2, "carbs": 8, "fat": 1},
+    {"name": "Curd (Dahi)", "serving": "1 bowl", "qty": 150, "unit": "g", "veg": True, "meal_types": ["lunch","dinner","snack"], "cal": 70, "protein": 3.5, "carbs": 5, "fat": 3},
 
     # Snacks / fruits / nuts
-    {"name": "Banana", "serving": "1 piece", "veg": True, "meal_types": ["breakfast","snack"], "cal": 90, "protein": 1, "carbs": 23, "fat": 0.3},
-    {"name": "Apple", "serving": "1 piece", "veg": True, "meal_types": ["breakfast","snack"], "cal": 80, "protein": 0.3, "carbs": 21, "fat": 0.2},
-    {"name": "Orange", "serving": "1 piece", "veg": True, "meal_types": ["snack"], "cal": 60, "protein": 1, "carbs": 15, "fat": 0.2},
-    {"name": "Sprouts Bowl", "serving": "1 bowl", "veg": True, "meal_types": ["breakfast","snack"], "cal": 120, "protein": 8, "carbs": 16, "fat": 1},
-    {"name": "Mixed Nuts", "serving": "10-12 pcs", "veg": True, "meal_types": ["snack"], "cal": 100, "protein": 3, "carbs": 4, "fat": 9},
-    {"name": "Roasted Chana", "serving": "1 small bowl", "veg": True, "meal_types": ["snack"], "cal": 120, "protein": 6, "carbs": 18, "fat": 2},
+    {"name": "Banana", "serving": "1 piece", "qty": 1, "unit": "pc", "veg": True, "meal_types": ["breakfast","snack"], "cal": 90, "protein": 1, "carbs": 23, "fat": 0.3},
+    {"name": "Apple", "serving": "1 piece", "qty": 1, "unit": "pc", "veg": True, "meal_types": ["breakfast","snack"], "cal": 80, "protein": 0.3, "carbs": 21, "fat": 0.2},
+    {"name": "Orange", "serving": "1 piece", "qty": 1, "unit": "pc", "veg": True, "meal_types": ["snack"], "cal": 60, "protein": 1, "carbs": 15, "fat": 0.2},
+    {"name": "Sprouts Bowl", "serving": "1 bowl", "qty": 100, "unit": "g", "veg": True, "meal_types": ["breakfast","snack"], "cal": 120, "protein": 8, "carbs": 16, "fat": 1},
+    {"name": "Mixed Nuts", "serving": "10-12 pcs", "qty": 15, "unit": "g", "veg": True, "meal_types": ["snack"], "cal": 100, "protein": 3, "carbs": 4, "fat": 9},
+    {"name": "Roasted Chana", "serving": "1 small bowl", "qty": 30, "unit": "g", "veg": True, "meal_types": ["snack"], "cal": 120, "protein": 6, "carbs": 18, "fat": 2},
 
     # Non-veg
-    {"name": "Boiled Egg", "serving": "1 egg", "veg": False, "meal_types": ["breakfast","snack","dinner"], "cal": 70, "protein": 6, "carbs": 1, "fat": 5},
-    {"name": "Egg Bhurji", "serving": "2 eggs", "veg": False, "meal_types": ["breakfast","dinner"], "cal": 200, "protein": 12, "carbs": 4, "fat": 15},
-    {"name": "Chicken Breast (cooked)", "serving": "100g", "veg": False, "meal_types": ["lunch","dinner"], "cal": 165, "protein": 31, "carbs": 0, "fat": 4},
-    {"name": "Fish Curry", "serving": "1 piece", "veg": False, "meal_types": ["lunch","dinner"], "cal": 200, "protein": 20, "carbs": 8, "fat": 10},
+    {"name": "Boiled Egg", "serving": "1 egg", "qty": 1, "unit": "pc", "veg": False, "meal_types": ["breakfast","snack","dinner"], "cal": 70, "protein": 6, "carbs": 1, "fat": 5},
+    {"name": "Egg Bhurji", "serving": "2 eggs", "qty": 2, "unit": "pc", "veg": False, "meal_types": ["breakfast","dinner"], "cal": 200, "protein": 12, "carbs": 4, "fat": 15},
+    {"name": "Chicken Breast (cooked)", "serving": "100g", "qty": 100, "unit": "g", "veg": False, "meal_types": ["lunch","dinner"], "cal": 165, "protein": 31, "carbs": 0, "fat": 4},
+    {"name": "Fish Curry", "serving": "1 piece", "qty": 1, "unit": "pc", "veg": False, "meal_types": ["lunch","dinner"], "cal": 200, "protein": 20, "carbs": 8, "fat": 10},
 ]
 
 
+# Set to a catalog directory written by ingest.py to plan from an imported food database
+CATALOG_PATH = os.environ.get("SMART_DIET_CATALOG", "")
+
+CATALOG = open_catalog(CATALOG_PATH) if CATALOG_PATH else FoodCatalog(FOODS)
+
+MEAL_RATIOS = {
+    "breakfast": 0.25,
+    "lunch": 0.30,
+    "snack": 0.15,
+    "dinner": 0.30,
+}
+
+# Candidates tried per meal by the greedy fill
+MAX_ITEMS_PER_MEAL = 5
+
+# Meal pools larger than this are sampled rather than shuffled whole
+SHUFFLE_LIMIT = 1000
+
+PLAN_COLUMNS = ["meal_type","food","serving","servings","calories","protein_g","carbs_g","fat_g"]
+
+
 def get_foods_for_meal(meal_type: str, veg_only: bool):
-    return [
-        f for f in FOODS
-        if meal_type in f["meal_types"] and (f["veg"] or not veg_only)
-    ]
+    return [CATALOG.record(i) for i in CATALOG.indices(meal_type, veg_only)]
 
 
-def generate_meal(meal_type: str, meal_calories: float, veg_only: bool, seed: int = None):
-    foods = get_foods_for_meal(meal_type, veg_only)
-    if not foods:
-        return []
+def plan_item(meal_type: str, food_id: int, servings: float) -> dict:
+    cal = float(CATALOG.cal[food_id])
+    return {
+        "meal_type": meal_type.title(),
+        "food": CATALOG.names[food_id],
+        "serving": CATALOG.servings[food_id],
+        "servings": servings,
+        "calories": round(servings * cal, 0),
+        "protein_g": round(servings * float(CATALOG.protein[food_id]), 1),
+        "carbs_g": round(servings * float(CATALOG.carbs[food_id]), 1),
+        "fat_g": round(servings * float(CATALOG.fat[food_id]), 1),
+    }
 
-    rng = random.Random(seed)
-    rng.shuffle(foods)
 
-    items = []
+def fill_meal_ids(candidates: list, meal_calories: float) -> tuple:
+    """Greedy fill of one meal from catalog ids, tried in the order given.
+
+    Returns (food ids, servings) of the items taken.
+    """
+    ids, servings = [], []
     remaining = meal_calories
 
-    for food in foods[:5]:
+    for i in candidates[:MAX_ITEMS_PER_MEAL]:
         if remaining <= 0:
             break
 
-        max_serv = remaining / food["cal"]
+        cal = float(CATALOG.cal[i])
+        max_serv = remaining / cal
         if max_serv < 0.4:
             continue
 
-        servings = round(min(2.0, max_serv), 1)
-        cals = servings * food["cal"]
-
-        items.append({
-            "meal_type": meal_type.title(),
-            "food": food["name"],
-            "serving": food["serving"],
-            "servings": servings,
-            "calories": round(cals, 0),
-            "protein_g": round(servings * food["protein"], 1),
-            "carbs_g": round(servings * food["carbs"], 1),
-            "fat_g": round(servings * food["fat"], 1),
-        })
+        serv = round(min(2.0, max_serv), 1)
+        ids.append(i)
+        servings.append(serv)
 
-        remaining -= cals
+        remaining -= serv * cal
 
-    return items
+    return ids, servings
 
 
-def build_full_day_plan(total_calories: float, veg_only: bool, seeds: dict):
-    ratios = {
-        "breakfast": 0.25,
-        "lunch": 0.30,
-        "snack": 0.15,
-        "dinner": 0.30,
-    }
+def fill_meal(meal_type: str, candidates: list, meal_calories: float) -> list:
+    """fill_meal_ids as plan item dicts."""
+    ids, servings = fill_meal_ids(candidates, meal_calories)
+    return [plan_item(meal_type, i, serv) for i, serv in zip(ids, servings)]
+
+
+def meal_candidates(meal_type: str, veg_only: bool, seed: int = None) -> list:
+    """Catalog ids for a meal in the seeded order the greedy fill tries them."""
+    ids = CATALOG.indices(meal_type, veg_only)
+    if len(ids) == 0:
+        return []
+
+    rng = random.Random(seed)
+    if len(ids) > SHUFFLE_LIMIT:
+        # Imported catalogs: draw the few candidates tried instead of shuffling them all
+        return [int(ids[j]) for j in rng.sample(range(len(ids)), MAX_ITEMS_PER_MEAL)]
+    candidates = ids.tolist()
+    rng.shuffle(candidates)
+    return candidates
+
+
+@timed
+def generate_meal(meal_type: str, meal_calories: float, veg_only: bool, seed: int = None):
+    return fill_meal(meal_type, meal_candidates(meal_type, veg_only, seed), meal_calories)
+
+
+@timed
+def build_full_day_plan(total_calories: float, veg_only: bool, seeds: dict,
+                        mode: str = "greedy", macros: dict = None):
+    return build_compact_day_plan(total_calories, veg_only, seeds, mode, macros).to_frame()
+
+
+def plan_totals(plan_df: pd.DataFrame) -> dict:
+    return {col: float(plan_df[col].sum()) for col in ["calories","protein_g","carbs_g","fat_g"]}
+
+
+@timed
+def regenerate_meal(plan_df: pd.DataFrame, meal_type: str, total_calories: float, veg_only: bool,
+                    seed: int = None, mode: str = "greedy", macros: dict = None, totals: dict = None):
+    """Replace one meal's rows in an existing plan, leaving every other row as is.
+
+    The new rows go where the old ones were (or in meal order if the meal was
+    empty). If totals for plan_df are passed in, they are updated by removing
+    the old meal and adding the new one instead of re-summing the plan.
+    Returns (new_plan, totals).
+    """
+    import pandas as pd
+
+    ratio = MEAL_RATIOS[meal_type]
+    meal_cals = total_calories * ratio
+
+    items = None
+    if mode == "optimize":
+        from optimizer import optimize_meal
+        meal_macros = {k: v * ratio for k, v in (macros or {}).items()}
+        items = optimize_meal(meal_type, meal_cals, veg_only, seed, meal_macros)
+    if items is None:
+        items = generate_meal(meal_type, meal_cals, veg_only, seed=seed)
+    new_rows = pd.DataFrame(items, columns=PLAN_COLUMNS)
+
+    if plan_df.empty:
+        return new_rows, plan_totals(new_rows)
+
+    in_meal = (plan_df["meal_type"] == meal_type.title()).to_numpy()
+    if in_meal.any():
+        pos = int(in_meal.argmax())
+    else:
+        rank = {meal.title(): i for i, meal in enumerate(MEAL_RATIOS)}
+        this_rank = rank[meal_type.title()]
+        later = plan_df["meal_type"].map(rank).fillna(-1).to_numpy() > this_rank
+        pos = int(later.argmax()) if later.any() else len(plan_df)
+    # Kept rows that sit before the insertion point
+    split = int((~in_meal[:pos]).sum())
+    kept = plan_df[~in_meal]
+    new_plan = pd.concat([kept.iloc[:split], new_rows, kept.iloc[split:]], ignore_index=True)
+
+    if totals is None:
+        return new_plan, plan_totals(new_plan)
+    removed = plan_totals(plan_df[in_meal])
+    added = plan_totals(new_rows)
+    return new_plan, {k: totals[k] - removed[k] + added[k] for k in totals}
+
+
+# ------------- COMPACT PLANS -------------
+
+class CompactPlan:
+    """A day plan as three parallel arrays: meal index (into MEAL_RATIOS),
+    catalog food id and servings per item.
+
+    Names, servings text and macros are looked up from CATALOG only when
+    the plan is turned into rows (to_frame / to_records), so building and
+    keeping plans allocates a few small buffers instead of a dict and
+    strings per item. Plans are tied to the catalog they were built from.
+    """
+
+    __slots__ = ("meals", "foods", "servings")
+
+    def __init__(self, meals=(), foods=(), servings=()):
+        self.meals = array("B", meals)
+        self.foods = array("l", foods)
+        self.servings = array("d", servings)
+
+    def __len__(self):
+        return len(self.foods)
+
+    @classmethod
+    def from_items(cls, items: list) -> CompactPlan:
+        """Plan from item dicts (plan_item / PLAN_COLUMNS rows) of catalog foods."""
+        rank = {meal.title(): m for m, meal in enumerate(MEAL_RATIOS)}
+        ids = CATALOG.lookup([item["food"] for item in items])
+        if (ids < 0).any():
+            raise ValueError("Plan has foods that are not in the catalog")
+        return cls([rank[item["meal_type"]] for item in items], ids.tolist(),
+                   [item["servings"] for item in items])
+
+    def arrays(self) -> dict:
+        """Per-item numpy columns: meal, food, servings and the rounded macros."""
+        import numpy as np
+        # Python's round, as plan_item uses
+        from rounding import round_like_python
+
+        # Zero-copy views of the buffers
+        food = np.frombuffer(self.foods, dtype=np.dtype("l"))
+        serv = np.frombuffer(self.servings, dtype=np.float64)
+        grams = serv[:, None] * np.column_stack([CATALOG.protein[food], CATALOG.carbs[food], CATALOG.fat[food]])
+        protein, carbs, fat = round_like_python(grams, 1).T
+        return {
+            "meal": np.frombuffer(self.meals, dtype=np.uint8),
+            "food": food,
+            "servings": serv,
+            "calories": round_like_python(serv * CATALOG.cal[food], 0),
+            "protein_g": protein,
+            "carbs_g": carbs,
+            "fat_g": fat,
+        }
+
+    def totals(self) -> dict:
+        """Same as plan_totals(plan.to_frame()), without building the frame."""
+        cols = self.arrays()
+        return {col: float(cols[col].sum()) for col in ["calories", "protein_g", "carbs_g", "fat_g"]}
+
+    def to_records(self) -> list:
+        """Plan rows as PLAN_COLUMNS dicts."""
+        cols = self.arrays()
+        titles = [meal.title() for meal in MEAL_RATIOS]
+        return [
+            {
+                "meal_type": titles[m], "food": CATALOG.names[f], "serving": CATALOG.servings[f],
+                "servings": s, "calories": c, "protein_g": p, "carbs_g": cb, "fat_g": ft,
+            }
+            for m, f, s, c, p, cb, ft in zip(
+                cols["meal"].tolist(), cols["food"].tolist(), cols["servings"].tolist(),
+                cols["calories"].tolist(), cols["protein_g"].tolist(),
+                cols["carbs_g"].tolist(), cols["fat_g"].tolist(),
+            )
+        ]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Plan as a PLAN_COLUMNS DataFrame, as build_full_day_plan returns."""
+        import pandas as pd
+
+        if not len(self):
+            return pd.DataFrame(columns=PLAN_COLUMNS)
+        cols = self.arrays()
+        titles = [meal.title() for meal in MEAL_RATIOS]
+        food = cols["food"].tolist()
+        return pd.DataFrame({
+            "meal_type": [titles[m] for m in cols["meal"].tolist()],
+            "food": [CATALOG.names[f] for f in food],
+            "serving": [CATALOG.servings[f] for f in food],
+            **{col: cols[col] for col in PLAN_COLUMNS[3:]},
+        })
 
-    all_items = []
-    for meal, ratio in ratios.items():
-        meal_cals = total_calories * ratio
-        seed = seeds.get(meal)
-        items = generate_meal(meal, meal_cals, veg_only, seed=seed)
-        all_items.extend(items)
 
-    df = pd.DataFrame(all_items)
-    if df.empty:
-        return pd.DataFrame(columns=["meal_type","food","serving","servings","calories","protein_g","carbs_g","fat_g"])
-    return df
+@timed
+def build_compact_day_plan(total_calories: float, veg_only: bool, seeds: dict,
+                           mode: str = "greedy", macros: dict = None) -> CompactPlan:
+    """build_full_day_plan as a CompactPlan."""
+    if mode == "optimize":
+        from optimizer import optimize_day_plan
+        items = optimize_day_plan(total_calories, veg_only, seeds, macros)
+        if items is not None:
+            return CompactPlan.from_items(items)
 
+    # Greedy fill, also the fallback when the optimizer runs out of time
+    plan = CompactPlan()
+    for m, (meal, ratio) in enumerate(MEAL_RATIOS.items()):
+        ids, servings = fill_meal_ids(
+            meal_candidates(meal, veg_only, seeds.get(meal)), total_calories * ratio
+        )
+        plan.meals.extend([m] * len(ids))
+        plan.foods.extend(ids)
+        plan.servings.extend(servings)
+    return plan
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from catalog import MEAL_BITS, MEAL_TYPES, VEG_BIT, CatalogWriter, FoodCatalog, catalog_columns, open_catalog
+from foods import FOODS
+from substitutes import SubstitutionTable, write_tables
+
+CHUNK_ROWS = 50_000
+
+# Source column names (after lower-casing and replacing non-alphanumerics
+# with "_") accepted for each catalog field, first match wins
+COLUMN_ALIASES = {
+    "name": ["name", "description", "food", "food_name", "food_description"],
+    "serving": ["serving", "portion", "serving_description", "household_serving_fulltext"],
+    "qty": ["qty", "serving_size", "gram_weight", "grams", "serving_g"],
+    "unit": ["unit", "serving_size_unit", "serving_unit"],
+    "veg": ["veg", "vegetarian", "is_vegetarian"],
+    "meal_types": ["meal_types", "meals", "meal_type"],
+    "cal": ["cal", "calories", "kcal", "energy_kcal", "energy"],
+    "protein": ["protein", "protein_g"],
+    "carbs": ["carbs", "carbs_g", "carbohydrate", "carbohydrates", "carbohydrate_by_difference"],
+    "fat": ["fat", "fat_g", "total_fat", "total_lipid_fat"],
+}
+REQUIRED = ["name", "cal", "protein", "carbs", "fat"]
+NUTRIENTS = ["cal", "protein", "carbs", "fat"]
+
+# Energy from macros may exceed stated calories by this factor (plus a few
+# kcal) before a row is rejected as inconsistent
+MACRO_ENERGY_SLACK = 1.5
+
+TRUE_STRINGS = {"1", "true", "yes", "y", "t", "veg", "vegetarian"}
+
+
+def _column_key(name: str) -> str:
+    return re.sub(r"[^0-9a-z]+", "_", str(name).strip().lower()).strip("_")
+
+
+def dedupe_key(name: str) -> str:
+    """Names that differ only in case or spacing count as the same food."""
+    return " ".join(str(name).split()).casefold()
+
+
+def read_chunks(path: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows source rows.
+
+    CSV and JSON Lines (.jsonl/.ndjson) files are streamed. A .json file
+    holding one array is read whole, then chunked.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    elif ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("foods", [])
+        for start in range(0, len(data), chunk_rows):
+            yield pd.DataFrame(data[start:start + chunk_rows])
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False,
+                               na_values=[""])
+
+
+def _resolve_columns(columns) -> dict:
+    """Map catalog fields to source column names; raise if a required one is missing."""
+    by_key = {}
+    for col in columns:
+        by_key.setdefault(_column_key(col), col)
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in by_key:
+                mapping[field] = by_key[alias]
+                break
+    missing = [field for field in REQUIRED if field not in mapping]
+    if missing:
+        raise ValueError(f"Source has no column for: {', '.join(missing)}")
+    return mapping
+
+
+def _meal_flags(values: pd.Series, default_meal_types: list) -> np.ndarray:
+    default = np.uint8(sum(MEAL_BITS[m] for m in default_meal_types))
+    flags = np.full(len(values), default, dtype=np.uint8)
+    text = values.astype("string").str.lower().fillna("")
+    given = (text.str.strip() != "").to_numpy()
+    if given.any():
+        flags[given] = 0
+        for meal, bit in MEAL_BITS.items():
+            flags[given & text.str.contains(meal, regex=False).to_numpy()] |= bit
+    return flags
+
+
+def _veg_flags(values: pd.Series) -> np.ndarray:
+    if values.dtype == bool:
+        return values.to_numpy()
+    text = values.astype("string").str.strip().str.lower()
+    return text.isin(TRUE_STRINGS).fillna(False).to_numpy(dtype=bool)
+
+
+def clean_chunk(chunk: pd.DataFrame, mapping: dict, per_100g: bool = False,
+                default_meal_types: list = None) -> tuple:
+    """Normalize one source chunk to catalog columns and drop invalid rows.
+
+    Returns (columns dict for CatalogWriter.append, dedupe keys, n_invalid).
+    Rows need a name, finite non-negative nutrients, positive calories and
+    macros that roughly agree with the calories. With per_100g, nutrients
+    are given per 100 g and are scaled to one serving of qty grams.
+    """
+    default_meal_types = default_meal_types or MEAL_TYPES
+    unknown = set(default_meal_types) - set(MEAL_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown meal types: {', '.join(sorted(unknown))}")
+    n = len(chunk)
+
+    def get(field, default=None):
+        if field in mapping:
+            return chunk[mapping[field]].reset_index(drop=True)
+        return pd.Series([default] * n, dtype=object)
+
+    names = get("name").astype("string").str.strip()
+    nutrients = {f: pd.to_numeric(get(f), errors="coerce").to_numpy(dtype=np.float64)
+                 for f in NUTRIENTS}
+    qty = pd.to_numeric(get("qty", 100.0 if per_100g else 1.0), errors="coerce")
+    qty = qty.fillna(100.0 if per_100g else 1.0).to_numpy(dtype=np.float64)
+    if per_100g:
+        for f in NUTRIENTS:
+            nutrients[f] = nutrients[f] * qty / 100.0
+
+    stacked = np.stack([nutrients[f] for f in NUTRIENTS], axis=1)
+    macro_kcal = 4 * nutrients["protein"] + 4 * nutrients["carbs"] + 9 * nutrients["fat"]
+    valid = (
+        names.fillna("").str.len().gt(0).to_numpy()
+        & np.isfinite(stacked).all(axis=1)
+        & (stacked >= 0).all(axis=1)
+        & (nutrients["cal"] > 0)
+        & (qty > 0)
+        & (macro_kcal <= nutrients["cal"] * MACRO_ENERGY_SLACK + 10)
+    )
+
+    units = get("unit", "g" if per_100g else "servings").astype("string").fillna("")
+    units = units.str.strip().replace("", "g" if per_100g else "servings")
+    servings = get("serving").astype("string").fillna("").str.strip()
+    servings = servings.mask(servings == "", pd.Series(qty).round(1).astype(str) + " " + units)
+
+    flags = _meal_flags(get("meal_types", ""), default_meal_types)
+    flags[_veg_flags(get("veg", False))] |= VEG_BIT
+
+    keep = np.flatnonzero(valid)
+    columns = {
+        "names": names.iloc[keep].tolist(),
+        "servings": servings.iloc[keep].tolist(),
+        "units": units.iloc[keep].tolist(),
+        **{f: nutrients[f][keep] for f in NUTRIENTS},
+        "qty": qty[keep],
+        "flags": flags[keep],
+    }
+    keys = [dedupe_key(name) for name in columns["names"]]
+    return columns, keys, n - len(keep)
+
+
+def _take(columns: dict, rows: list) -> dict:
+    return {
+        col: [values[i] for i in rows] if isinstance(values, list) else values[rows]
+        for col, values in columns.items()
+    }
+
+
+def ingest(sources: list, out_path: str, include_bundled: bool = True, per_100g: bool = False,
+           default_meal_types: list = None, chunk_rows: int = CHUNK_ROWS, swaps: bool = True) -> dict:
+    """Stream CSV/JSON food tables into a catalog directory at out_path.
+
+    Sources are read chunk by chunk, cleaned with clean_chunk and written as
+    they go; the first row wins when names repeat (ignoring case and
+    spacing). The bundled FOODS come first unless include_bundled is False,
+    so their curated meal types win over imported rows. With swaps, the
+    food swap tables are then built and saved in the catalog too, so the
+    app only has to load them. Returns counts of rows read, written,
+    invalid and duplicate.
+    """
+    stats = {"read": 0, "written": 0, "invalid": 0, "duplicates": 0}
+    seen = set()
+    writer = CatalogWriter(out_path)
+
+    def write(columns, keys):
+        fresh = []
+        for i, key in enumerate(keys):
+            if key not in seen:
+                seen.add(key)
+                fresh.append(i)
+        stats["duplicates"] += len(keys) - len(fresh)
+        stats["written"] += len(fresh)
+        writer.append(**_take(columns, fresh))
+
+    try:
+        if include_bundled:
+            bundled = catalog_columns(FoodCatalog(FOODS))
+            write(bundled, [dedupe_key(name) for name in bundled["names"]])
+
+        for path in sources:
+            mapping = None
+            for chunk in read_chunks(path, chunk_rows):
+                mapping = mapping or _resolve_columns(chunk.columns)
+                columns, keys, n_invalid = clean_chunk(chunk, mapping, per_100g, default_meal_types)
+                stats["read"] += len(chunk)
+                stats["invalid"] += n_invalid
+                write(columns, keys)
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close()
+    if swaps:
+        write_tables(SubstitutionTable(open_catalog(out_path)), out_path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import food tables into a Smart Diet Planner catalog")
+    parser.add_argument("sources", nargs="+", help="CSV, JSON or JSON Lines files")
+    parser.add_argument("-o", "--out", default=os.path.join("data", "catalog"), help="catalog directory")
+    parser.add_argument("--per-100g", action="store_true", help="nutrients are per 100 g of qty")
+    parser.add_argument("--no-bundled", action="store_true", help="leave out the built-in foods")
+    parser.add_argument("--no-swaps", action="store_true",
+                        help="skip the food swap tables; the app then builds them at startup")
+    parser.add_argument("--meal-types", default=",".join(MEAL_TYPES),
+                        help="meal types for rows that do not list any")
+    args = parser.parse_args()
+
+    stats = ingest(
+        args.sources, args.out, include_bundled=not args.no_bundled, per_100g=args.per_100g,
+        default_meal_types=[m for m in args.meal_types.split(",") if m], swaps=not args.no_swaps,
+    )
+    print(stats)
+    print(f"Set SMART_DIET_CATALOG={args.out} to plan from this catalog.")
+
+
+if __name__ == "__main__":
+    main()
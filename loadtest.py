@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from service import HOST, PORT
+
+
+def plan_bodies(n_unique: int, seed: int = 0) -> list:
+    """n_unique distinct /plan requests; fewer distinct bodies means more coalescing."""
+    rng = random.Random(seed)
+    return [
+        json.dumps({
+            "total_calories": rng.choice([1600, 1800, 2000, 2200, 2500]),
+            "veg_only": rng.random() < 0.5,
+            "seeds": {meal: rng.randint(0, 1_000_000) for meal in ["breakfast", "lunch", "snack", "dinner"]},
+        }).encode()
+        for _ in range(n_unique)
+    ]
+
+
+async def _request(reader, writer, host: str, path: str, body: bytes) -> int:
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(lines[0].split(" ", 2)[1])
+
+
+async def run_load(host: str = HOST, port: int = PORT, path: str = "/plan", bodies: list = None,
+                   n_requests: int = 1000, concurrency: int = 32) -> dict:
+    """Send n_requests POSTs over `concurrency` keep-alive connections.
+
+    Bodies are picked at random. Returns latency percentiles (ms) of the
+    successful requests, successful requests per second and counts per
+    status; refused requests (503) come back fast and would hide the real
+    latency if they were mixed in.
+    """
+    bodies = bodies or plan_bodies(50)
+    latencies = np.full(n_requests, np.nan)
+    statuses = Counter()
+    next_request = iter(range(n_requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in next_request:
+                start = time.perf_counter()
+                status = await _request(reader, writer, host, path, random.choice(bodies))
+                if status == 200:
+                    latencies[i] = time.perf_counter() - start
+                statuses[status] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = latencies[~np.isnan(latencies)] * 1000
+    if not len(ms):
+        ms = np.full(1, np.nan)
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "ok_per_s": round(statuses[200] / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "statuses": dict(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the plan service")
+    parser.add_argument("--url", default=f"http://{HOST}:{PORT}/plan")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("--unique", type=int, default=50, help="distinct request bodies to cycle")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    result = asyncio.run(run_load(
+        url.hostname, url.port or 80, url.path or "/plan", plan_bodies(args.unique),
+        args.requests, args.concurrency,
+    ))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Off unless SMART_DIET_METRICS is set. Read once at import: with it off,
+# timed() hands back the function itself and span() a shared no-op, so the
+# instrumented code runs exactly as before.
+ENABLED = os.environ.get("SMART_DIET_METRICS", "") not in ("", "0")
+
+# Chrome trace (JSON array format, open in Perfetto or chrome://tracing) and
+# OpenMetrics text, both under DATA_DIR unless overridden
+TRACE_FILE = os.environ.get("SMART_DIET_TRACE_FILE", "trace.json")
+METRICS_FILE = os.environ.get("SMART_DIET_METRICS_FILE", "metrics.txt")
+
+_lock = threading.Lock()
+_totals = {}    # span name -> [calls, seconds], for the life of the process
+_counters = {}  # counter name -> count
+_local = threading.local()  # spans of the rerun running on this thread
+
+
+def _record(name: str, start: float, end: float):
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        spans.append((name, start, end))
+    with _lock:
+        total = _totals.setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += end - start
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.start, time.perf_counter())
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Context manager that times its block as name."""
+    return _Span(name) if ENABLED else _NO_SPAN
+
+
+def timed(fn):
+    """Time every call of fn as "module.function"."""
+    if not ENABLED:
+        return fn
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _record(name, start, time.perf_counter())
+    return wrapper
+
+
+def count(name: str, n: int = 1):
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+# ------------- RERUNS -------------
+
+def begin_rerun():
+    """Start collecting spans for the script run on this thread."""
+    if ENABLED:
+        _local.spans = []
+        _local.start = time.perf_counter()
+
+
+def end_rerun() -> list:
+    """Finish the current run: append its spans to the trace, rewrite the
+    metrics file and return the run's breakdown (see breakdown())."""
+    spans = getattr(_local, "spans", None)
+    if not ENABLED or spans is None:
+        return []
+    _local.spans = None
+    end = time.perf_counter()
+    _record("rerun", _local.start, end)
+    spans.append(("rerun", _local.start, end))
+    write_trace(spans)
+    write_openmetrics()
+    return breakdown(spans)
+
+
+def breakdown(spans: list) -> list:
+    """Calls and time per span name, in order of first use.
+
+    Each row is {"span", "calls", "ms", "share"}; share is the fraction of the
+    whole run, and nested spans also count towards their parents.
+    """
+    run = max((end for _, _, end in spans), default=0.0) - min((s for _, s, _ in spans), default=0.0)
+    rows = {}
+    for name, start, end in spans:
+        row = rows.setdefault(name, {"span": name, "calls": 0, "ms": 0.0})
+        row["calls"] += 1
+        row["ms"] += (end - start) * 1000
+    for row in rows.values():
+        row["ms"] = round(row["ms"], 3)
+        row["share"] = round(row["ms"] / (run * 1000), 3) if run else 0.0
+    return list(rows.values())
+
+
+# ------------- EXPORT -------------
+
+def _path(name: str) -> str:
+    from utils import DATA_DIR, ensure_data_dir
+
+    if os.path.dirname(name):
+        return name
+    ensure_data_dir()
+    return os.path.join(DATA_DIR, name)
+
+
+def write_trace(spans: list, path: str = None):
+    """Append spans as Chrome trace complete events ("ph": "X").
+
+    The file is a JSON array left open at the end, which trace viewers
+    accept, so every run is appended without rewriting earlier ones.
+    """
+    path = _path(path or TRACE_FILE)
+    pid, tid = os.getpid(), threading.get_ident()
+    lines = [
+        json.dumps({
+            "name": name, "cat": name.split(".", 1)[0], "ph": "X", "pid": pid, "tid": tid,
+            "ts": round(start * 1e6, 1), "dur": round((end - start) * 1e6, 1),
+        }) + ",\n"
+        for name, start, end in spans
+    ]
+    with _lock:
+        new = not os.path.exists(path)
+        with open(path, "a") as f:
+            if new:
+                f.write("[\n")
+            f.writelines(lines)
+
+
+def openmetrics() -> str:
+    """Span totals and counters in the OpenMetrics text format."""
+    with _lock:
+        totals = {name: list(total) for name, total in _totals.items()}
+        counters = dict(_counters)
+    lines = [
+        "# TYPE smart_diet_span_seconds summary",
+        "# UNIT smart_diet_span_seconds seconds",
+        "# HELP smart_diet_span_seconds Time spent in instrumented functions and blocks.",
+    ]
+    for name, (calls, seconds) in sorted(totals.items()):
+        lines.append(f'smart_diet_span_seconds_count{{span="{name}"}} {calls}')
+        lines.append(f'smart_diet_span_seconds_sum{{span="{name}"}} {seconds:.6f}')
+    lines += [
+        "# TYPE smart_diet_events counter",
+        "# HELP smart_diet_events Instrumentation counters, e.g. cache hits and misses.",
+    ]
+    for name, n in sorted(counters.items()):
+        lines.append(f'smart_diet_events_total{{event="{name}"}} {n}')
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_openmetrics(path: str = None):
+    path = _path(path or METRICS_FILE)
+    # Every rerun writes this, so concurrent sessions each need their own temp file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(openmetrics())
+    os.replace(tmp, path)
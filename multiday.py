@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from foods import CATALOG, MEAL_RATIOS, PLAN_COLUMNS, fill_meal
+
+# A food served on day d is kept off the menu until day d + NO_REPEAT_DAYS + 1
+NO_REPEAT_DAYS = 2
+
+MAX_DAYS = 28
+
+# Candidates drawn per meal and day; larger pools (imported catalogs) are
+# sampled instead of shuffled whole. Covers the optimizer's POOL_SIZE.
+MAX_CANDIDATES = 64
+
+# The optimizer scores its whole pool, so it only sees foods outside their
+# window unless fewer than this many are left
+MIN_FRESH = 4
+
+
+def _per_day(value, n_days: int) -> list:
+    """Broadcast a scalar (or dict) target to n_days, or check a per-day list."""
+    if isinstance(value, (list, tuple, np.ndarray, pd.Series)):
+        value = list(value)
+        if len(value) != n_days:
+            raise ValueError(f"Expected {n_days} per-day targets, got {len(value)}")
+        return value
+    return [value] * n_days
+
+
+def candidate_pools(veg_only: bool) -> dict:
+    """Catalog ids per meal, looked up once and shared by every day of a plan."""
+    return {meal: CATALOG.indices(meal, veg_only) for meal in MEAL_RATIOS}
+
+
+def _day_pools(pools: dict, last_used: np.ndarray, day: int, no_repeat_days: int, rng) -> tuple:
+    """Each meal's candidates for one day, in preference order.
+
+    Foods outside their no-repeat window come first in a random order. Foods
+    still inside it follow, least recently served first, so small pools
+    repeat as late as possible instead of leaving meals empty. Returns
+    ({meal: ids}, {meal: number of fresh ids at the front}).
+    """
+    cutoff = day - no_repeat_days
+    ordered, n_fresh = {}, {}
+    for meal, ids in pools.items():
+        if len(ids) > MAX_CANDIDATES:
+            order = rng.choice(ids, MAX_CANDIDATES, replace=False)
+        else:
+            order = rng.permutation(ids)
+        last = last_used[order]
+        fresh = last < cutoff
+        stale = order[~fresh][np.argsort(last[~fresh], kind="stable")]
+        ordered[meal] = np.concatenate([order[fresh], stale])
+        n_fresh[meal] = int(fresh.sum())
+    return ordered, n_fresh
+
+
+def build_multi_day_plan(n_days: int, total_calories, veg_only: bool, seed: int = None,
+                         no_repeat_days: int = NO_REPEAT_DAYS, mode: str = "greedy",
+                         macros=None) -> pd.DataFrame:
+    """Plan n_days of meals in one pass, with no food repeated inside its window.
+
+    total_calories and macros may be one value for every day or a list with
+    one entry per day. Each meal uses the greedy fill of
+    foods.generate_meal, or the macro optimizer when mode="optimize" (days
+    where it runs out of time fall back to greedy). Returns the usual plan
+    columns with a leading 1-based "day" column.
+    """
+    if not 1 <= n_days <= MAX_DAYS:
+        raise ValueError(f"n_days must be between 1 and {MAX_DAYS}")
+    calories = _per_day(total_calories, n_days)
+    day_macros = _per_day(macros, n_days)
+
+    rng = np.random.default_rng(seed)
+    pools = candidate_pools(veg_only)
+    last_used = np.full(len(CATALOG), -(MAX_DAYS + no_repeat_days + 1), dtype=np.int64)
+
+    rows = []
+    for day in range(n_days):
+        day_pools, n_fresh = _day_pools(pools, last_used, day, no_repeat_days, rng)
+
+        items = None
+        if mode == "optimize":
+            from optimizer import optimize_day_plan
+            opt_pools = {
+                meal: ids[:n_fresh[meal]] if n_fresh[meal] >= MIN_FRESH else ids
+                for meal, ids in day_pools.items()
+            }
+            items = optimize_day_plan(calories[day], veg_only, {}, day_macros[day], pools=opt_pools)
+        if items is None:
+            items = []
+            for meal, ratio in MEAL_RATIOS.items():
+                items.extend(fill_meal(meal, day_pools[meal].tolist(), calories[day] * ratio))
+
+        # Only the day's candidates can have been picked
+        ids_by_name = {CATALOG.names[i]: i for ids in day_pools.values() for i in ids}
+        last_used[[ids_by_name[item["food"]] for item in items]] = day
+        rows.extend({"day": day + 1, **item} for item in items)
+
+    return pd.DataFrame(rows, columns=["day"] + PLAN_COLUMNS)
+
+
+def repeat_gaps(plan_df: pd.DataFrame) -> pd.Series:
+    """Smallest gap in days between two servings of each repeated food."""
+    days = plan_df[["food", "day"]].drop_duplicates().sort_values(["food", "day"])
+    gaps = days.groupby("food")["day"].diff().dropna()
+    return gaps.groupby(days.loc[gaps.index, "food"]).min()
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from rounding import round_like_python
+from utils import ACTIVITY_MULTIPLIERS
+
+# Array versions of the utils nutrition formulas for cohort-sized inputs.
+# Each takes NumPy arrays or pandas Series (scalars broadcast) and returns
+# what the matching utils function gives row by row. Gender, activity level
+# and goal may be labels or integer codes into GENDERS, ACTIVITY_LEVELS, GOALS.
+
+GENDERS = ["Male", "Female", "Other"]
+ACTIVITY_LEVELS = list(ACTIVITY_MULTIPLIERS)
+GOALS = ["Lose weight", "Maintain weight", "Gain weight"]
+BMI_CATEGORIES = ["Underweight", "Normal", "Overweight", "Obese", "Invalid height"]
+
+# Multiplier per activity code, with the unknown-level default in the last slot
+_MULTIPLIERS = np.array(list(ACTIVITY_MULTIPLIERS.values()) + [1.2])
+_GOAL_OFFSETS = np.array([-500.0, 0.0, 300.0, 0.0])
+
+
+def _codes(values, categories: list, lower: bool = False) -> np.ndarray:
+    """Integer codes for labels; unknown labels get -1. Integer input passes through."""
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iu":
+        return arr.astype(np.int64)
+    labels = pd.Series(np.atleast_1d(arr), dtype=object).astype(str)
+    cats = categories
+    if lower:
+        labels = labels.str.lower()
+        cats = [c.lower() for c in categories]
+    codes = pd.Categorical(labels, categories=cats).codes.astype(np.int64)
+    return codes.reshape(arr.shape)
+
+
+def gender_codes(values) -> np.ndarray:
+    return _codes(values, GENDERS, lower=True)
+
+
+def activity_codes(values) -> np.ndarray:
+    return _codes(values, ACTIVITY_LEVELS)
+
+
+def goal_codes(values) -> np.ndarray:
+    return _codes(values, GOALS)
+
+
+def _float(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def _like(result, *inputs):
+    """Wrap result as a Series when any input was one, keeping its index."""
+    for x in inputs:
+        if isinstance(x, pd.Series):
+            return pd.Series(result, index=x.index)
+    return result
+
+
+def calculate_bmr(gender, weight_kg, height_cm, age):
+    male = gender_codes(gender) == 0
+    base = 10 * _float(weight_kg) + 6.25 * _float(height_cm) - 5 * _float(age)
+    return _like(np.where(male, base + 5, base - 161), gender, weight_kg, height_cm, age)
+
+
+def activity_multiplier(level):
+    codes = activity_codes(level)
+    codes = np.where((codes < 0) | (codes >= len(ACTIVITY_LEVELS)), len(ACTIVITY_LEVELS), codes)
+    return _like(_MULTIPLIERS[codes], level)
+
+
+def calorie_target(tdee, goal):
+    codes = goal_codes(goal)
+    codes = np.where((codes < 0) | (codes >= len(GOALS)), len(GOALS), codes)
+    return _like(_float(tdee) + _GOAL_OFFSETS[codes], tdee, goal)
+
+
+def macro_targets(weight_kg, calories) -> dict:
+    weight_kg_in, calories_in = weight_kg, calories
+    weight_kg = _float(weight_kg)
+    calories = _float(calories)
+    protein_g = 1.8 * weight_kg
+    protein_cal = protein_g * 4
+
+    fat_cal = 0.25 * calories
+    fat_g = fat_cal / 9
+
+    remaining_cal = calories - protein_cal - fat_cal
+    carbs_g = np.where(remaining_cal > 0, remaining_cal / 4, 0.0)
+
+    return {
+        "protein_g": _like(round_like_python(protein_g, 1), weight_kg_in),
+        "fat_g": _like(round_like_python(fat_g, 1), calories_in),
+        "carbs_g": _like(round_like_python(carbs_g, 1), weight_kg_in, calories_in),
+    }
+
+
+def bmi_and_category(weight_kg, height_cm):
+    """Returns (bmi, category) arrays; category holds the utils labels."""
+    height_m = _float(height_cm) / 100
+    valid = height_m > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmi = _float(weight_kg) / (height_m ** 2)
+    code = np.select([bmi < 18.5, bmi < 25, bmi < 30], [0, 1, 2], default=3)
+    code = np.where(valid, code, 4)
+    bmi = np.where(valid, round_like_python(np.where(valid, bmi, 0.0), 1), 0.0)
+    category = np.array(BMI_CATEGORIES, dtype=object)[code]
+    return _like(bmi, weight_kg, height_cm), _like(category, weight_kg, height_cm)
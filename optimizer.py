@@ -0,0 +1,170 @@
+import time
+import numpy as np
+
+from foods import CATALOG, MEAL_RATIOS, plan_item
+
+# Serving sizes the optimizer may pick for any food
+SERVING_STEPS = np.array([0.5, 1.0, 1.5, 2.0])
+
+# Error weights for [calories, protein, carbs, fat]; calories matter most
+WEIGHTS = np.array([4.0, 1.0, 1.0, 1.0])
+
+MAX_ITEMS_PER_MEAL = 4
+POOL_SIZE = 40
+TIME_BUDGET_MS = 50.0
+TOLERANCE = 0.10
+
+
+def _nutrients(ids: np.ndarray) -> np.ndarray:
+    return np.stack(
+        [CATALOG.cal[ids], CATALOG.protein[ids], CATALOG.carbs[ids], CATALOG.fat[ids]],
+        axis=1,
+    )
+
+
+def _optimize_meal(ids: np.ndarray, target: np.ndarray, weights: np.ndarray, deadline: float):
+    """Pick (food_id, servings) pairs from ids whose totals get close to target.
+
+    Every (food, serving step) pair is one option. Items are added greedily by
+    the option that lowers the weighted error most, then each slot is swapped
+    or dropped while that keeps improving. Each step scores all options at once.
+    Returns None if the deadline passes.
+    """
+    n_steps = len(SERVING_STEPS)
+    options = (_nutrients(ids)[:, None, :] * SERVING_STEPS[None, :, None]).reshape(-1, 4)
+    option_food = np.repeat(np.arange(len(ids)), n_steps)
+    option_serv = np.tile(SERVING_STEPS, len(ids))
+    scale = np.maximum(target, 1.0)
+
+    def error(totals):
+        return ((((totals - target) / scale) ** 2) * weights).sum(axis=-1)
+
+    chosen = []
+    totals = np.zeros(4)
+    best = error(totals)
+
+    for _ in range(MAX_ITEMS_PER_MEAL):
+        if time.perf_counter() > deadline:
+            return None
+        scores = error(totals + options)
+        scores[np.isin(option_food, option_food[chosen])] = np.inf
+        j = int(np.argmin(scores))
+        if scores[j] >= best:
+            break
+        chosen.append(j)
+        totals = totals + options[j]
+        best = scores[j]
+
+    improved = True
+    while improved and chosen:
+        improved = False
+        for k in range(len(chosen)):
+            if time.perf_counter() > deadline:
+                return None
+            base = totals - options[chosen[k]]
+            others = chosen[:k] + chosen[k + 1:]
+            if error(base) < best:
+                chosen, totals, best = others, base, error(base)
+                improved = True
+                break
+            scores = error(base + options)
+            scores[np.isin(option_food, option_food[others])] = np.inf
+            j = int(np.argmin(scores))
+            if scores[j] < best:
+                chosen[k] = j
+                totals = base + options[j]
+                best = scores[j]
+                improved = True
+
+    return [(int(ids[option_food[j]]), float(option_serv[j])) for j in chosen]
+
+
+def _target_vector(calories: float, macros: dict = None) -> np.ndarray:
+    macros = macros or {}
+    return np.array([
+        calories,
+        macros.get("protein_g", 0.0),
+        macros.get("carbs_g", 0.0),
+        macros.get("fat_g", 0.0),
+    ], dtype=np.float64)
+
+
+def _pool(ids: np.ndarray, seed) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    if len(ids) > POOL_SIZE:
+        return rng.choice(ids, POOL_SIZE, replace=False)
+    return rng.permutation(ids)
+
+
+def optimize_meal(meal_type: str, meal_calories: float, veg_only: bool, seed: int = None,
+                  macros: dict = None, time_budget_ms: float = TIME_BUDGET_MS):
+    """Plan items for one meal aimed at its calorie and macro share.
+
+    macros are the meal's own targets, not the day's. Returns None when the
+    time budget runs out.
+    """
+    deadline = time.perf_counter() + time_budget_ms / 1000.0
+    ids = CATALOG.indices(meal_type, veg_only)
+    if len(ids) == 0:
+        return []
+    target = _target_vector(meal_calories, macros)
+    picks = _optimize_meal(_pool(ids, seed), target, WEIGHTS * (target > 0), deadline)
+    if picks is None:
+        return None
+    return [plan_item(meal_type, food_id, servings) for food_id, servings in picks]
+
+
+def within_tolerance(totals: dict, total_calories: float, macros: dict = None,
+                     tolerance: float = TOLERANCE) -> bool:
+    targets = {"calories": total_calories}
+    if macros:
+        targets.update(macros)
+    for key, target in targets.items():
+        if target > 0 and abs(totals.get(key, 0) - target) > tolerance * target:
+            return False
+    return True
+
+
+def optimize_day_plan(total_calories: float, veg_only: bool, seeds: dict, macros: dict = None,
+                      time_budget_ms: float = TIME_BUDGET_MS, pools: dict = None):
+    """Build a full day of plan items aimed at calorie and macro targets.
+
+    Meals are solved in order, and each meal aims at its share of whatever
+    the earlier meals left over, so a protein-light breakfast is made up
+    later in the day. Seeds choose each meal's candidate pool, so
+    regenerating one meal still changes it; pools ({meal: ids in preference
+    order}) overrides that choice. Returns None when the time budget runs
+    out so the caller can fall back to the greedy fill.
+    """
+    deadline = time.perf_counter() + time_budget_ms / 1000.0
+    day_target = _target_vector(total_calories, macros)
+    # Without macro targets only calories are scored
+    weights = WEIGHTS * (day_target > 0)
+
+    items = []
+    remaining = day_target.copy()
+    ratio_left = sum(MEAL_RATIOS.values())
+
+    for meal, ratio in MEAL_RATIOS.items():
+        if pools is not None:
+            ids = np.asarray(pools.get(meal, []), dtype=np.intp)[:POOL_SIZE]
+        else:
+            ids = CATALOG.indices(meal, veg_only)
+        meal_target = np.maximum(remaining * (ratio / ratio_left), 0.0)
+        ratio_left -= ratio
+        if len(ids) == 0:
+            continue
+
+        pool = ids if pools is not None else _pool(ids, seeds.get(meal))
+        picks = _optimize_meal(pool, meal_target, weights, deadline)
+        if picks is None:
+            return None
+
+        for food_id, servings in picks:
+            item = plan_item(meal, food_id, servings)
+            items.append(item)
+            remaining -= np.array([
+                item["calories"], item["protein_g"], item["carbs_g"], item["fat_g"],
+            ])
+
+    return items
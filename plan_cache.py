@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import tempfile
+from typing import TYPE_CHECKING
+
+import foods
+from cache import LRUCache
+from foods import MEAL_RATIOS, build_full_day_plan
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Calorie targets are rounded to this many kcal so nearby targets share plans
+BUCKET_KCAL = float(os.environ.get("SMART_DIET_PLAN_BUCKET", 25))
+
+# Set to a directory to keep plans across restarts; empty disables the disk tier
+DISK_DIR = os.environ.get("SMART_DIET_PLAN_CACHE_DIR", "")
+
+NUMERIC_COLUMNS = ["servings", "calories", "protein_g", "carbs_g", "fat_g"]
+
+PLANS = LRUCache(int(os.environ.get("SMART_DIET_PLAN_CACHE_SIZE", 1024)))
+
+_disk_stats = {"disk_hits": 0, "disk_misses": 0, "disk_writes": 0}
+
+
+def quantize(total_calories: float, bucket: float = None) -> float:
+    bucket = bucket or BUCKET_KCAL
+    return round(total_calories / bucket) * bucket
+
+
+def plan_key(total_calories: float, veg_only: bool, seeds: dict, mode: str = "greedy",
+             macros: dict = None, bucket: float = None) -> tuple:
+    seed_part = tuple(seeds.get(meal) for meal in MEAL_RATIOS)
+    macro_part = ()
+    if mode == "optimize" and macros:
+        macro_part = tuple(round(macros.get(k, 0.0)) for k in ("protein_g", "carbs_g", "fat_g"))
+    # Plans name catalog foods, so a changed catalog must not reuse them (even from disk)
+    return ("plan", quantize(total_calories, bucket), bool(veg_only), seed_part, mode, macro_part,
+            foods.CATALOG.fingerprint())
+
+
+def _disk_path(key: tuple, disk_dir: str) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(disk_dir, f"{digest}.json")
+
+
+def _read_disk(key: tuple, disk_dir: str):
+    import pandas as pd
+
+    path = _disk_path(key, disk_dir)
+    try:
+        with open(path, "r") as f:
+            df = pd.read_json(io.StringIO(f.read()), orient="split", precise_float=True)
+    except (OSError, ValueError):
+        return None
+    return df.astype({col: float for col in NUMERIC_COLUMNS})
+
+
+def _write_disk(key: tuple, df: pd.DataFrame, disk_dir: str):
+    os.makedirs(disk_dir, exist_ok=True)
+    # A temp file of its own, so sessions writing the same plan never share one
+    fd, tmp = tempfile.mkstemp(dir=disk_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(df.to_json(orient="split", index=False, double_precision=15))
+    os.replace(tmp, _disk_path(key, disk_dir))
+
+
+def cached_full_day_plan(total_calories: float, veg_only: bool, seeds: dict, mode: str = "greedy",
+                         macros: dict = None, bucket: float = None, disk_dir: str = None) -> pd.DataFrame:
+    """build_full_day_plan with a memory LRU and an optional on-disk tier.
+
+    The plan is built for the bucketed calorie target, so every target in the
+    same bucket gets the same plan. Callers always get their own copy, so
+    editing it never changes what is cached.
+    """
+    disk_dir = DISK_DIR if disk_dir is None else disk_dir
+    key = plan_key(total_calories, veg_only, seeds, mode, macros, bucket)
+
+    df = PLANS.get(key)
+    if df is None and disk_dir:
+        df = _read_disk(key, disk_dir)
+        _disk_stats["disk_hits" if df is not None else "disk_misses"] += 1
+        if df is not None:
+            PLANS.put(key, df)
+    if df is None:
+        df = build_full_day_plan(key[1], veg_only, seeds, mode=mode, macros=macros)
+        PLANS.put(key, df)
+        if disk_dir:
+            _write_disk(key, df, disk_dir)
+            _disk_stats["disk_writes"] += 1
+    return df.copy()
+
+
+def stats() -> dict:
+    return {**PLANS.stats(), **_disk_stats}
+
+
+def clear():
+    PLANS.clear()
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+
+import db
+from utils import DATA_DIR
+
+DB_FILE = os.path.join(DATA_DIR, "profiles.db")
+LEGACY_FILE = os.path.join(DATA_DIR, "users.json")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY, data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY, value TEXT
+);
+"""
+
+_migrated = set()
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    path = path or DB_FILE
+    conn = db.connect(path, _SCHEMA)
+    if path not in _migrated:
+        migrate_users_json(conn)
+        _migrated.add(path)
+    return conn
+
+
+def migrate_users_json(conn: sqlite3.Connection, legacy_file: str = LEGACY_FILE):
+    """Import the legacy users.json once; later calls are no-ops."""
+    if not os.path.exists(legacy_file):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT 1 FROM meta WHERE key = 'users_json_migrated'").fetchone()
+        if not done:
+            with open(legacy_file, "r") as f:
+                users = json.load(f)
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)",
+                [(name, json.dumps(user)) for name, user in users.items()],
+            )
+            conn.execute("INSERT INTO meta VALUES ('users_json_migrated', '1')")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def usernames() -> list:
+    rows = connect().execute("SELECT username FROM users ORDER BY rowid").fetchall()
+    return [r[0] for r in rows]
+
+
+def get(username: str):
+    row = connect().execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def insert(username: str, user: dict) -> bool:
+    """Add a new profile; returns False if the username is already taken."""
+    try:
+        connect().execute(
+            "INSERT INTO users (username, data) VALUES (?, ?)", (username, json.dumps(user))
+        )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def load_all() -> dict:
+    rows = connect().execute("SELECT username, data FROM users ORDER BY rowid").fetchall()
+    return {name: json.loads(data) for name, data in rows}
+
+
+def save_all(users: dict):
+    """Replace every stored profile with users, like rewriting users.json."""
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        stored = {name for (name,) in conn.execute("SELECT username FROM users")}
+        conn.executemany("DELETE FROM users WHERE username = ?", [(name,) for name in stored - users.keys()])
+        conn.executemany(
+            "INSERT INTO users (username, data) VALUES (?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET data = excluded.data",
+            [(name, json.dumps(user)) for name, user in users.items()],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
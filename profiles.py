@@ -1,40 +1,99 @@
 import json
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from utils import DATA_DIR, ensure_data_dir
+import profile_store
+from cache import cached, invalidate
+from metrics import timed
 
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 
+# "sqlite" keeps one row per profile in data/profiles.db; "json" keeps data/users.json
+BACKEND = os.environ.get("SMART_DIET_PROFILE_BACKEND", "sqlite")
 
-def load_users():
+try:
+    import fcntl
+except ImportError:  # Windows: the thread lock still covers writers in this process
+    fcntl = None
+
+_users_lock = threading.Lock()
+
+
+@contextmanager
+def _locked_users():
+    """Hold users.json for a read-modify-write, across threads and processes.
+
+    The lock is on a side file: users.json itself is replaced on every save.
+    """
     ensure_data_dir()
+    with _users_lock, open(f"{USERS_FILE}.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_users() -> dict:
     if not os.path.exists(USERS_FILE):
         return {}
     with open(USERS_FILE, "r") as f:
         return json.load(f)
 
 
-def save_users(users: dict):
-    ensure_data_dir()
-    with open(USERS_FILE, "w") as f:
+def _write_users(users: dict):
+    # Write to a temp file of our own and rename, so readers never see a half-written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(USERS_FILE) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
         json.dump(users, f, indent=2)
+    os.replace(tmp, USERS_FILE)
 
 
+@timed
+def load_users():
+    if BACKEND == "sqlite":
+        return profile_store.load_all()
+    ensure_data_dir()
+    return _read_users()
+
+
+@timed
+def save_users(users: dict):
+    invalidate("get_usernames")
+    invalidate("get_user")
+    if BACKEND == "sqlite":
+        profile_store.save_all(users)
+        return
+    with _locked_users():
+        _write_users(users)
+
+
+@timed
+@cached("get_usernames")
 def get_usernames():
+    if BACKEND == "sqlite":
+        return profile_store.usernames()
     users = load_users()
     return list(users.keys())
 
 
+@timed
+@cached("get_user")
 def get_user(username: str):
+    if BACKEND == "sqlite":
+        return profile_store.get(username)
     users = load_users()
     return users.get(username)
 
 
+@timed
 def create_user(username: str, name: str, age: int, gender: str, height_cm: float, veg_default: bool):
-    users = load_users()
-    if username in users:
-        raise ValueError("Username already exists")
-    users[username] = {
+    user = {
         "username": username,
         "name": name,
         "age": age,
@@ -43,6 +102,19 @@ def create_user(username: str, name: str, age: int, gender: str, height_cm: floa
         "veg_default": veg_default,
         "created_at": datetime.now().isoformat(),
     }
-    save_users(users)
-    return users[username]
-
+    if BACKEND == "sqlite":
+        if not profile_store.insert(username, user):
+            raise ValueError("Username already exists")
+        invalidate("get_usernames")
+        invalidate("get_user", username)
+        return user
+    # Read, add and write under one lock, so simultaneous sign-ups all land
+    with _locked_users():
+        users = _read_users()
+        if username in users:
+            raise ValueError("Username already exists")
+        users[username] = user
+        _write_users(users)
+    invalidate("get_usernames")
+    invalidate("get_user")
+    return user
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING
+
+import db
+from utils import DATA_DIR
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+DB_FILE = os.path.join(DATA_DIR, "rollups.db")
+
+PERIODS = ["day", "week", "month"]
+
+# Actual calories within this fraction of target count as an on-target entry
+ADHERENCE_TOLERANCE = 0.10
+
+MAX_CHART_POINTS = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weight_rollup (
+    username TEXT NOT NULL, period TEXT NOT NULL, bucket TEXT NOT NULL,
+    n INTEGER NOT NULL, total REAL NOT NULL, low REAL NOT NULL, high REAL NOT NULL,
+    PRIMARY KEY (username, period, bucket)
+);
+CREATE TABLE IF NOT EXISTS calorie_rollup (
+    username TEXT NOT NULL, period TEXT NOT NULL, bucket TEXT NOT NULL,
+    n INTEGER NOT NULL, target_total REAL NOT NULL, actual_total REAL NOT NULL,
+    on_target INTEGER NOT NULL,
+    PRIMARY KEY (username, period, bucket)
+);
+CREATE TABLE IF NOT EXISTS backfilled (
+    kind TEXT NOT NULL, username TEXT NOT NULL, PRIMARY KEY (kind, username)
+);
+"""
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    return db.connect(path or DB_FILE, _SCHEMA)
+
+
+def bucket_start(day: str, period: str) -> str:
+    d = datetime.strptime(day, "%Y-%m-%d").date()
+    if period == "week":
+        d = d - timedelta(days=d.weekday())
+    elif period == "month":
+        d = d.replace(day=1)
+    return d.isoformat()
+
+
+def _bucket_starts(dates: pd.Series, period: str) -> pd.Series:
+    import pandas as pd
+
+    d = pd.to_datetime(dates)
+    if period == "week":
+        d = d - pd.to_timedelta(d.dt.weekday, unit="D")
+    elif period == "month":
+        d = d.dt.to_period("M").dt.start_time
+    return d.dt.strftime("%Y-%m-%d")
+
+
+def _on_target(target: float, actual: float) -> int:
+    return int(target > 0 and abs(actual - target) <= ADHERENCE_TOLERANCE * target)
+
+
+def _is_backfilled(conn, kind: str, username: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM backfilled WHERE kind = ? AND username = ?", (kind, username)
+    ).fetchone() is not None
+
+
+# ------------- INCREMENTAL UPDATES -------------
+
+def record_weight(username: str, day: str, weight: float):
+    """Fold one saved weight into the day/week/month rollups."""
+    conn = connect()
+    if not _is_backfilled(conn, "weight", username):
+        backfill_weight(username)
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for period in PERIODS:
+            conn.execute(
+                "INSERT INTO weight_rollup VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (username, period, bucket) DO UPDATE SET "
+                "n = n + 1, total = total + excluded.total, "
+                "low = MIN(low, excluded.low), high = MAX(high, excluded.high)",
+                (username, period, bucket_start(day, period), weight, weight, weight),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def record_calories(username: str, day: str, target: float, actual: float):
+    """Fold one saved calorie summary into the day/week/month rollups."""
+    conn = connect()
+    if not _is_backfilled(conn, "calories", username):
+        backfill_calories(username)
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for period in PERIODS:
+            conn.execute(
+                "INSERT INTO calorie_rollup VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (username, period, bucket) DO UPDATE SET "
+                "n = n + 1, target_total = target_total + excluded.target_total, "
+                "actual_total = actual_total + excluded.actual_total, "
+                "on_target = on_target + excluded.on_target",
+                (username, period, bucket_start(day, period), target, actual,
+                 _on_target(target, actual)),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# ------------- BACKFILL -------------
+
+def _replace_rollups(kind: str, table: str, username: str, rows: list):
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DELETE FROM {table} WHERE username = ?", (username,))
+        if rows:
+            marks = ", ".join("?" for _ in rows[0])
+            conn.executemany(f"INSERT INTO {table} VALUES ({marks})", rows)
+        conn.execute("INSERT OR IGNORE INTO backfilled VALUES (?, ?)", (kind, username))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def backfill_weight(username: str):
+    """Rebuild a user's weight rollups from full history; run once per user."""
+    from tracking import load_weight
+
+    df = load_weight(username).dropna(subset=["date", "weight"])
+    rows = []
+    for period in PERIODS:
+        g = df.groupby(_bucket_starts(df["date"], period))["weight"].agg(["count", "sum", "min", "max"])
+        rows += [
+            (username, period, bucket, int(n), float(total), float(low), float(high))
+            for bucket, n, total, low, high in g.itertuples()
+        ]
+    _replace_rollups("weight", "weight_rollup", username, rows)
+
+
+def backfill_calories(username: str):
+    """Rebuild a user's calorie rollups from full history; run once per user."""
+    from tracking import load_calories
+
+    df = load_calories(username).dropna(subset=["date", "target_cal", "actual_cal"])
+    df = df.assign(on_target=(
+        (df["target_cal"] > 0)
+        & ((df["actual_cal"] - df["target_cal"]).abs() <= ADHERENCE_TOLERANCE * df["target_cal"])
+    ).astype(int))
+    rows = []
+    for period in PERIODS:
+        g = df.groupby(_bucket_starts(df["date"], period)).agg(
+            n=("date", "count"), target=("target_cal", "sum"),
+            actual=("actual_cal", "sum"), on_target=("on_target", "sum"),
+        )
+        rows += [
+            (username, period, bucket, int(n), float(target), float(actual), int(hit))
+            for bucket, n, target, actual, hit in g.itertuples()
+        ]
+    _replace_rollups("calories", "calorie_rollup", username, rows)
+
+
+# ------------- QUERIES -------------
+
+def _ensure_backfilled(kind: str, username: str):
+    if not _is_backfilled(connect(), kind, username):
+        (backfill_weight if kind == "weight" else backfill_calories)(username)
+
+
+def _range_sql(start, end) -> tuple:
+    where, params = "", []
+    if start is not None:
+        where += " AND bucket >= ?"
+        params.append(start)
+    if end is not None:
+        where += " AND bucket <= ?"
+        params.append(end)
+    return where, params
+
+
+def weight_rollup(username: str, period: str, start: str = None, end: str = None) -> pd.DataFrame:
+    """Per-bucket weight stats: date (bucket start), weight (mean), weight_min, weight_max, count."""
+    import pandas as pd
+
+    _ensure_backfilled("weight", username)
+    if start is not None:
+        start = bucket_start(start, period)
+    where, params = _range_sql(start, end)
+    rows = connect().execute(
+        "SELECT bucket, total / n, low, high, n FROM weight_rollup "
+        f"WHERE username = ? AND period = ?{where} ORDER BY bucket",
+        (username, period, *params),
+    ).fetchall()
+    return pd.DataFrame(rows, columns=["date", "weight", "weight_min", "weight_max", "count"])
+
+
+def calorie_rollup(username: str, period: str, start: str = None, end: str = None) -> pd.DataFrame:
+    """Per-bucket calorie sums with adherence (share of entries within tolerance of target)."""
+    import pandas as pd
+
+    _ensure_backfilled("calories", username)
+    if start is not None:
+        start = bucket_start(start, period)
+    where, params = _range_sql(start, end)
+    rows = connect().execute(
+        "SELECT bucket, target_total, actual_total, n, on_target FROM calorie_rollup "
+        f"WHERE username = ? AND period = ?{where} ORDER BY bucket",
+        (username, period, *params),
+    ).fetchall()
+    df = pd.DataFrame(rows, columns=["date", "target_cal", "actual_cal", "count", "on_target"])
+    df["adherence"] = df["on_target"] / df["count"].where(df["count"] > 0)
+    return df
+
+
+# ------------- CHART RESOLUTION -------------
+
+def pick_period(start: str, end: str, max_points: int = MAX_CHART_POINTS) -> str:
+    """Finest period that keeps a start..end chart under max_points buckets."""
+    days = (date.fromisoformat(end) - date.fromisoformat(start)).days + 1
+    if days <= max_points:
+        return "day"
+    if days <= max_points * 7:
+        return "week"
+    return "month"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling."""
+    import numpy as np
+
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = [0]
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        a = keep[-1]
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        keep.append(lo + int(np.argmax(area)))
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def weight_chart_data(username: str, start: str, end: str,
+                      max_points: int = MAX_CHART_POINTS) -> tuple:
+    """Rollup rows for a weight chart of start..end at an automatic resolution.
+
+    Returns (frame, period). If the chosen period still has more than
+    max_points buckets, the frame is thinned with LTTB.
+    """
+    import numpy as np
+    import pandas as pd
+
+    period = pick_period(start, end, max_points)
+    df = weight_rollup(username, period, start, end)
+    if len(df) > max_points:
+        x = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+        df = df.iloc[lttb(x, df["weight"].to_numpy(), max_points)].reset_index(drop=True)
+    return df, period
@@ -0,0 +1,19 @@
+import numpy as np
+
+# Kept free of pandas so the planner can round numbers without loading it
+
+
+def round_like_python(x: np.ndarray, ndigits: int) -> np.ndarray:
+    """np.round, corrected to match Python's round() on near-halfway values.
+
+    np.round scales first and can land on the other side of a tie
+    (np.round(0.15, 1) is 0.2, round(0.15, 1) is 0.1).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.round(x, ndigits)
+    scaled = x * 10.0 ** ndigits
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        out = np.array(out, copy=True)
+        out[near_half] = [round(v, ndigits) for v in x[near_half].tolist()]
+    return out
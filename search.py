@@ -0,0 +1,164 @@
+import re
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+import foods
+from rounding import round_like_python
+
+# Matches scoring below this are not used to fill in an edited row
+MIN_SCORE = 0.45
+
+
+def normalize(text) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(text).lower()).split())
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodIndex:
+    """Prefix and trigram lookup over food names.
+
+    Prefix matching uses the normalized names in sorted order, which gives
+    the same ranges as a trie walk with bisect instead of per-character
+    nodes. Typo-tolerant matching scores names by their shared trigrams,
+    counted for every name at once with np.bincount.
+    """
+
+    def __init__(self, names):
+        keys = [normalize(name) for name in names]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = keys
+        self._sorted_keys = [keys[i] for i in order]
+        self._order = np.array(order, dtype=np.int64)
+
+        postings = {}
+        n_grams = np.zeros(len(keys), dtype=np.int32)
+        for i, key in enumerate(keys):
+            grams = trigrams(key)
+            n_grams[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._n_grams = n_grams
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _range(self, key: str) -> tuple:
+        """(start, end of exact matches, end of prefix matches) in sorted order."""
+        lo = bisect_left(self._sorted_keys, key)
+        exact = bisect_right(self._sorted_keys, key, lo)
+        hi = bisect_left(self._sorted_keys, key + "\uffff", exact)
+        return lo, exact, hi
+
+    def prefix(self, query: str) -> np.ndarray:
+        """Ids of names starting with query, in name order."""
+        lo, _, hi = self._range(normalize(query))
+        return self._order[lo:hi]
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Best matches for query as (food_id, score), highest first.
+
+        Scores are trigram similarity in [0, 1]; names starting with the
+        query get +1 and an exact match +2, so they always rank first.
+        """
+        key = normalize(query)
+        if not key or not len(self):
+            return []
+        grams = trigrams(key)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            scores = np.zeros(len(self))
+        else:
+            shared = np.bincount(np.concatenate(hits), minlength=len(self))
+            # Dice alone punishes long names for short queries, so average it
+            # with the share of the query's trigrams found in the name
+            dice = 2.0 * shared / (len(grams) + self._n_grams)
+            scores = 0.5 * dice + 0.5 * shared / len(grams)
+        lo, exact, hi = self._range(key)
+        scores[self._order[lo:hi]] += 1.0
+        scores[self._order[lo:exact]] += 1.0
+
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def best_match(self, query: str, min_score: float = MIN_SCORE):
+        """Id of the best match for query, or None if nothing is close enough."""
+        matches = self.search(query, limit=1)
+        if matches and matches[0][1] >= min_score:
+            return matches[0][0]
+        return None
+
+
+_INDEX = {}
+
+
+def food_index() -> FoodIndex:
+    """Index over foods.CATALOG, built on first use."""
+    catalog = foods.CATALOG
+    if _INDEX.get("catalog") is not catalog:
+        _INDEX["index"] = FoodIndex(catalog.names)
+        _INDEX["catalog"] = catalog
+    return _INDEX["index"]
+
+
+def apply_food_edits(edited_df, original_df, min_score: float = MIN_SCORE) -> tuple:
+    """Re-resolve plan rows whose food or servings were edited.
+
+    Rows are matched to the original by index; new rows and rows with a
+    changed food or servings are looked up in the catalog (exact name first,
+    then fuzzy). Matched rows get the catalog name and serving, and calories
+    and macros recomputed for their servings. Returns (plan, unmatched food
+    names); unmatched rows are left as entered.
+    """
+    import pandas as pd
+
+    if edited_df.empty:
+        return edited_df, []
+    prev = original_df.reindex(edited_df.index)
+    servings = pd.to_numeric(edited_df["servings"], errors="coerce")
+    prev_servings = pd.to_numeric(prev["servings"], errors="coerce")
+    food = edited_df["food"].astype("string").fillna("").str.strip()
+    changed = (
+        (food != prev["food"].astype("string").fillna(""))
+        | (servings.fillna(-1.0) != prev_servings.fillna(-1.0))
+    ).to_numpy() & (food != "").to_numpy()
+    if not changed.any():
+        return edited_df, []
+
+    rows = np.flatnonzero(changed)
+    names = food.iloc[rows].tolist()
+    ids = foods.CATALOG.lookup(names)
+    unmatched = []
+    for k, name in enumerate(names):
+        if ids[k] < 0:
+            match = food_index().best_match(name, min_score)
+            if match is None:
+                unmatched.append(name)
+            else:
+                ids[k] = match
+
+    found = ids >= 0
+    rows, ids = rows[found], ids[found]
+    if len(rows) == 0:
+        return edited_df, unmatched
+
+    out = edited_df.copy()
+    serv = servings.iloc[rows].fillna(1.0).to_numpy()
+    catalog = foods.CATALOG
+    col = out.columns.get_loc
+    out.iloc[rows, col("food")] = [catalog.names[i] for i in ids]
+    out.iloc[rows, col("serving")] = [catalog.servings[i] for i in ids]
+    out.iloc[rows, col("servings")] = serv
+    # Rounded like plan_item, so an edited row matches a generated one
+    out.iloc[rows, col("calories")] = round_like_python(serv * catalog.cal[ids], 0)
+    out.iloc[rows, col("protein_g")] = round_like_python(serv * catalog.protein[ids], 1)
+    out.iloc[rows, col("carbs_g")] = round_like_python(serv * catalog.carbs[ids], 1)
+    out.iloc[rows, col("fat_g")] = round_like_python(serv * catalog.fat[ids], 1)
+    return out, unmatched
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from cache import LRUCache
+from export_pdf import PLAN_LINE_COLUMNS
+from foods import MEAL_RATIOS, build_compact_day_plan
+from plan_cache import plan_key
+from utils import daily_targets, today_str
+
+HOST = os.environ.get("SMART_DIET_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.environ.get("SMART_DIET_SERVICE_PORT", 8502))
+WORKERS = int(os.environ.get("SMART_DIET_SERVICE_WORKERS", os.cpu_count() or 1))
+
+# Pool jobs (after coalescing) allowed to wait or run at once; past this,
+# requests get 503 + Retry-After instead of queueing without bound
+MAX_PENDING = int(os.environ.get("SMART_DIET_SERVICE_MAX_PENDING", 64))
+
+MAX_BODY_BYTES = 1 << 20
+PLAN_MODES = ["greedy", "optimize"]
+PROFILE_FIELDS = ["gender", "weight_kg", "height_cm", "age", "activity_level", "goal"]
+MACRO_FIELDS = ["protein_g", "carbs_g", "fat_g"]
+
+
+class ServiceError(Exception):
+    """Error with an HTTP status, sent back to the client as {"error": ...}."""
+
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# ------------- POOL JOBS -------------
+# Run in worker processes, so they take and return plain JSON-able values
+
+# Per-worker cache of CompactPlans, keyed like plan_cache so nearby targets share plans
+PLANS = LRUCache(int(os.environ.get("SMART_DIET_SERVICE_PLAN_CACHE_SIZE", 4096)))
+
+
+def plan_job(params: dict) -> dict:
+    key = plan_key(params["total_calories"], params["veg_only"], params["seeds"],
+                   params["mode"], params["macros"])
+    plan = PLANS.get(key)
+    if plan is None:
+        plan = build_compact_day_plan(key[1], params["veg_only"], params["seeds"],
+                                      mode=params["mode"], macros=params["macros"])
+        PLANS.put(key, plan)
+    return {"plan": plan.to_records(), "totals": plan.totals()}
+
+
+def warm_job() -> int:
+    """Import the planner and PDF stack so the first real request doesn't pay for it."""
+    import export_pdf
+    import pandas
+    import reportlab.pdfgen.canvas
+    return os.getpid()
+
+
+def pdf_job(plan: list, summary: dict, user_name: str, date_str: str) -> bytes:
+    import pandas as pd
+    from export_pdf import build_pdf
+
+    return build_pdf(pd.DataFrame(plan), summary, user_name, date_str)
+
+
+# ------------- REQUEST PARSING -------------
+
+def _number(body: dict, field: str, low: float, high: float) -> float:
+    try:
+        value = float(body[field])
+    except KeyError:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"Missing field: {field}")
+    except (TypeError, ValueError):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"{field} must be a number")
+    if not low <= value <= high:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"{field} must be between {low:g} and {high:g}")
+    return value
+
+
+def targets_params(body: dict) -> dict:
+    missing = [f for f in PROFILE_FIELDS if f not in body]
+    if missing:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"Missing fields: {', '.join(missing)}")
+    return daily_targets(
+        str(body["gender"]), _number(body, "weight_kg", 30, 300),
+        _number(body, "height_cm", 100, 250), int(_number(body, "age", 10, 120)),
+        str(body["activity_level"]), str(body["goal"]),
+    )
+
+
+def macros_params(macros) -> dict:
+    """Daily macro targets in grams: an object with some of MACRO_FIELDS."""
+    if not isinstance(macros, dict) or not set(macros) <= set(MACRO_FIELDS):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"macros must map {', '.join(MACRO_FIELDS)} to numbers")
+    return {field: _number(macros, field, 0, 1000) for field in macros}
+
+
+def plan_params(body: dict) -> dict:
+    """Normalized plan inputs: an explicit total_calories, or the profile fields
+    /targets takes. Meals without a seed get a random one."""
+    macros = body.get("macros")
+    if "total_calories" in body:
+        total_calories = _number(body, "total_calories", 800, 6000)
+    else:
+        targets = targets_params(body)
+        total_calories, macros = targets["target_cal"], macros or targets["macros"]
+    mode = body.get("mode", "greedy")
+    if mode not in PLAN_MODES:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"mode must be one of {', '.join(PLAN_MODES)}")
+    seeds = body.get("seeds") or {}
+    if not isinstance(seeds, dict) or not all(
+            isinstance(v, int) and not isinstance(v, bool) for v in seeds.values()):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "seeds must map meal types to integers")
+    veg_only = body.get("veg_only", False)
+    if not isinstance(veg_only, bool):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "veg_only must be true or false")
+    return {
+        "total_calories": float(total_calories),
+        "veg_only": veg_only,
+        "seeds": {meal: seeds.get(meal, random.randint(0, 1_000_000)) for meal in MEAL_RATIOS},
+        "mode": mode,
+        "macros": macros_params(macros) if macros else None,
+    }
+
+
+def _key(kind: str, params) -> tuple:
+    return (kind, hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=16).digest())
+
+
+# ------------- SERVICE -------------
+
+class PlanService:
+    """HTTP/1.1 JSON service over the planner, tracking and PDF export.
+
+    Planning and PDF rendering run in a process pool of `workers`. Requests
+    with identical inputs that arrive while one is running wait for that
+    run instead of starting another, and once max_pending pool jobs are
+    queued new ones are refused with 503 so latency stays bounded.
+    """
+
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._inflight = {}
+        self.stats = {"requests": 0, "jobs": 0, "coalesced": 0, "rejected": 0, "errors": 0}
+
+    async def warm(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, warm_job) for _ in range(self.workers)))
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def submit(self, key: tuple, fn, *args):
+        """Run fn(*args) in the pool, sharing the run with identical in-flight keys."""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Server busy, retry shortly",
+                               {"Retry-After": "1"})
+
+        self.pending += 1
+        self.stats["jobs"] += 1
+        future = asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        self._inflight[key] = future
+
+        def done(_):
+            self.pending -= 1
+            self._inflight.pop(key, None)
+        future.add_done_callback(done)
+        # A client that disconnects must not cancel a run other requests share
+        return await asyncio.shield(future)
+
+    # ------------- ROUTES -------------
+
+    async def health(self, body):
+        return {"status": "ok", "workers": self.workers, "pending": self.pending, **self.stats}
+
+    async def targets(self, body):
+        return targets_params(body)
+
+    async def plan(self, body):
+        params = plan_params(body)
+        result = await self.submit(_key("plan", params), plan_job, params)
+        return {**result, "total_calories": params["total_calories"], "seeds": params["seeds"]}
+
+    async def pdf(self, body):
+        plan = body.get("plan")
+        if not isinstance(plan, list) or not plan:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "plan must be a non-empty list of rows")
+        missing = [c for c in PLAN_LINE_COLUMNS if not all(isinstance(r, dict) and c in r for r in plan)]
+        if missing:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, f"plan rows need: {', '.join(missing)}")
+        summary = body.get("summary")
+        if summary is None:
+            summary = {}
+        elif not isinstance(summary, dict):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "summary must be an object")
+        args = (plan, summary, str(body.get("user_name", "")),
+                str(body.get("date") or today_str()))
+        return await self.submit(_key("pdf", args), pdf_job, *args)
+
+    async def save(self, username: str, kind: str, body):
+        import profiles
+        import tracking
+
+        if await asyncio.to_thread(profiles.get_user, username) is None:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No user named {username}")
+        if kind == "weight":
+            await asyncio.to_thread(tracking.save_weight, username, _number(body, "weight", 30, 300))
+        elif kind == "calories":
+            await asyncio.to_thread(
+                tracking.save_calories, username,
+                _number(body, "target_cal", 0, 10000), _number(body, "actual_cal", 0, 20000),
+            )
+        elif kind == "notes":
+            await asyncio.to_thread(tracking.save_note, username, str(body.get("note", "")))
+        else:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"Unknown history: {kind}")
+        return {"saved": kind, "username": username, "date": today_str()}
+
+    async def route(self, method: str, path: str, body):
+        parts = [p for p in path.split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            return await self.health(body)
+        if method != "POST":
+            raise ServiceError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} {path} is not supported")
+        if not isinstance(body, dict):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        if parts == ["targets"]:
+            return await self.targets(body)
+        if parts == ["plan"]:
+            return await self.plan(body)
+        if parts == ["pdf"]:
+            return await self.pdf(body)
+        if len(parts) == 3 and parts[0] == "users":
+            return await self.save(parts[1], parts[2], body)
+        raise ServiceError(HTTPStatus.NOT_FOUND, f"No route for {path}")
+
+    # ------------- HTTP -------------
+
+    async def respond(self, method: str, path: str, raw: bytes) -> tuple:
+        """(status, headers, body bytes) for one request."""
+        self.stats["requests"] += 1
+        try:
+            body = json.loads(raw) if raw else {}
+            result = await self.route(method, path, body)
+        except ServiceError as e:
+            return e.status, {"Content-Type": "application/json", **e.headers}, \
+                json.dumps({"error": str(e)}).encode()
+        except json.JSONDecodeError:
+            return HTTPStatus.BAD_REQUEST, {"Content-Type": "application/json"}, \
+                b'{"error": "Body is not valid JSON"}'
+        except Exception as e:
+            self.stats["errors"] += 1
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"Content-Type": "application/json"}, \
+                json.dumps({"error": f"{type(e).__name__}: {e}"}).encode()
+        if isinstance(result, bytes):
+            return HTTPStatus.OK, {"Content-Type": "application/pdf"}, result
+        return HTTPStatus.OK, {"Content-Type": "application/json"}, json.dumps(result).encode()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one keep-alive connection."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await _write(writer, HTTPStatus.BAD_REQUEST, {"Content-Type": "application/json"},
+                                 b'{"error": "Invalid Content-Length"}', False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await _write(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {}, b"", False)
+                    break
+                raw = await reader.readexactly(length) if length else b""
+
+                status, out_headers, payload = await self.respond(method, target.split("?", 1)[0], raw)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await _write(writer, status, out_headers, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _write(writer, status: int, headers: dict, payload: bytes, keep_alive: bool):
+    status = HTTPStatus(status)
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(payload)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+    await writer.drain()
+
+
+async def start(service: PlanService, host: str = HOST, port: int = PORT) -> asyncio.Server:
+    """Warm the worker pool, then listen."""
+    await service.warm()
+    # Headers of a few KB at most; a longer head is dropped as malformed
+    return await asyncio.start_server(service.handle, host, port, limit=64 * 1024)
+
+
+async def serve(host: str = HOST, port: int = PORT, workers: int = WORKERS,
+                max_pending: int = MAX_PENDING):
+    service = PlanService(workers, max_pending)
+    server = await start(service, host, port)
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Diet Planner HTTP service")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="planning/PDF processes")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="queued pool jobs before requests get 503")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from foods import CATALOG
+
+SHOPPING_COLUMNS = ["food", "quantity", "unit", "servings", "amount"]
+
+
+def format_amount(quantity: float, unit: str) -> str:
+    """Human-readable amount: grams roll over to kg, pieces round up."""
+    if unit == "g":
+        return f"{quantity / 1000:.2f} kg" if quantity >= 1000 else f"{quantity:.0f} g"
+    return f"{np.ceil(round(quantity, 6)):.0f} {unit}"
+
+
+def shopping_list(*plans: pd.DataFrame) -> pd.DataFrame:
+    """Total shopping quantity per food over any number of plans.
+
+    plans are frames with "food" and "servings" columns, such as
+    build_full_day_plan, build_multi_day_plan or build_plans_batch output.
+    Catalog foods are converted with their qty/unit; foods that are not in
+    the catalog (typed into the editor) are counted in servings. Returns
+    SHOPPING_COLUMNS sorted by food.
+    """
+    frames = [p[["food", "servings"]] for p in plans if len(p)]
+    if not frames:
+        return pd.DataFrame(columns=SHOPPING_COLUMNS)
+    rows = pd.concat(frames, ignore_index=True)
+
+    servings = pd.to_numeric(rows["servings"], errors="coerce").fillna(0.0).to_numpy()
+    ids = CATALOG.lookup(rows["food"])
+    known = ids >= 0
+
+    # Catalog foods are summed by id in one pass; only free-text foods need a groupby
+    counts = np.bincount(ids[known], minlength=len(CATALOG))
+    per_food = np.bincount(ids[known], weights=servings[known], minlength=len(CATALOG))
+    present = np.flatnonzero(counts)
+    parts = [pd.DataFrame({
+        "food": [CATALOG.names[i] for i in present],
+        "unit": [CATALOG.units[i] for i in present],
+        "quantity": np.round(per_food[present] * CATALOG.qty[present], 3),
+        "servings": np.round(per_food[present], 3),
+    })]
+    if not known.all():
+        other = pd.Series(servings[~known]).groupby(rows["food"].to_numpy()[~known]).sum()
+        parts.append(pd.DataFrame({
+            "food": other.index, "unit": "servings",
+            "quantity": other.to_numpy(), "servings": other.to_numpy(),
+        }))
+    totals = pd.concat(parts, ignore_index=True).sort_values("food", ignore_index=True)
+
+    totals["amount"] = [format_amount(q, u) for q, u in zip(totals["quantity"], totals["unit"])]
+    return totals[SHOPPING_COLUMNS]
+
+
+def write_shopping_list(shopping_df: pd.DataFrame, sink):
+    """Export a shopping list as CSV to a path or text file-like object."""
+    shopping_df.to_csv(sink, index=False)
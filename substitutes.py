@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+import foods
+from catalog import MEAL_TYPES
+from metrics import timed
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Neighbours kept per food; swaps are drawn from these
+MAX_SWAPS = 10
+
+# Average foods per grid cell in the neighbour search
+CELL_POINTS = 16
+
+# Queries x candidates compared at once in one distance block
+BLOCK_PAIRS = 2_000_000
+
+# Swaps needing fewer or more servings than this are skipped, as in the greedy fill
+MIN_SERVINGS = 0.4
+MAX_SERVINGS = 2.0
+
+# Saved tables live in this subdirectory of their catalog directory
+TABLES_DIR = "swaps"
+TABLES_VERSION = 1
+
+
+# ------------- NEIGHBOUR SEARCH -------------
+
+def macro_vectors(catalog, ids: np.ndarray) -> np.ndarray:
+    """Share of each food's calories from protein, carbs and fat (4/4/9 kcal per g).
+
+    Per-calorie macros make a food and a calorie-matched portion of its
+    neighbour carry nearly the same protein, carbs and fat.
+    """
+    cal = catalog.cal[ids]
+    grams = np.column_stack([catalog.protein[ids], catalog.carbs[ids], catalog.fat[ids]])
+    energy = grams * np.array([4.0, 4.0, 9.0])
+    out = np.zeros_like(energy)
+    np.divide(energy, cal[:, None], out=out, where=cal[:, None] > 0)
+    return out
+
+
+def _closest(queries: np.ndarray, query_ids: np.ndarray, points: np.ndarray,
+             candidates: np.ndarray, k: int) -> tuple:
+    """k nearest of points[candidates] to each query, skipping the query itself."""
+    n_ids = np.full((len(queries), k), -1, dtype=np.int32)
+    n_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+    # One extra, in case the query itself is among the closest
+    take = min(k + 1, len(candidates))
+    if not take:
+        return n_ids, n_dist
+    cand = points[candidates]
+    cand_sq = (cand ** 2).sum(axis=1)
+    step = max(1, BLOCK_PAIRS // len(candidates))
+    for lo in range(0, len(queries), step):
+        q = queries[lo:lo + step]
+        # |q - c|^2 as |q|^2 + |c|^2 - 2 q.c, one matrix product per block
+        d = (q ** 2).sum(axis=1)[:, None] + cand_sq[None, :] - 2.0 * (q @ cand.T)
+        if take < len(candidates):
+            part = np.argpartition(d, take - 1, axis=1)[:, :take]
+        else:
+            part = np.broadcast_to(np.arange(take), (len(q), take))
+        part_ids = candidates[part]
+        part_d = np.take_along_axis(d, part, axis=1)
+        part_d[part_ids == query_ids[lo:lo + step, None]] = np.inf
+        order = np.argsort(part_d, axis=1, kind="stable")[:, :k]
+        found = order.shape[1]
+        n_dist[lo:lo + step, :found] = np.sqrt(np.maximum(np.take_along_axis(part_d, order, axis=1), 0.0))
+        n_ids[lo:lo + step, :found] = np.take_along_axis(part_ids, order, axis=1)
+    n_ids[np.isinf(n_dist)] = -1
+    return n_ids, n_dist
+
+
+def nearest(points: np.ndarray, k: int, queries: np.ndarray = None, query_ids: np.ndarray = None,
+            within: np.ndarray = None) -> tuple:
+    """Exact k nearest points to each query (to every point if queries is None).
+
+    Points are bucketed on a grid over their protein and fat shares whose
+    edges are quantiles, so each row and column of cells holds about as many
+    foods however they cluster. Each query is compared with the cells within
+    `reach` of its own; anything outside is further away than the edge of
+    that block, so a result is exact once its k-th distance is within it, and
+    the rest go round again with twice the reach. query_ids gives each
+    query's row in points, so it is not its own neighbour; `within` stops the
+    search for a query once no point closer than its value can be missed.
+    Returns (ids into points, -1 padded; distances, inf padded).
+    """
+    if queries is None:
+        queries, query_ids = points, np.arange(len(points))
+    if query_ids is None:
+        query_ids = np.full(len(queries), -1)
+    n_ids = np.full((len(queries), k), -1, dtype=np.int32)
+    n_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+    if not len(points) or not len(queries):
+        return n_ids, n_dist
+
+    grid = max(1, int(np.sqrt(len(points) / CELL_POINTS)))
+    axes = [0, 2]
+    edges = [np.quantile(points[:, a], np.linspace(0, 1, grid + 1)) for a in axes]
+    # Outer edges are open: nothing lies beyond the first or last cell
+    for e in edges:
+        e[0], e[-1] = -np.inf, np.inf
+
+    def cells(v):
+        return [np.searchsorted(e[1:-1], v[:, a], side="right") for e, a in zip(edges, axes)]
+
+    px, py = cells(points)
+    p_order = np.argsort(px * grid + py, kind="stable")
+    # Cells are numbered x * grid + y, so each x of a block is one slice of p_order
+    bounds = np.searchsorted((px * grid + py)[p_order], np.arange(grid * grid + 1))
+    qx, qy = cells(queries)
+    q_key = qx * grid + qy
+
+    pending, reach = np.arange(len(queries)), 1
+    while len(pending):
+        order = pending[np.argsort(q_key[pending], kind="stable")]
+        keys, starts = np.unique(q_key[order], return_index=True)
+        for key, rows in zip(keys.tolist(), np.split(order, starts[1:])):
+            cx, cy = divmod(key, grid)
+            y0, y1 = max(cy - reach, 0), min(cy + reach, grid - 1)
+            candidates = np.concatenate([
+                p_order[bounds[x * grid + y0]:bounds[x * grid + y1 + 1]]
+                for x in range(max(cx - reach, 0), min(cx + reach, grid - 1) + 1)
+            ])
+            n_ids[rows], n_dist[rows] = _closest(queries[rows], query_ids[rows], points, candidates, k)
+        if reach >= grid:
+            break
+        # Distance from each query to the nearest edge of the block it searched
+        margin = np.full(len(pending), np.inf)
+        for e, c, a in zip(edges, (qx[pending], qy[pending]), axes):
+            v = queries[pending, a]
+            margin = np.minimum(margin, v - e[np.maximum(c - reach, 0)])
+            margin = np.minimum(margin, e[np.minimum(c + reach + 1, grid)] - v)
+        needed = n_dist[pending, -1] if within is None else np.minimum(n_dist[pending, -1], within[pending])
+        pending = pending[needed > margin]
+        reach *= 2
+    return n_ids, n_dist
+
+
+# ------------- TABLES -------------
+
+class _Pool:
+    """Neighbour table for the foods of one (meal_type, veg_only) pool."""
+
+    __slots__ = ("ids", "vectors", "neighbors", "distances")
+
+    def __init__(self, ids, vectors, neighbors, distances):
+        self.ids = ids
+        self.vectors = vectors
+        self.neighbors = neighbors
+        self.distances = distances
+
+    @classmethod
+    def build(cls, ids: np.ndarray, vectors: np.ndarray, k: int) -> _Pool:
+        neighbors, distances = nearest(vectors, k)
+        return cls(ids, vectors, neighbors, distances)
+
+    def extend(self, ids: np.ndarray, vectors: np.ndarray) -> _Pool:
+        """This pool with foods appended to the catalog added.
+
+        New foods get full neighbour lists; existing ones only look for new
+        foods closer than their current k-th neighbour and merge them in.
+        """
+        k, old = self.neighbors.shape[1], len(self.ids)
+        new_ids, new_dist = nearest(vectors, k, queries=vectors[old:], query_ids=np.arange(old, len(ids)))
+        near_ids, near_dist = nearest(vectors[old:], k, queries=self.vectors, within=self.distances[:, -1])
+        near_ids = np.where(near_ids >= 0, near_ids + old, -1)
+
+        merged_ids = np.concatenate([self.neighbors, near_ids], axis=1)
+        merged_dist = np.concatenate([self.distances, near_dist], axis=1)
+        order = np.argsort(merged_dist, axis=1, kind="stable")[:, :k]
+        return _Pool(
+            ids, vectors,
+            np.concatenate([np.take_along_axis(merged_ids, order, axis=1), new_ids]),
+            np.concatenate([np.take_along_axis(merged_dist, order, axis=1), new_dist]),
+        )
+
+    def neighbors_of(self, food_id: int) -> np.ndarray:
+        """Catalog ids of food_id's neighbours, closest first; empty if not in the pool."""
+        pos = int(np.searchsorted(self.ids, food_id))
+        if pos == len(self.ids) or self.ids[pos] != food_id:
+            return np.empty(0, dtype=self.ids.dtype)
+        row = self.neighbors[pos]
+        return self.ids[row[row >= 0]]
+
+
+class SubstitutionTable:
+    """Precomputed swaps for every food in a catalog.
+
+    Each (meal_type, veg_only) pool keeps its foods' MAX_SWAPS nearest
+    neighbours by macro_vectors, so a lookup is a binary search for the row
+    and k reads. precompute() builds the pools; lookups never do. Given the
+    table of an earlier catalog, a pool whose foods are unchanged is reused
+    and one that only gained foods at the end is extended, not rebuilt.
+    """
+
+    def __init__(self, catalog, previous: SubstitutionTable = None, k: int = MAX_SWAPS):
+        self.catalog = catalog
+        self.k = k
+        self.rebuilt = self.extended = self.reused = 0
+        self._pools = {}
+        # Pools of earlier catalogs, including ones that were never updated
+        self._previous = {}
+        if previous is not None and previous.k == k:
+            self._previous = {**previous._previous, **previous._pools}
+
+    def pool(self, meal_type: str, veg_only: bool) -> _Pool:
+        """The pool for a meal, None for unknown meal types or before precompute()."""
+        return self._pools.get((meal_type.lower(), bool(veg_only)))
+
+    def precompute(self) -> SubstitutionTable:
+        """Build every pool that is not built yet; returns the table."""
+        for meal in MEAL_TYPES:
+            for veg in (False, True):
+                if (meal, veg) not in self._pools:
+                    self._pools[meal, veg] = self._update(
+                        self.catalog.indices(meal, veg), self._previous.pop((meal, veg), None)
+                    )
+        return self
+
+    def _update(self, ids: np.ndarray, old: _Pool = None) -> _Pool:
+        vectors = macro_vectors(self.catalog, ids)
+        n = len(old.ids) if old is not None else 0
+        if (old is None or n > len(ids) or not np.array_equal(ids[:n], old.ids)
+                or not np.array_equal(vectors[:n], old.vectors)):
+            self.rebuilt += 1
+            return _Pool.build(ids, vectors, self.k)
+        if n == len(ids):
+            self.reused += 1
+            return old
+        self.extended += 1
+        return old.extend(ids, vectors)
+
+    def substitutes(self, food_id: int, meal_type: str, veg_only: bool, calories: float,
+                    k: int = 5) -> list:
+        """Up to k (food_id, servings) swaps giving about `calories`, closest macros first."""
+        pool = self.pool(meal_type, veg_only)
+        if pool is None:
+            return []
+        swaps = []
+        for i in pool.neighbors_of(int(food_id)).tolist():
+            servings = round(calories / float(self.catalog.cal[i]), 1)
+            if MIN_SERVINGS <= servings <= MAX_SERVINGS:
+                swaps.append((i, servings))
+                if len(swaps) == k:
+                    break
+        return swaps
+
+
+# ------------- ON DISK -------------
+
+def _pool_name(meal: str, veg: bool) -> str:
+    return f"{meal}_{'veg' if veg else 'all'}"
+
+
+def write_tables(table: SubstitutionTable, path: str):
+    """Save table's pools (building any that are missing) under catalog directory path.
+
+    Files go to a temporary directory that replaces path/TABLES_DIR, and
+    record the catalog's fingerprint so load_tables can tell they are stale.
+    """
+    table.precompute()
+    out = os.path.join(path, TABLES_DIR)
+    tmp = f"{out}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for (meal, veg), pool in table._pools.items():
+        for field in ("ids", "neighbors", "distances"):
+            np.save(os.path.join(tmp, f"{_pool_name(meal, veg)}.{field}.npy"), getattr(pool, field))
+    meta = {"version": TABLES_VERSION, "k": table.k, "catalog": table.catalog.fingerprint()}
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+
+
+def load_tables(catalog, path: str) -> SubstitutionTable:
+    """Tables write_tables saved under path for catalog; None if there are
+    none or they belong to another version of the catalog."""
+    tables = os.path.join(path, TABLES_DIR)
+    try:
+        with open(os.path.join(tables, "meta.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("version") != TABLES_VERSION or meta.get("catalog") != catalog.fingerprint():
+        return None
+    table = SubstitutionTable(catalog, k=meta["k"])
+    for meal in MEAL_TYPES:
+        for veg in (False, True):
+            name = os.path.join(tables, _pool_name(meal, veg))
+            ids, neighbors, distances = (np.load(f"{name}.{field}.npy")
+                                         for field in ("ids", "neighbors", "distances"))
+            table._pools[meal, veg] = _Pool(ids, macro_vectors(catalog, ids), neighbors, distances)
+    return table
+
+
+# ------------- LOOKUPS -------------
+
+_TABLE = {}
+
+
+def substitution_table() -> SubstitutionTable:
+    """Ready tables for foods.CATALOG, made once per catalog.
+
+    Loaded from the catalog directory when ingest saved them there, else
+    built by updating the previous catalog's tables.
+    """
+    table = _TABLE.get("table")
+    if table is None or table.catalog is not foods.CATALOG:
+        saved = load_tables(foods.CATALOG, foods.CATALOG_PATH) if foods.CATALOG_PATH else None
+        _TABLE["table"] = table = saved or SubstitutionTable(foods.CATALOG, previous=table).precompute()
+    return table
+
+
+@timed
+def swap_options(plan_df: pd.DataFrame, row: int, veg_only: bool, k: int = 5) -> pd.DataFrame:
+    """Calorie-matched swaps for one plan row as plan rows, closest macros first."""
+    import pandas as pd
+
+    item = plan_df.iloc[row]
+    food_id = int(foods.CATALOG.lookup([item["food"]])[0])
+    calories = pd.to_numeric(item["calories"], errors="coerce")
+    if food_id < 0 or pd.isna(calories) or pd.isna(item["meal_type"]):
+        return pd.DataFrame(columns=foods.PLAN_COLUMNS)
+    meal = str(item["meal_type"]).lower()
+    swaps = substitution_table().substitutes(food_id, meal, veg_only, float(calories), k)
+    return pd.DataFrame([foods.plan_item(meal, i, serv) for i, serv in swaps], columns=foods.PLAN_COLUMNS)
+
+
+def swap_food(plan_df: pd.DataFrame, row: int, item) -> pd.DataFrame:
+    """plan_df with one row replaced by a swap from swap_options; other rows are untouched."""
+    out = plan_df.copy()
+    for col in foods.PLAN_COLUMNS:
+        out.iloc[row, out.columns.get_loc(col)] = item[col]
+    return out
@@ -1,6 +1,28 @@
+from __future__ import annotations
+
+import io
 import os
-import pandas as pd
-from utils import DATA_DIR, ensure_data_dir, load_csv, save_csv, today_str
+import threading
+from typing import TYPE_CHECKING
+from utils import DATA_DIR, ensure_data_dir, load_csv, today_str
+import rollups
+import tracking_store
+from cache import cached, invalidate
+from metrics import timed
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# "sqlite" appends rows to data/tracking.db; "csv" keeps the legacy per-user files
+BACKEND = os.environ.get("SMART_DIET_TRACKING_BACKEND", "sqlite")
+
+try:
+    import fcntl
+except ImportError:  # Windows: the thread lock still covers writers in this process
+    fcntl = None
+
+_csv_lock = threading.Lock()
+
 
 def weight_file(username: str) -> str:
     return os.path.join(DATA_DIR, f"weight_{username}.csv")
@@ -14,46 +36,237 @@ def notes_file(username: str) -> str:
     return os.path.join(DATA_DIR, f"notes_{username}.csv")
 
 
+def _invalidate_history(kind: str, username: str):
+    invalidate(f"load_{kind}", username)
+    invalidate("load_range", kind, username)
+    invalidate("load_last", kind, username)
+    invalidate("count_entries", kind, username)
+
+
+def _append_csv(path: str, row: dict, columns: list):
+    """Append one row under an exclusive lock, so concurrent saves from the
+    app and the service never interleave or write the header twice."""
+    import pandas as pd
+
+    ensure_data_dir()
+    line = pd.DataFrame([row], columns=columns).to_csv(header=False, index=False)
+    header = pd.DataFrame(columns=columns).to_csv(index=False)
+    with _csv_lock, open(path, "a", newline="") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            # Checked under the lock: another writer may have just created the file
+            f.write(line if f.seek(0, os.SEEK_END) else header + line)
+            f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@timed
 def save_weight(username: str, weight: float):
-    path = weight_file(username)
-    df = load_csv(path, default_columns=["date","weight"])
-    df = pd.concat([df, pd.DataFrame([{"date": today_str(), "weight": weight}])], ignore_index=True)
-    save_csv(df, path)
+    row = {"date": today_str(), "weight": weight}
+    if BACKEND == "sqlite":
+        tracking_store.append("weight", username, row)
+    else:
+        _append_csv(weight_file(username), row, ["date","weight"])
+    _invalidate_history("weight", username)
+    rollups.record_weight(username, row["date"], weight)
 
 
+@timed
+@cached("load_weight")
 def load_weight(username: str) -> pd.DataFrame:
+    if BACKEND == "sqlite":
+        return tracking_store.load("weight", username)
     path = weight_file(username)
     return load_csv(path, default_columns=["date","weight"])
 
 
+@timed
 def save_calories(username: str, target: float, actual: float):
-    path = calories_file(username)
-    df = load_csv(path, default_columns=["date","target_cal","actual_cal"])
-    df = pd.concat(
-        [df, pd.DataFrame([{"date": today_str(), "target_cal": target, "actual_cal": actual}])],
-        ignore_index=True
-    )
-    save_csv(df, path)
+    row = {"date": today_str(), "target_cal": target, "actual_cal": actual}
+    if BACKEND == "sqlite":
+        tracking_store.append("calories", username, row)
+    else:
+        _append_csv(calories_file(username), row, ["date","target_cal","actual_cal"])
+    _invalidate_history("calories", username)
+    rollups.record_calories(username, row["date"], target, actual)
 
 
+@timed
+@cached("load_calories")
 def load_calories(username: str) -> pd.DataFrame:
+    if BACKEND == "sqlite":
+        return tracking_store.load("calories", username)
     path = calories_file(username)
     return load_csv(path, default_columns=["date","target_cal","actual_cal"])
 
 
+@timed
 def save_note(username: str, note: str):
     if not note.strip():
         return
-    path = notes_file(username)
-    df = load_csv(path, default_columns=["date","note"])
-    df = pd.concat(
-        [df, pd.DataFrame([{"date": today_str(), "note": note.strip()}])],
-        ignore_index=True
-    )
-    save_csv(df, path)
+    row = {"date": today_str(), "note": note.strip()}
+    if BACKEND == "sqlite":
+        tracking_store.append("notes", username, row)
+    else:
+        _append_csv(notes_file(username), row, ["date","note"])
+    _invalidate_history("notes", username)
 
 
+@timed
+@cached("load_notes")
 def load_notes(username: str) -> pd.DataFrame:
+    if BACKEND == "sqlite":
+        return tracking_store.load("notes", username)
     path = notes_file(username)
     return load_csv(path, default_columns=["date","note"])
 
+
+# ------------- WINDOWED HISTORY -------------
+
+HISTORY_COLUMNS = {
+    "weight": ["date","weight"],
+    "calories": ["date","target_cal","actual_cal"],
+    "notes": ["date","note"],
+}
+
+CSV_CHUNK_ROWS = 50_000
+
+
+def _history_file(kind: str, username: str) -> str:
+    return os.path.join(DATA_DIR, f"{kind}_{username}.csv")
+
+
+def _scan_csv(path: str, columns: list, start=None, end=None, before=None) -> pd.DataFrame:
+    """Filter a CSV by date chunk by chunk, so the whole file is never in memory."""
+    import pandas as pd
+
+    parts = []
+    for chunk in pd.read_csv(path, chunksize=CSV_CHUNK_ROWS):
+        mask = pd.Series(True, index=chunk.index)
+        if start is not None:
+            mask &= chunk["date"] >= start
+        if end is not None:
+            mask &= chunk["date"] <= end
+        if before is not None:
+            mask &= chunk["date"] < before
+        parts.append(chunk[mask])
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _tail_csv(path: str, n: int, columns: list, block: int = 64 * 1024) -> pd.DataFrame:
+    """Last n rows of a CSV, reading blocks backwards from the end of the file.
+
+    Only safe for files without quoted newlines, so notes use _scan_csv.
+    """
+    import pandas as pd
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n + 1:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos == 0:
+        lines = lines[1:]
+    lines = [line for line in lines[-n:] if line.strip()] if n > 0 else []
+    if not lines:
+        return pd.DataFrame(columns=columns)
+    return pd.read_csv(io.BytesIO(b"\n".join(lines)), names=columns, header=None)
+
+
+@timed
+@cached("load_range")
+def load_range(kind: str, username: str, start: str = None, end: str = None) -> pd.DataFrame:
+    """History rows with start <= date <= end (either bound optional), sorted by date."""
+    import pandas as pd
+
+    if BACKEND == "sqlite":
+        return tracking_store.load_window(kind, username, start=start, end=end)
+    columns = HISTORY_COLUMNS[kind]
+    path = _history_file(kind, username)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    df = _scan_csv(path, columns, start=start, end=end)
+    return df.sort_values("date", kind="stable", ignore_index=True)
+
+
+@timed
+@cached("load_last")
+def load_last(kind: str, username: str, n: int, before: str = None) -> pd.DataFrame:
+    """Newest n history rows (dated before `before` if given), sorted by date.
+
+    Pass the first date of the current page as `before` to page back.
+    """
+    import pandas as pd
+
+    if BACKEND == "sqlite":
+        return tracking_store.load_window(kind, username, last_n=n, before=before)
+    columns = HISTORY_COLUMNS[kind]
+    path = _history_file(kind, username)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    if kind == "notes" or before is not None:
+        df = _scan_csv(path, columns, before=before)
+    else:
+        # CSV rows are appended in date order, so the newest rows are at the end
+        df = _tail_csv(path, n, columns)
+    df = df.sort_values("date", kind="stable", ignore_index=True)
+    return df.tail(n).reset_index(drop=True)
+
+
+@timed
+@cached("count_entries")
+def count_entries(kind: str, username: str) -> int:
+    import pandas as pd
+
+    if BACKEND == "sqlite":
+        return tracking_store.count(kind, username)
+    path = _history_file(kind, username)
+    if not os.path.exists(path):
+        return 0
+    return sum(len(chunk) for chunk in pd.read_csv(path, chunksize=CSV_CHUNK_ROWS, usecols=["date"]))
+
+
+# ------------- NOTES SEARCH -------------
+
+@timed
+def search_notes(username: str, query: str = "", start: str = None, end: str = None,
+                 page: int = 0, page_size: int = 20) -> tuple:
+    """One page of notes matching every word and "quoted phrase" in query.
+
+    Returns (DataFrame of date, note, snippet, total matches), with at most
+    tracking_store.SEARCH_LIMIT matches. The sqlite backend ranks them with
+    its full-text index; the CSV backend scans the file and lists them newest
+    first.
+    """
+    import re
+
+    import pandas as pd
+
+    offset = max(int(page), 0) * page_size
+    if BACKEND == "sqlite":
+        return tracking_store.search_notes(username, query, start=start, end=end,
+                                           limit=page_size, offset=offset)
+    columns = ["date", "note", "snippet"]
+    path = notes_file(username)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns), 0
+    df = _scan_csv(path, ["date", "note"], start=start, end=end)
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query or ""):
+        term = (phrase or word).rstrip("*").strip()
+        if term:
+            df = df[df["note"].astype(str).str.contains(term, case=False, regex=False)]
+    df = df.iloc[::-1].sort_values("date", ascending=False, kind="stable", ignore_index=True)
+    df = df.head(tracking_store.SEARCH_LIMIT)
+    page_df = df.iloc[offset:offset + page_size].reset_index(drop=True)
+    page_df["snippet"] = page_df["note"]
+    return page_df[columns], len(df)
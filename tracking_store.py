@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+from typing import TYPE_CHECKING
+
+import db
+from utils import DATA_DIR
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DB_FILE = os.path.join(DATA_DIR, "tracking.db")
+
+# Table name -> value columns, in the same order as the legacy CSV files
+TABLES = {
+    "weight": ["date", "weight"],
+    "calories": ["date", "target_cal", "actual_cal"],
+    "notes": ["date", "note"],
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weight (
+    id INTEGER PRIMARY KEY, username TEXT NOT NULL, date TEXT NOT NULL, weight REAL
+);
+CREATE TABLE IF NOT EXISTS calories (
+    id INTEGER PRIMARY KEY, username TEXT NOT NULL, date TEXT NOT NULL,
+    target_cal REAL, actual_cal REAL
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY, username TEXT NOT NULL, date TEXT NOT NULL, note TEXT
+);
+CREATE INDEX IF NOT EXISTS weight_user_date ON weight (username, date);
+CREATE INDEX IF NOT EXISTS calories_user_date ON calories (username, date);
+CREATE INDEX IF NOT EXISTS notes_user_date ON notes (username, date);
+CREATE TABLE IF NOT EXISTS migrated_csv (
+    kind TEXT NOT NULL, username TEXT NOT NULL, PRIMARY KEY (kind, username)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY, value TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    note, content='notes', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_fts (rowid, note) VALUES (new.id, new.note);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+    INSERT INTO notes_fts (notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+    INSERT INTO notes_fts (rowid, note) VALUES (new.id, new.note);
+END;
+"""
+
+_migrated = set()
+_indexed = set()
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    path = path or DB_FILE
+    conn = db.connect(path, _SCHEMA)
+    if path not in _indexed:
+        index_notes(conn)
+        _indexed.add(path)
+    return conn
+
+
+def index_notes(conn: sqlite3.Connection):
+    """Index notes saved before the full-text index existed; later calls are no-ops.
+
+    New notes are indexed by the notes_fts_insert trigger as they are saved.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT 1 FROM meta WHERE key = 'notes_fts_built'").fetchone()
+        if not done:
+            conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO meta VALUES ('notes_fts_built', '1')")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def csv_path(kind: str, username: str) -> str:
+    return os.path.join(DATA_DIR, f"{kind}_{username}.csv")
+
+
+def migrate_user_csv(conn: sqlite3.Connection, kind: str, username: str, path: str = None):
+    """Import data/{kind}_{username}.csv once; later calls are no-ops.
+
+    conn is connect(path). Done imports are remembered by database path, not
+    connection, so no per-thread connection is kept alive here.
+    """
+    import pandas as pd
+
+    key = (path or DB_FILE, kind, username)
+    if key in _migrated:
+        return
+    path = csv_path(kind, username)
+    if os.path.exists(path):
+        cols = TABLES[kind]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute(
+                "SELECT 1 FROM migrated_csv WHERE kind = ? AND username = ?", (kind, username)
+            ).fetchone()
+            if not done:
+                df = pd.read_csv(path).reindex(columns=cols).astype(object)
+                df = df.where(df.notna(), None)
+                rows = [(username, *rec) for rec in df.itertuples(index=False)]
+                conn.executemany(
+                    f"INSERT INTO {kind} (username, {', '.join(cols)}) "
+                    f"VALUES (?, {', '.join('?' for _ in cols)})",
+                    rows,
+                )
+                conn.execute("INSERT INTO migrated_csv VALUES (?, ?)", (kind, username))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    _migrated.add(key)
+
+
+def migrate_all_csv(path: str = None) -> int:
+    """One-shot import of every data/{weight,calories,notes}_*.csv file."""
+    conn = connect(path)
+    count = 0
+    if not os.path.isdir(DATA_DIR):
+        return count
+    for fname in sorted(os.listdir(DATA_DIR)):
+        for kind in TABLES:
+            prefix = f"{kind}_"
+            if fname.startswith(prefix) and fname.endswith(".csv"):
+                migrate_user_csv(conn, kind, fname[len(prefix):-len(".csv")], path)
+                count += 1
+    return count
+
+
+def append(kind: str, username: str, row: dict):
+    conn = connect()
+    migrate_user_csv(conn, kind, username)
+    cols = TABLES[kind]
+    conn.execute(
+        f"INSERT INTO {kind} (username, {', '.join(cols)}) "
+        f"VALUES (?, {', '.join('?' for _ in cols)})",
+        (username, *(row[c] for c in cols)),
+    )
+
+
+def load(kind: str, username: str) -> pd.DataFrame:
+    import pandas as pd
+
+    conn = connect()
+    migrate_user_csv(conn, kind, username)
+    cols = TABLES[kind]
+    cur = conn.execute(
+        f"SELECT {', '.join(cols)} FROM {kind} WHERE username = ? ORDER BY id", (username,)
+    )
+    return pd.DataFrame(cur.fetchall(), columns=cols)
+
+
+def load_window(kind: str, username: str, start: str = None, end: str = None,
+                last_n: int = None, before: str = None) -> pd.DataFrame:
+    """Rows with start <= date <= end (and date < before), sorted by date.
+
+    With last_n only the newest last_n matching rows are read, straight off
+    the (username, date) index.
+    """
+    import pandas as pd
+
+    conn = connect()
+    migrate_user_csv(conn, kind, username)
+    cols = TABLES[kind]
+    where, params = ["username = ?"], [username]
+    for clause, value in (("date >= ?", start), ("date <= ?", end), ("date < ?", before)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    sql = f"SELECT {', '.join(cols)} FROM {kind} WHERE {' AND '.join(where)}"
+    if last_n is None:
+        cur = conn.execute(f"{sql} ORDER BY date, id", params)
+        return pd.DataFrame(cur.fetchall(), columns=cols)
+    cur = conn.execute(f"{sql} ORDER BY date DESC, id DESC LIMIT ?", (*params, int(last_n)))
+    return pd.DataFrame(cur.fetchall()[::-1], columns=cols)
+
+
+def count(kind: str, username: str) -> int:
+    conn = connect()
+    migrate_user_csv(conn, kind, username)
+    return conn.execute(f"SELECT COUNT(*) FROM {kind} WHERE username = ?", (username,)).fetchone()[0]
+
+
+# ------------- NOTES SEARCH -------------
+
+# Matches ranked and paged per search; older matches are reached with a date filter
+SEARCH_LIMIT = int(os.environ.get("SMART_DIET_SEARCH_LIMIT", "500"))
+
+def fts_query(text: str) -> str:
+    """FTS5 query matching every word and "quoted phrase" in text.
+
+    Each word or phrase is quoted so FTS5 operators and punctuation in user
+    input are taken literally; a trailing * keeps prefix matching (walk*).
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        term = phrase if phrase else word
+        prefix = not phrase and term.endswith("*")
+        term = term.rstrip("*").replace('"', '""').strip()
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return " ".join(terms)
+
+
+def search_notes(username: str, query: str = "", start: str = None, end: str = None,
+                 limit: int = 20, offset: int = 0) -> tuple:
+    """One page of a user's notes matching query, best match first.
+
+    Without a query, notes in the date range come newest first. Only the
+    SEARCH_LIMIT most recently saved matches are ranked and paged, so a
+    common word costs the same on a journal of any size. snippet is the
+    part of the note around the match, as plain text. Returns
+    (DataFrame of date, note, snippet, matches up to SEARCH_LIMIT).
+    """
+    import pandas as pd
+
+    conn = connect()
+    migrate_user_csv(conn, "notes", username)
+    where, params = ["n.username = ?"], [username]
+    for clause, value in (("n.date >= ?", start), ("n.date <= ?", end)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    columns = ["date", "note", "snippet"]
+
+    match = fts_query(query or "")
+    if not match:
+        sql_where = " AND ".join(where)
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM notes n WHERE {sql_where} LIMIT {SEARCH_LIMIT})",
+            params,
+        ).fetchone()[0]
+        cur = conn.execute(
+            f"SELECT date, note, note FROM notes n WHERE {sql_where} "
+            f"ORDER BY date DESC, id DESC LIMIT ? OFFSET ?",
+            (*params, int(limit), min(int(offset), SEARCH_LIMIT)),
+        )
+        return pd.DataFrame(cur.fetchall(), columns=columns), total
+
+    # CROSS JOIN pins the index as the outer loop; otherwise the planner may
+    # walk the user's notes and run one full-text lookup per note
+    source = "notes_fts CROSS JOIN notes n ON n.id = notes_fts.rowid"
+    where.insert(0, "notes_fts MATCH ?")
+    params.insert(0, match)
+    sql_where = " AND ".join(where)
+    total, oldest = conn.execute(
+        f"SELECT COUNT(*), MIN(id) FROM (SELECT notes_fts.rowid AS id FROM {source} "
+        f"WHERE {sql_where} ORDER BY notes_fts.rowid DESC LIMIT {SEARCH_LIMIT})",
+        params,
+    ).fetchone()
+    if not total:
+        return pd.DataFrame(columns=columns), 0
+    # No highlight markers: snippets are shown as plain text in a table
+    cur = conn.execute(
+        f"SELECT n.date, n.note, snippet(notes_fts, 0, '', '', '…', 16) FROM {source} "
+        f"WHERE {sql_where} AND notes_fts.rowid >= ? "
+        f"ORDER BY bm25(notes_fts), n.date DESC LIMIT ? OFFSET ?",
+        (*params, oldest, int(limit), int(offset)),
+    )
+    return pd.DataFrame(cur.fetchall(), columns=columns), total
@@ -1,6 +1,13 @@
+from __future__ import annotations
+
 import os
 from datetime import datetime
-import pandas as pd
+from typing import TYPE_CHECKING
+from cache import cached
+from metrics import timed
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 DATA_DIR = "data"
 
@@ -18,15 +25,17 @@ def calculate_bmr(gender: str, weight_kg: float, height_cm: float, age: int) ->
         return 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
 
 
+ACTIVITY_MULTIPLIERS = {
+    "Sedentary (little or no exercise)": 1.2,
+    "Light (1-3 days/week)": 1.375,
+    "Moderate (3-5 days/week)": 1.55,
+    "Active (6-7 days/week)": 1.725,
+    "Very active (hard exercise & physical job)": 1.9,
+}
+
+
 def activity_multiplier(level: str) -> float:
-    mapping = {
-        "Sedentary (little or no exercise)": 1.2,
-        "Light (1-3 days/week)": 1.375,
-        "Moderate (3-5 days/week)": 1.55,
-        "Active (6-7 days/week)": 1.725,
-        "Very active (hard exercise & physical job)": 1.9,
-    }
-    return mapping.get(level, 1.2)
+    return ACTIVITY_MULTIPLIERS.get(level, 1.2)
 
 
 def calorie_target(tdee: float, goal: str) -> float:
@@ -70,11 +79,31 @@ def bmi_and_category(weight_kg: float, height_cm: float):
     return round(bmi, 1), cat
 
 
+@cached("daily_targets")
+def daily_targets(gender: str, weight_kg: float, height_cm: float, age: int,
+                  activity_level: str, goal: str) -> dict:
+    bmi, bmi_cat = bmi_and_category(weight_kg, height_cm)
+    bmr = calculate_bmr(gender, weight_kg, height_cm, age)
+    tdee = bmr * activity_multiplier(activity_level)
+    target_cal = calorie_target(tdee, goal)
+    return {
+        "bmi": bmi,
+        "bmi_category": bmi_cat,
+        "bmr": bmr,
+        "tdee": tdee,
+        "target_cal": target_cal,
+        "macros": macro_targets(weight_kg, target_cal),
+    }
+
+
 def today_str() -> str:
     return datetime.now().strftime("%Y-%m-%d")
 
 
+@timed
 def load_csv(path: str, default_columns=None) -> pd.DataFrame:
+    import pandas as pd
+
     ensure_data_dir()
     if not os.path.exists(path):
         if default_columns: